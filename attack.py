@@ -1,117 +1,153 @@
 """Parse probe reports and attack most lucrative targets, or export to CSV."""
 import argparse
-import collections
 import csv
+import functools
 import logging
 import math
-import time
+import sys
 
+from selenium.common.exceptions import NoSuchElementException
 from selenium.common.exceptions import StaleElementReferenceException
 from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
 
 import common
+import daemon_client
+import dispatch
+import fleet_inventory
+import geometry
+import html_lib
+import http_lib
+import metrics
+import planner
+import report_export
+import report_parser
+import report_store
 import selenium_lib as sln
+from report_parser import Coords
+from report_parser import PlanetInfo
 
-Coords = collections.namedtuple('Coords', ['galaxy', 'system', 'position'])
 
-PlanetInfo = collections.namedtuple(
-    'PlanetInfo', ['metal', 'crystal', 'deuterium', 'fleet_pts', 'defense_pts'])
+def gather_reports(b, args, store=None, writer=None):
+  """Gather probe reports.
 
+  Args:
+    b: Browser.
+    args: Command-line args.
+    store: If present, `report_store.ReportStore`. New reports are added to it,
+      paging stops at the first report it already has, and the latest reports
+      in the store are returned.
+    writer: If present, writer of `report_export`. New reports are written to
+      it as they are parsed, and flushed after each page.
 
-def gather_reports(b, args):
-  """Gather probe reports."""
+  Returns:
+    List of (`Coords`, `PlanetInfo`) sorted by `args.sort_by`.
+  """
   logging.info('Gathering reports...')
   sln.find(b, By.CLASS_NAME, 'messages').click()
 
   reports = {}
   num_reports = 0
   last_data_msg_id = None  # to know when next page is ready
-  while num_reports < args.max_reports:
+  reached_store = False
+  while num_reports < args.max_reports and not reached_store:
 
     # Wait for page to be ready.
-    page_ready = False
-    while not page_ready:
-      logging.info('Waiting for page to be ready')
-      time.sleep(0.5)
-      try:
-        top_msg_id = sln.finds(b, By.CLASS_NAME, 'msg', timeout=5)[
-            0].get_attribute('data-msg-id')
-      except StaleElementReferenceException:
-        continue
-      except TimeoutException:
-        # Most likely indicates there are no probe reports.
-        logging.warn('Cannot find messages, returning empty list')
-        return []
-      page_ready = last_data_msg_id is None or last_data_msg_id != top_msg_id
+    with metrics.phase('report_paging'):
+      top_msg_id = wait_for_messages_page(b, last_data_msg_id)
+      if top_msg_id is None and last_data_msg_id is not None:
+        logging.warn('Next page of messages did not show up, trying again')
+        go_to_next_page(b)
+        top_msg_id = wait_for_messages_page(b, last_data_msg_id)
+      source = b.page_source if top_msg_id is not None else None
+    if top_msg_id is None:
+      if last_data_msg_id is not None:
+        raise TimeoutException(
+            'Next page of messages did not show up after {} reports'.format(
+                num_reports))
+      # Most likely indicates there are no probe reports.
+      logging.warn('Cannot find messages')
+      break
     last_data_msg_id = top_msg_id
 
-    # Iterate over messages.
-    for msg in sln.finds(b, By.CLASS_NAME, 'msg'):
-
-      # Parse resources.
-      resspans = sln.finds(msg, By.CLASS_NAME, 'resspan',
-                           timeout=1, timeout_ok=True)
-      if len(resspans) != 3:
-        logging.warn('Skipping message: could not parse resources')
-        continue
-      metal = parse_number(resspans[0].text.split(' ')[1])
-      crystal = parse_number(resspans[1].text.split(' ')[1])
-      deuterium = parse_number(resspans[2].text.split(' ')[1])
-
-      # Parse fleet info.
-      fleet_info = sln.finds(msg, By.CLASS_NAME, 'compacting')[-1]
-      counts = sln.finds(fleet_info, By.CLASS_NAME, 'ctn')
-      if len(counts) != 2:
-        logging.warn('Skipping message: could not parse fleet info')
-        continue
-      fleet_pts = parse_number(counts[0].text.split(' ')[1])
-      defense_pts = parse_number(counts[1].text.split(' ')[1])
-
-      # Parse target coords from the message title.
-      title = sln.find(msg, By.CLASS_NAME, 'msg_title')
-      links = sln.finds(title, By.TAG_NAME, 'a')
-      if len(links) != 1:
-        logging.warn('Skipping message: could not parse message title')
-        continue
-      # Text is of the form "<planet name> [galaxy:system:position]"
-      coords = list(map(int, links[0].text.split(' ')[-1][1:-1].split(':')))
-      if len(coords) != 3:
-        logging.warn('Skipping message: could not parse coords')
-        continue
-
-      # Add report to the dict.
-      key = Coords(coords[0], coords[1], coords[2])
-      value = PlanetInfo(
-          metal, crystal, deuterium, fleet_pts, defense_pts)
-      reports[key] = value
+    # Parse the whole page off the browser.
+    page = html_lib.parse(source)
+    new_reports = []
+    for report in report_parser.parse_messages(page):
+      if store is not None and report.msg_id in store:
+        logging.info('Reached report #{} which is already in the store'.format(
+            report.msg_id))
+        reached_store = True
+        break
+      new_reports.append(report)
+      if writer is not None:
+        writer.write(report)
+      reports[report.coords] = report.planet_info
       num_reports += 1
-      logging.info('Report #{}: {}: {}'.format(num_reports, key, value))
+      logging.info('Report #{}: {}: {}'.format(
+          num_reports, report.coords, report.planet_info))
       if num_reports >= args.max_reports:
         break
+    if store is not None:
+      store.add(new_reports)
+    if writer is not None:
+      writer.flush()
 
-    if num_reports < args.max_reports:
+    if num_reports < args.max_reports and not reached_store:
       # Not done, go to next page.
-      lis = sln.finds(sln.find(b, By.CLASS_NAME, 'pagination'),
-                      By.TAG_NAME, 'li')
-      if len(lis) != 5:
+      pagination = report_parser.parse_pagination(page)
+      if not pagination:
         logging.warn('Could not find five elements, returning')
         break
-      cur_page, total_pages = lis[2].text.split('/')
+      cur_page, total_pages = pagination
       if cur_page == total_pages:
         logging.info('Reached last page')
         break
-      lis[3].click()
+      go_to_next_page(b)
+
+  if store is not None:
+    reports = store.latest(args.max_reports)
+  return sort_reports(reports, args.sort_by)
+
+
+def go_to_next_page(b):
+  """Click the next page button of the messages."""
+  sln.finds(sln.find(b, By.CLASS_NAME, 'pagination'),
+            By.TAG_NAME, 'li')[3].click()
+
+
+def wait_for_messages_page(b, last_data_msg_id):
+  """Wait for a page of messages other than `last_data_msg_id`'s.
+
+  Returns:
+    ID of the top message, or None if no new page showed up within 5s.
+  """
+
+  def top_msg_id(b):
+    try:
+      msg_id = b.find_element_by_class_name('msg').get_attribute('data-msg-id')
+    except (NoSuchElementException, StaleElementReferenceException):
+      return None
+    return msg_id if msg_id != last_data_msg_id else None
+
+  logging.info('Waiting for page to be ready')
+  try:
+    return sln.wait_for(b, top_msg_id, timeout=5)
+  except TimeoutException:
+    return None
+
+
+def sort_reports(reports, sort_by):
+  """Sort a dict of `Coords` -> `PlanetInfo` by decreasing `sort_by`."""
 
   def score(x):
-    if args.sort_by == 'total':
+    if sort_by == 'total':
       return x.metal + x.crystal + x.deuterium
-    if args.sort_by == 'metal':
+    if sort_by == 'metal':
       return x.metal
-    if args.sort_by == 'crystal':
+    if sort_by == 'crystal':
       return x.crystal
-    if args.sort_by == 'deuterium':
+    if sort_by == 'deuterium':
       return x.deuterium
 
   return sorted(
@@ -131,158 +167,66 @@ def export(b, reports, args):
 
 def attack(b, reports, args):
   """Attack most lucrative undefended targets."""
-  max_attacks = min(args.num_attacks, len(reports))
-
-  # Count fleet.
-  fleet = count_large_cargos(b)
+  # Count fleet of all planets at once.
+  inventory = fleet_inventory.from_browser(b)
+
+  # Plan which planet raids which target.
+  raids = planner.plan(reports, inventory.origins(), args.num_attacks, args)
+  logging.info('Planned {} raids'.format(len(raids)))
+
+  # Launch attacks, all raids of a planet at once.
+  send = functools.partial(dispatch.send_in_browser, b)
+  if args.dispatch == 'http':
+    session = http_lib.session_from_browser(b)
+    send = functools.partial(dispatch.send_http, session, http_lib.game_url(b))
+  sent = []
+  for planet_num, group in dispatch.by_origin(raids):
+    logging.info('Sending {} raids from planet #{}'.format(
+        len(group), planet_num))
+    with metrics.phase('fleet_dispatch'):
+      results = send(inventory.planet_ids[planet_num], group)
+    for raid, ok in zip(group, results):
+      if not ok:
+        logging.warn('Could not send raid on {}'.format(raid.coords))
+        continue
+      inventory.dispatched(planet_num, raid.ships)
+      sent.append(raid)
 
-  # Iterate over sorted reports and launch attacks.
-  num_targets = 0
+  # Count resources plundered.
+  reports = dict(reports)
   total_metal = 0
   total_crystal = 0
   total_deuterium = 0
   total = 0
-  planet_num = 0
-  for coords, planet_info in reports:
-
-    # Check if we're done.
-    if num_targets >= max_attacks:
-      logging.info('Launched {} attacks'.format(num_targets))
-      break
-
-    # Skip planets with defense.
-    if planet_info.fleet_pts > 0 or planet_info.defense_pts > 0:
-      logging.info('Skipping planet with defense')
-      continue
-
-    # Count number of cargos needed.
+  for raid in sent:
+    coords, planet_info = raid.coords, reports[raid.coords]
     resources = (
         planet_info.metal + planet_info.crystal + planet_info.deuterium)
-    num_cargos = int(math.ceil(resources / 50000))
-    logging.info('Need to send {} cargos'.format(num_cargos))
-
-    # Find planet with largest fleet.
-    planet_num, cargos = max(fleet.items(), key=lambda x: x[1])
-    if not cargos:
-      logging.info('Used all cargos available')
-      break
-    logging.info(
-        'Using planet #{} which has the largest fleet ({} cargos)'.format(
-            planet_num, cargos))
-    num_cargos = min(num_cargos, cargos)
-    logging.info('Will send {} cargs'.format(num_cargos))
 
     # Count resources accrued so far.
-    plundered = min(resources, 25000 * cargos)
-    ratio = float(plundered) / resources
+    ratio = float(raid.plunder) / resources
     total_metal += int(math.floor(planet_info.metal * ratio))
     total_crystal += int(math.floor(planet_info.crystal * ratio))
     total_deuterium += int(math.floor(planet_info.deuterium * ratio))
-    total += plundered
+    total += raid.plunder
 
-    # Launch attack.
     logging.info('[{}:{}:{}]: {:,} (M: {:,}, C: {:,}, D: {:,}) '
-                 '-> {} large cargos'.format(
+                 '-> {} large cargos, {} small cargos from planet #{} '
+                 '({:.0f}s away)'.format(
                      coords.galaxy, coords.system, coords.position, resources,
                      planet_info.metal, planet_info.crystal,
-                     planet_info.deuterium, num_cargos))
-    attack_target(b, coords, planet_num, num_cargos)
-    fleet[planet_num] -= num_cargos
-    num_targets += 1
+                     planet_info.deuterium,
+                     raid.ships.get(geometry.LARGE_CARGO, 0),
+                     raid.ships.get(geometry.SMALL_CARGO, 0),
+                     raid.planet_num, raid.flight_time))
 
+  logging.info('Launched {} of {} raids'.format(len(sent), len(raids)))
   logging.info('Total plundered: {:,} (M: {:,}, C: {:,}, D: {:,})'.format(
-      total / 2, total_metal / 2, total_crystal / 2, total_deuterium / 2))
+      total, total_metal, total_crystal, total_deuterium))
 
 
-def count_large_cargos(b):
-  """Gather number of large cargos in each planet."""
-
-  def find_planets():
-    return sln.finds(sln.find(b, By.ID, 'planetList'),
-                     By.CLASS_NAME, 'planetlink')
-
-  num_planets = len(find_planets())
-  logging.info('Found {} planets'.format(num_planets))
-
-  fleet = {}
-  for i in range(num_planets):
-    logging.info('Navigating to planet #{}'.format(i))
-
-    # Need to find the planets again since previous references are stale.
-    planets = find_planets()
-    planets[i].click()
-
-    # Navigate to fleet view (only needed for the first planet).
-    if i == 0:
-      logging.info('Navigating to fleet view')
-      sln.finds(sln.find(b, By.ID, 'links'),
-                By.CLASS_NAME, 'menubutton')[7].click()
-
-    try:
-      large_cargos = sln.find(sln.find(b, By.ID, 'button203', timeout=5),
-                              By.CLASS_NAME, 'level').text
-    except TimeoutException:
-      # Most likely indicates there is no fleet on this planet.
-      logging.warn('No fleet on this planet')
-      large_cargos = 0
-    logging.info('Planet {} has {} large cargos'.format(i, large_cargos))
-    fleet[i] = int(large_cargos)
-
-  return fleet
-
-
-def attack_target(b, coords, planet_num, num_cargos):
-  """Attack a planet at given `coords` from `planet_num` with `num_cargos`."""
-  # Navigate to planet.
-  planets = sln.finds(sln.find(b, By.ID,
-                               'planetList'), By.CLASS_NAME, 'planetlink')
-  planet = planets[planet_num]
-  logging.info('Navigating to planet {}'.format(planet_num))
-  planet.click()
-
-  # Navigate to fleet view.
-  logging.info('Navigating to fleet view')
-  sln.finds(sln.find(b, By.ID, 'links'),
-            By.CLASS_NAME, 'menubutton')[7].click()
-
-  # Set num cargos.
-  large_cargos = sln.find(sln.find(b, By.ID, 'button203'),
-                          By.CLASS_NAME, 'fleetValues')
-  large_cargos.send_keys(str(num_cargos))
-  sln.find(b, By.ID, 'continue').click()
-
-  # Set target coords.
-  galaxy = sln.find(b, By.ID, 'galaxy')
-  system = sln.find(b, By.ID, 'system')
-  position = sln.find(b, By.ID, 'position')
-  galaxy.clear()
-  galaxy.send_keys(str(coords.galaxy))
-  system.clear()
-  system.send_keys(str(coords.system))
-  position.clear()
-  position.send_keys(str(coords.position))
-  position.send_keys(Keys.RETURN)
-
-  # Launch attack.
-  sln.find(b, By.ID, 'missionButton1').click()
-  sln.find(b, By.ID, 'start').click()
-
-  # Wait for fleet view to be visible again.
-  sln.wait_until(b, By.ID, 'movements')
-  logging.info(
-      'Launched attack on [{}:{}:{}] with {} cargos from planet {}'.format(
-          coords.galaxy, coords.system, coords.position, num_cargos,
-          planet_num))
-
-
-def parse_number(f):
-  """Parse numbers like 123.456 or 1,234M."""
-  if f[-1] == 'M':
-    return int(float(f[:-1].replace(',', '.')) * 1e6)
-  return int(f.replace('.', ''))
-
-
-def main():
+def build_arg_parser():
+  """Return the parser of command-line args."""
   arg_parser = argparse.ArgumentParser()
 
   # Register common args.
@@ -296,26 +240,112 @@ def main():
       default='total', help='What to sort reports by')
 
   # Use --num_attacks or --csv to choose between actually attacking or
-  # exporting reports to CSV.
-  group = arg_parser.add_mutually_exclusive_group(required=True)
+  # exporting reports to CSV. With neither, reports are only gathered, e.g.
+  # for --export.
+  group = arg_parser.add_mutually_exclusive_group()
   group.add_argument('-n', '--num_attacks', type=int, help='Num of attacks')
   group.add_argument(
       '--csv', type=str,
       help='If present, will instead export reports into this CSV file')
 
-  args = arg_parser.parse_args()
-
-  common.setup_logging(args)
-  b = common.open_browser_and_connect(args)
+  # Args for streaming export.
+  arg_parser.add_argument(
+      '--export', type=str,
+      help='If present, also write each report to this file as it is parsed')
+  arg_parser.add_argument(
+      '--export_format', choices=report_export.FORMATS,
+      help='Format of --export; inferred from its extension if missing')
+  arg_parser.add_argument(
+      '--export_compression', type=str,
+      help='Compression of --export (gzip, bz2, xz, or for Parquet any codec '
+      'of pyarrow); inferred from its extension if missing')
+  arg_parser.add_argument('--export_append', type=bool, default=False,
+                          help='Append to --export instead of overwriting it')
+
+  # Args for universe structure.
+  arg_parser.add_argument('--num_galaxies', type=int, default=7)
+  arg_parser.add_argument('--num_systems', type=int, default=499)
+  arg_parser.add_argument('--fleet_speed', type=int, default=1,
+                          help='Fleet speed of the universe')
+
+  # Args for fleet dispatch.
+  arg_parser.add_argument(
+      '--dispatch', choices=['browser', 'http'], default='browser',
+      help='Send fleets from a script in the game tab, or over HTTP with the '
+      'session of the browser')
 
-  # Parse and sort reports.
-  reports = gather_reports(b, args)
+  # Args for the report store.
+  arg_parser.add_argument(
+      '--store', type=str,
+      help='If present, SQLite file storing reports across runs. Only new '
+      'reports are gathered')
+  arg_parser.add_argument(
+      '--from_store', type=bool, default=False,
+      help='Use reports in --store without gathering new ones. Exporting to '
+      'CSV then does not need a browser')
+
+  return arg_parser
+
+
+def run(b, args):
+  """Gather reports, then export them or attack.
+
+  Args:
+    b: Browser, on any page of the game. May be None with --from_store and
+      --csv.
+    args: Command-line args.
+  """
+  store = report_store.ReportStore(args.store) if args.store else None
+  try:
+    # Parse and sort reports.
+    if args.from_store:
+      reports = sort_reports(store.latest(args.max_reports), args.sort_by)
+    else:
+      writer = None
+      if args.export:
+        writer = report_export.open_writer(
+            args.export, args.export_format, args.export_append,
+            args.export_compression)
+      try:
+        reports = gather_reports(b, args, store, writer)
+      finally:
+        if writer is not None:
+          writer.close()
+  finally:
+    if store is not None:
+      store.close()
 
   if args.csv:
     export(b, reports, args)
-  else:
+  elif args.num_attacks is not None:
     attack(b, reports, args)
 
 
+def validate_args(arg_parser, args):
+  """Exit with a usage error if args do not go together."""
+  if args.from_store and not args.store:
+    arg_parser.error('--from_store requires --store')
+  if args.num_attacks is None and not args.csv and not args.export:
+    arg_parser.error('one of --num_attacks, --csv or --export is required')
+  if args.export and args.from_store:
+    arg_parser.error('--export only writes reports as they are gathered')
+
+
+def main():
+  arg_parser = build_arg_parser()
+  args = arg_parser.parse_args()
+  validate_args(arg_parser, args)
+  if args.browser_daemon:
+    sys.exit(daemon_client.submit(args.browser_daemon, 'attack',
+                                  sys.argv[1:]))
+
+  common.setup_logging(args)
+  common.setup_metrics(args)
+  b = None
+  if not (args.from_store and args.csv):
+    b = common.open_browser_and_connect(args)
+  run(b, args)
+
+
 if __name__ == '__main__':
   main()
@@ -1,16 +1,46 @@
-"""Send an email when attacked."""
+"""Send an email when attacked.
+
+Checks once by default. With --daemon, keeps the session open and polls the
+event list, alerting once per incoming hostile fleet.
+"""
 import argparse
+import collections
 import logging
+import random
+import sys
+import time
 
+from selenium.common.exceptions import WebDriverException
 from selenium.webdriver.common.by import By
 
 import common
+import daemon_client
 import email_lib
+import html_lib
+import http_lib
+import report_parser
 import selenium_lib as sln
 
+# A hostile fleet of the event list.
+HostileEvent = collections.namedtuple(
+    'HostileEvent', ['event_id', 'mission', 'arrival_time', 'origin',
+                     'destination'])
+
+
+class SessionExpired(Exception):
+  """The game session is no longer logged in."""
+
+
+def new_sender(args):
+  """Return an `email_lib.EmailSender` configured by command-line args."""
+  return email_lib.EmailSender(
+      args.smtp_host, args.smtp_port, args.smtp_user, args.smtp_password,
+      args.email_to, digest_delay=args.digest_delay,
+      min_interval=args.min_email_interval, plaintext=args.smtp_plaintext)
 
-def alert_if_attacked(b, args):
-  """Check if we're being attacked and send an email."""
+
+def alert_if_attacked(b, sender):
+  """Check if we're being attacked and queue an email."""
   alert_div = sln.find(b, By.ID, 'attack_alert')
 
   # The classes contain "noAttack" if there's no attack and "soon" if there is.
@@ -20,14 +50,170 @@ def alert_if_attacked(b, args):
     return
 
   # Send an alert email.
-  logging.info('Attack! Sending email to {}'.format(args.email_to))
+  logging.info('Attack! Sending email to {}'.format(sender.addr_to))
   subject = 'Attack alert'
   body = '{} is being attacked!'.format(sln.find(b, By.ID, 'playerName').text)
-  email_lib.send_email(args.smtp_host, args.smtp_port, args.smtp_user,
-                       args.smtp_password, args.email_to, subject, body)
+  sender.send(subject, body)
 
 
-def main():
+def parse_hostile_events(html):
+  """Parse incoming hostile fleets out of the event list.
+
+  Raises:
+    SessionExpired: if the page is not an event list, e.g. the login page.
+  """
+  doc = html_lib.parse(html) if isinstance(html, str) else html
+  if doc.find(id='eventContent') is None:
+    raise SessionExpired('Not an event list')
+  events = []
+  for row in doc.find_all('tr', class_='eventFleet'):
+    if row.find(class_='hostile') is None:
+      continue
+    origin = row.find(class_='coordsOrigin')
+    destination = row.find(class_='destCoords')
+    try:
+      arrival_time = float(row.get('data-arrival-time'))
+    except (TypeError, ValueError):
+      arrival_time = None
+    events.append(HostileEvent(
+        event_id=row.get('id', '').replace('eventRow-', ''),
+        mission=row.get('data-mission-type'),
+        arrival_time=arrival_time,
+        origin=report_parser.parse_coords(origin.text) if origin else None,
+        destination=report_parser.parse_coords(destination.text)
+        if destination else None))
+  return events
+
+
+def format_event(event):
+  """Return a line describing a hostile event."""
+  arrival = (time.strftime('%Y-%m-%d %H:%M:%S',
+                           time.localtime(event.arrival_time))
+             if event.arrival_time else 'unknown time')
+  return 'Fleet from {} on {} (mission {}), arriving at {}'.format(
+      _coords(event.origin), _coords(event.destination), event.mission,
+      arrival)
+
+
+def _coords(coords):
+  return '[{}:{}:{}]'.format(*coords) if coords else '[?]'
+
+
+class Poller(object):
+  """Poll the event list over HTTP and alert once per hostile fleet."""
+
+  def __init__(self, args, sender):
+    self.args = args
+    self.sender = sender
+    self.b = None
+    self.session = None
+    self.url = None
+    self.alerted = set()  # IDs of events already alerted
+
+  def connect(self):
+    """(Re)open the browser and copy its session."""
+    self.close()
+    self.b = common.open_browser_and_connect(self.args)
+    self.session = http_lib.session_from_browser(self.b)
+    self.url = http_lib.game_url(self.b)
+
+  def close(self):
+    if self.b is not None:
+      try:
+        self.b.quit()
+      except WebDriverException:
+        pass
+      self.b = None
+
+  def browser_memory_mb(self):
+    """JS heap used by the game tab, in MB, or 0 if unknown."""
+    try:
+      used = self.b.execute_script(
+          'return performance.memory ? performance.memory.usedJSHeapSize : 0;')
+    except WebDriverException:
+      return 0
+    return (used or 0) / 2.**20
+
+  def poll(self):
+    """Check the event list once and alert about new hostile fleets."""
+    response = self.session.get(
+        self.url, params={'page': 'eventList', 'ajax': 1}, timeout=10)
+    if response.status_code in (401, 403) or (
+        http_lib.base_url(response.url) != self.url):
+      raise SessionExpired('Redirected to {}'.format(response.url))
+    response.raise_for_status()
+    events = parse_hostile_events(response.text)
+
+    new_events = [e for e in events if e.event_id not in self.alerted]
+    # Forget fleets that have arrived or were recalled.
+    self.alerted &= {e.event_id for e in events}
+    if not new_events:
+      logging.info('No new attack ({} ongoing)'.format(len(events)))
+      return
+    logging.info('{} new attacks! Sending email to {}'.format(
+        len(new_events), self.sender.addr_to))
+    body = '{} new hostile fleets:\n\n{}\n'.format(
+        len(new_events), '\n'.join(format_event(e) for e in new_events))
+    self.sender.send('Attack alert', body)
+    self.alerted.update(e.event_id for e in new_events)
+
+  def try_connect(self):
+    """Call `connect`, returning False instead of raising if login fails."""
+    try:
+      self.connect()
+    except (IOError, WebDriverException) as e:
+      logging.warn('Could not log in: {}'.format(e))
+      self.close()
+      self.session = None
+      return False
+    return True
+
+  def run(self):
+    """Poll until interrupted."""
+    args = self.args
+    interval = args.poll_interval
+    try:
+      while True:
+        failed = self.session is None and not self.try_connect()
+        if not failed:
+          try:
+            self.poll()
+          except SessionExpired as e:
+            logging.warn('Session expired ({}), logging in again'.format(e))
+            failed = not self.try_connect()
+          except IOError as e:
+            logging.warn('Could not poll event list: {}'.format(e))
+            failed = True
+
+        if not failed and args.max_browser_mb:
+          memory = self.browser_memory_mb()
+          if memory > args.max_browser_mb:
+            logging.info('Browser uses {:.0f}MB, restarting it'.format(memory))
+            failed = not self.try_connect()
+
+        if failed:
+          # Network, server or login errors: back off exponentially.
+          interval = min(2 * interval, args.max_poll_interval)
+          logging.warn('Retrying in {:.0f}s'.format(interval))
+        else:
+          interval = args.poll_interval
+        # Jitter so that polls do not look periodic.
+        time.sleep(interval * random.uniform(0.8, 1.2))
+    finally:
+      self.close()
+
+
+def run(b, args):
+  """Check once if we're being attacked, with the browser `b`."""
+  sender = new_sender(args)
+  try:
+    alert_if_attacked(b, sender)
+  finally:
+    sender.close()
+
+
+def build_arg_parser():
+  """Return the parser of command-line args."""
   arg_parser = argparse.ArgumentParser()
 
   # Register common args.
@@ -38,14 +224,54 @@ def main():
   arg_parser.add_argument('--smtp_port', type=int, required=True)
   arg_parser.add_argument('--smtp_user', type=str, required=True)
   arg_parser.add_argument('--smtp_password', type=str, required=True)
+  arg_parser.add_argument(
+      '--smtp_plaintext', type=bool, default=False,
+      help='Allow servers without STARTTLS, e.g. the SMTP server of '
+      'mock_server.py; the password is then sent in clear')
   arg_parser.add_argument('--email_to', type=str, required=True)
+  arg_parser.add_argument(
+      '--digest_delay', type=float, default=10,
+      help='Seconds to wait for more alerts to send them in a single email')
+  arg_parser.add_argument('--min_email_interval', type=float, default=60,
+                          help='Min seconds between emails')
+
+  # Daemon args.
+  arg_parser.add_argument(
+      '--daemon', type=bool, default=False,
+      help='Keep running and poll the event list, instead of checking once')
+  arg_parser.add_argument('--poll_interval', type=float, default=20,
+                          help='Seconds between polls, with +/- 20%% jitter')
+  arg_parser.add_argument('--max_poll_interval', type=float, default=300,
+                          help='Max seconds between polls when backing off '
+                          'after errors')
+  arg_parser.add_argument(
+      '--max_browser_mb', type=float, default=500,
+      help='Restart the browser when the game tab uses more memory (0 to '
+      'never restart)')
 
+  return arg_parser
+
+
+def main():
+  arg_parser = build_arg_parser()
   args = arg_parser.parse_args()
+  if args.browser_daemon:
+    if args.daemon:
+      arg_parser.error('--daemon keeps its own browser; drop --browser_daemon')
+    sys.exit(daemon_client.submit(args.browser_daemon, 'attack_alert',
+                                  sys.argv[1:]))
 
   common.setup_logging(args)
-  b = common.open_browser_and_connect(args)
-
-  alert_if_attacked(b, args)
+  common.setup_metrics(args)
+  sender = new_sender(args)
+  try:
+    if args.daemon:
+      Poller(args, sender).run()
+    else:
+      b = common.open_browser_and_connect(args)
+      alert_if_attacked(b, sender)
+  finally:
+    sender.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,116 @@
+"""Tests of the event list polling of attack_alert.py."""
+import unittest
+from unittest import mock
+
+from selenium.common.exceptions import TimeoutException
+
+import attack_alert
+from attack_alert import HostileEvent
+from report_parser import Coords
+
+_URL = 'http://game.test/game/index.php'
+
+
+def _event_list(*hostile_ids):
+  """Return an event list with our own fleet and hostile ones."""
+  rows = [
+      '<tr class="eventFleet" id="eventRow-7" data-mission-type="6" '
+      'data-return-flight="false" data-arrival-time="1539780000">'
+      '<td class="countDown"><span class="friendly">30s</span></td>'
+      '<td class="coordsOrigin">[1:100:8]</td>'
+      '<td class="destCoords">[1:101:4]</td></tr>']
+  for event_id in hostile_ids:
+    rows.append(
+        '<tr class="eventFleet" id="eventRow-{}" data-mission-type="1" '
+        'data-return-flight="false" data-arrival-time="1539780600">'
+        '<td class="countDown"><span class="hostile">600s</span></td>'
+        '<td class="coordsOrigin">[2:7:8]</td>'
+        '<td class="destCoords">[1:100:8]</td></tr>'.format(event_id))
+  return '<table id="eventContent"><tbody>{}</tbody></table>'.format(
+      ''.join(rows))
+
+
+def _args(**kwargs):
+  argv = ['-c=test', '-u=a@b.c', '-p=pwd', '--smtp_host=localhost',
+          '--smtp_port=587', '--smtp_user=me', '--smtp_password=pwd',
+          '--email_to=you', '--daemon=true']
+  argv += ['--{}={}'.format(k, v) for k, v in kwargs.items()]
+  return attack_alert.build_arg_parser().parse_args(argv)
+
+
+class ParseHostileEventsTest(unittest.TestCase):
+
+  def test_parse_hostile_events(self):
+    self.assertEqual(attack_alert.parse_hostile_events(_event_list('42')), [
+        HostileEvent(event_id='42', mission='1', arrival_time=1539780600.0,
+                     origin=Coords(2, 7, 8), destination=Coords(1, 100, 8))])
+    self.assertEqual(attack_alert.parse_hostile_events(_event_list()), [])
+
+  def test_login_page(self):
+    with self.assertRaises(attack_alert.SessionExpired):
+      attack_alert.parse_hostile_events('<form id="loginForm"></form>')
+
+
+class PollerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.sender = mock.Mock(addr_to='you')
+    self.poller = attack_alert.Poller(_args(), self.sender)
+    self.poller.session = mock.Mock()
+    self.poller.url = _URL
+
+  def poll(self, *hostile_ids):
+    self.poller.session.get.return_value = mock.Mock(
+        status_code=200, url=_URL + '?page=eventList',
+        text=_event_list(*hostile_ids))
+    self.poller.poll()
+
+  def test_alerts_once_per_event(self):
+    self.poll('42')
+    self.poll('42')
+    self.poll('42', '43')
+    self.assertEqual(self.sender.send.call_count, 2)
+    self.assertIn('1 new hostile fleets', self.sender.send.call_args[0][1])
+
+    # Recalled fleets are forgotten, so their IDs alert again if reused.
+    self.poll()
+    self.poll('42')
+    self.assertEqual(self.sender.send.call_count, 3)
+
+  def test_expired_session(self):
+    self.poller.session.get.return_value = mock.Mock(
+        status_code=200, url='http://www.game.test/')
+    with self.assertRaises(attack_alert.SessionExpired):
+      self.poller.poll()
+
+
+class RunTest(unittest.TestCase):
+
+  def test_backs_off_when_login_fails(self):
+    poller = attack_alert.Poller(
+        _args(poll_interval=10, max_poll_interval=35), mock.Mock())
+    sleeps = []
+
+    def sleep(seconds):
+      if len(sleeps) == 5:
+        raise KeyboardInterrupt
+      sleeps.append(seconds)
+
+    def connect():
+      if len(sleeps) < 3:
+        raise TimeoutException('login page did not load')
+      poller.session = mock.Mock()
+
+    with mock.patch.object(poller, 'connect', side_effect=connect), \
+         mock.patch.object(poller, 'poll') as poll, \
+         mock.patch.object(poller, 'browser_memory_mb', return_value=0), \
+         mock.patch('random.uniform', return_value=1), \
+         mock.patch('time.sleep', side_effect=sleep):
+      with self.assertRaises(KeyboardInterrupt):
+        poller.run()
+    self.assertEqual(sleeps, [20, 35, 35, 10, 10])
+    self.assertEqual(poll.call_count, 3)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,96 @@
+"""Tests of attack.py, with a stand-in browser."""
+import unittest
+from unittest import mock
+
+from selenium.common.exceptions import TimeoutException
+
+import attack
+import fleet_inventory
+import mock_server
+import planner
+import report_store
+import selenium_lib as sln
+from report_parser import Coords
+from report_parser import PlanetInfo
+
+
+class FakeBrowser(object):
+  """Answers in-page scripts as if every fleet was sent."""
+
+  current_url = 'http://game.test/game/index.php?page=messages'
+
+  def __init__(self):
+    self.scripts = []
+
+  def set_script_timeout(self, timeout):
+    pass
+
+  def execute_async_script(self, script, *args):
+    self.scripts.append(args)
+    url, planet_id, fleets, mission = args
+    return [True] * len(fleets)
+
+
+class AttackTest(unittest.TestCase):
+
+  def setUp(self):
+    self.args = attack.build_arg_parser().parse_args([
+        '-c=test', '-u=a@b.c', '-p=pwd', '--max_reports=10',
+        '--num_attacks=2'])
+    self.inventory = fleet_inventory.FleetInventory(
+        {0: planner.Origin(Coords(1, 100, 8), {202: 10, 203: 10})},
+        {0: '33620000'})
+    self.reports = [
+        (Coords(1, 101, 4), PlanetInfo(100000, 50000, 0, 0, 0)),
+        (Coords(1, 102, 5), PlanetInfo(80000, 0, 0, 0, 0)),
+        (Coords(1, 103, 6), PlanetInfo(90000, 0, 0, 0, 10)),  # defended
+    ]
+
+  def test_default_dispatch_sends_from_the_browser(self):
+    b = FakeBrowser()
+    with mock.patch.object(fleet_inventory, 'from_browser',
+                           return_value=self.inventory):
+      attack.attack(b, self.reports, self.args)
+
+    self.assertEqual(len(b.scripts), 1)
+    url, planet_id, fleets, mission = b.scripts[0]
+    self.assertEqual(url, 'http://game.test/game/index.php')
+    self.assertEqual(planet_id, '33620000')
+    self.assertEqual(sorted((f['system'], f['position']) for f in fleets),
+                     [(101, 4), (102, 5)])
+    self.assertEqual(mission, 1)
+
+
+class GatherReportsTest(unittest.TestCase):
+
+  def test_fails_when_next_page_does_not_show_up(self):
+    universe = mock_server.Universe(num_players=10, num_reports=15)
+    b = mock.Mock(page_source=mock_server.messages_html(universe, 1))
+    args = attack.build_arg_parser().parse_args([
+        '-c=test', '-u=a@b.c', '-p=pwd', '--max_reports=15', '--csv=x.csv'])
+    with mock.patch.object(sln, 'find'), \
+         mock.patch.object(attack, 'go_to_next_page') as go_to_next_page, \
+         mock.patch.object(attack, 'wait_for_messages_page',
+                           side_effect=['15', None, None]):
+      with self.assertRaises(TimeoutException):
+        attack.gather_reports(b, args)
+    # Once to the second page, then once more when it did not show up.
+    self.assertEqual(go_to_next_page.call_count, 2)
+
+
+class RunTest(unittest.TestCase):
+
+  def test_closes_store_on_errors(self):
+    args = attack.build_arg_parser().parse_args([
+        '-c=test', '-u=a@b.c', '-p=pwd', '--max_reports=15', '--csv=x.csv',
+        '--store=reports.db'])
+    with mock.patch.object(report_store, 'ReportStore') as store, \
+         mock.patch.object(attack, 'gather_reports',
+                           side_effect=IOError('disk')):
+      with self.assertRaises(IOError):
+        attack.run(mock.Mock(), args)
+    store.return_value.close.assert_called_once_with()
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,201 @@
+"""Benchmark scan and attack end-to-end against the mock server.
+
+Reports wall time, WebDriver commands and time of each phase, page load times
+and browser memory, e.g.:
+
+  python3 benchmark.py --num_players=10000 --max_scans=20 --json=bench.json
+
+With --compare_lean, runs twice, without and with --lean browsers.
+
+Requires a Chrome driver, like the bot itself.
+"""
+import argparse
+import collections
+import json
+import logging
+import time
+
+from selenium.webdriver.remote.webdriver import WebDriver
+
+import attack
+import common
+import http_lib
+import mock_server
+import scan
+import selenium_lib as sln
+
+
+class CommandCounter(object):
+  """Count WebDriver commands and their time, by command name."""
+
+  def __init__(self):
+    self.counts = collections.Counter()
+    self.times = collections.Counter()
+    self._execute = None
+
+  def install(self):
+    """Start counting commands of all browsers."""
+    self._execute = execute = WebDriver.execute
+    counter = self
+
+    def counting_execute(driver, command, params=None):
+      start = time.time()
+      try:
+        return execute(driver, command, params)
+      finally:
+        counter.counts[command] += 1
+        counter.times[command] += time.time() - start
+
+    WebDriver.execute = counting_execute
+
+  def uninstall(self):
+    WebDriver.execute = self._execute
+
+  def total(self):
+    return sum(self.counts.values())
+
+
+class Phases(object):
+  """Time named phases and the WebDriver commands they issue."""
+
+  def __init__(self, counter):
+    self.counter = counter
+    self.results = collections.OrderedDict()
+
+  def run(self, name, fn, *args):
+    logging.info('Running phase {}'.format(name))
+    num_commands = self.counter.total()
+    start = time.time()
+    result = fn(*args)
+    self.results[name] = {
+        'seconds': time.time() - start,
+        'commands': self.counter.total() - num_commands,
+    }
+    return result
+
+
+def measure_page_loads(b, num_loads):
+  """Load pages of the game and return their mean load time in seconds."""
+  url = http_lib.game_url(b)
+  times = []
+  for _ in range(num_loads):
+    for page in ('overview', 'galaxy', 'messages'):
+      start = time.time()
+      b.get('{}?page={}'.format(url, page))
+      times.append(time.time() - start)
+  return sum(times) / len(times) if times else None
+
+
+def run(args, lean=False):
+  """Run all phases against a fresh mock server and return the results."""
+  universe = mock_server.Universe(
+      args.seed, num_players=args.num_players, num_reports=args.num_reports,
+      flight_time=args.flight_time)
+  server = mock_server.serve(universe, asset_latency=args.asset_latency)
+  common_flags = [
+      '--tld=mock', '--email=bench@example.com', '--password=bench',
+      '--server_url=' + mock_server.server_url(server)]
+  if args.headless:
+    common_flags.append('--headless=true')
+  if lean:
+    common_flags.append('--lean=true')
+  scan_args = scan.build_arg_parser().parse_args(common_flags + [
+      '--rank_min=1', '--rank_max={}'.format(args.num_players),
+      '--parallelism={}'.format(args.parallelism),
+      '--max_scans={}'.format(args.max_scans),
+      '--backend={}'.format(args.backend),
+      '--probe_round_trip={}'.format(2 * args.flight_time)])
+  attack_args = attack.build_arg_parser().parse_args(common_flags + [
+      '--max_reports={}'.format(args.max_reports),
+      '--num_attacks={}'.format(args.num_attacks),
+      '--dispatch={}'.format(args.dispatch)])
+
+  counter = CommandCounter()
+  counter.install()
+  phases = Phases(counter)
+  start = time.time()
+  b = None
+  try:
+    b = phases.run('login', common.open_browser_and_connect, scan_args)
+    page_load = phases.run('page_loads', measure_page_loads, b,
+                           args.num_page_loads)
+    phases.run('scan', scan.scan, b, scan_args)
+    reports = phases.run('gather_reports', attack.gather_reports, b,
+                         attack_args)
+    phases.run('attack', attack.attack, b, reports, attack_args)
+    memory = sln.browser_memory_mb(b)
+  finally:
+    counter.uninstall()
+    if b is not None:
+      b.quit()
+    server.shutdown()
+
+  return collections.OrderedDict([
+      ('lean', lean),
+      ('wall_seconds', time.time() - start),
+      ('commands', counter.total()),
+      ('page_load_seconds', page_load),
+      ('memory', memory),
+      ('phases', phases.results),
+      ('commands_by_name', dict(counter.counts.most_common())),
+      ('command_seconds_by_name', dict(counter.times.most_common())),
+  ])
+
+
+def main():
+  arg_parser = argparse.ArgumentParser()
+  arg_parser.add_argument('--seed', type=int, default=0)
+  arg_parser.add_argument('--num_players', type=int, default=10000)
+  arg_parser.add_argument('--num_reports', type=int, default=50)
+  arg_parser.add_argument('--flight_time', type=float, default=5)
+  arg_parser.add_argument('--max_scans', type=int, default=20)
+  arg_parser.add_argument('--parallelism', type=int, default=10)
+  arg_parser.add_argument('--backend', choices=['browser', 'http'],
+                          default='browser')
+  arg_parser.add_argument('--max_reports', type=int, default=50)
+  arg_parser.add_argument('--num_attacks', type=int, default=5)
+  arg_parser.add_argument('--dispatch', choices=['browser', 'http'],
+                          default='browser')
+  arg_parser.add_argument('--headless', type=bool, default=True)
+  arg_parser.add_argument('--lean', type=bool, default=False,
+                          help='Use lean browsers (see common.py)')
+  arg_parser.add_argument('--compare_lean', type=bool, default=False,
+                          help='Run without then with lean browsers')
+  arg_parser.add_argument('--num_page_loads', type=int, default=5,
+                          help='Num loads of each page to time')
+  arg_parser.add_argument('--asset_latency', type=float, default=0.05,
+                          help='Seconds to serve each image, font or ad')
+  arg_parser.add_argument('--json', type=str,
+                          help='If present, also write results to this file')
+  arg_parser.add_argument('-v', '--verbose', type=bool,
+                          default=False, help='Verbose output')
+  args = arg_parser.parse_args()
+
+  common.setup_logging(args)
+  if args.compare_lean:
+    results = [run(args, lean=False), run(args, lean=True)]
+  else:
+    results = [run(args, lean=args.lean)]
+
+  for result in results:
+    print('{}: wall time: {:.1f}s, {} WebDriver commands'.format(
+        'Lean' if result['lean'] else 'Default', result['wall_seconds'],
+        result['commands']))
+    print('  Page load: {:.3f}s, memory: {} MB RSS, {} MB JS heap'.format(
+        result['page_load_seconds'], _format_mb(result['memory']['rss_mb']),
+        _format_mb(result['memory']['js_heap_mb'])))
+    for name, phase in result['phases'].items():
+      print('  {:<16} {:>8.1f}s {:>6} commands'.format(
+          name, phase['seconds'], phase['commands']))
+  if args.json:
+    with open(args.json, 'w') as f:
+      json.dump(results if args.compare_lean else results[0], f, indent=2)
+    logging.info('Wrote results to {}'.format(args.json))
+
+
+def _format_mb(mb):
+  return 'n/a' if mb is None else '{:.0f}'.format(mb)
+
+
+if __name__ == '__main__':
+  main()
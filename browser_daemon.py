@@ -0,0 +1,399 @@
+"""Keep logged-in browsers open and run commands in them.
+
+Commands are sent over a Unix socket by scan.py, attack.py, attack_alert.py and
+pipeline.py when given --browser_daemon, which then print the output of the
+command instead of opening their own browser:
+
+  python3 browser_daemon.py --socket=/tmp/bogame.sock --verbose=true
+  python3 scan.py -c=<country> -u=<email> -p=<password> \\
+    --browser_daemon=/tmp/bogame.sock --rank_min=1000 --rank_max=2000 \\
+    --parallelism=10 --max_scans=100
+
+Browsers are kept per account and univ. Commands for an account wait for one
+of its browsers to be free. Idle browsers are checked to still be logged in
+before running a command, and are restarted once too old, after too many
+commands or once using too much memory.
+
+Relative paths in args are relative to the working directory of the daemon.
+Metrics are not recorded, since commands share the daemon's process.
+"""
+import argparse
+import collections
+import itertools
+import json
+import logging
+import os
+import socketserver
+import threading
+import time
+
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.common.by import By
+
+import attack
+import attack_alert
+import common
+import pipeline
+import scan
+import selenium_lib as sln
+
+
+def _run_pipeline(b, args):
+  pipeline.Pipeline(b, args).run()
+
+
+# Command name -> (function returning the arg parser, function running the
+# command with a browser and args).
+COMMANDS = {
+    'scan': (scan.build_arg_parser, scan.scan),
+    'attack': (attack.build_arg_parser, attack.run),
+    'attack_alert': (attack_alert.build_arg_parser, attack_alert.run),
+    'pipeline': (pipeline.build_arg_parser, _run_pipeline),
+}
+
+
+class _Browser(object):
+  """A browser of the pool, and when and how much it was used."""
+
+  def __init__(self, account, key, b):
+    self.account = account
+    self.key = key
+    self.b = b
+    self.created = time.time()
+    self.last_used = self.created
+    self.num_jobs = 0
+
+
+def account_key(args):
+  """Return the key of the account and univ of a command's args."""
+  return (args.server_url or args.tld, args.email,
+          args.univ_name or args.univ_num)
+
+
+def browser_key(args):
+  """Return the key of the browsers that can run a command with `args`."""
+  return account_key(args) + (args.headless, args.lean, args.profile_dir)
+
+
+class BrowserPool(object):
+  """Logged-in browsers per account, opened on demand and reused."""
+
+  def __init__(self, browsers_per_account=1, max_browsers=4, max_age=3600,
+               max_jobs=50, max_mb=1000, idle_timeout=900):
+    """Constructor.
+
+    Args:
+      browsers_per_account: Max browsers of the same account, whatever their
+        browser options.
+      max_browsers: Max browsers in total. Idle browsers of other accounts are
+        closed to make room.
+      max_age: Seconds after which browsers are restarted.
+      max_jobs: Num commands after which browsers are restarted.
+      max_mb: Memory in MB above which browsers are restarted, or 0.
+      idle_timeout: Seconds after which unused browsers are closed.
+    """
+    self.browsers_per_account = browsers_per_account
+    self.max_browsers = max_browsers
+    self.max_age = max_age
+    self.max_jobs = max_jobs
+    self.max_mb = max_mb
+    self.idle_timeout = idle_timeout
+    self.cond = threading.Condition()
+    self.idle = collections.defaultdict(list)  # key -> [_Browser]
+    # account -> num browsers, idle or not
+    self.num_open = collections.Counter()
+
+  def acquire(self, args):
+    """Return a `_Browser` logged in the account of `args`, waiting for one."""
+    account = account_key(args)
+    key = browser_key(args)
+    to_quit = []
+    waiting = False
+    with self.cond:
+      while True:
+        if self.idle[key]:
+          browser = self.idle[key].pop()
+          break
+        if self.num_open[account] >= self.browsers_per_account:
+          # Make room by closing a browser of the account with other options.
+          evicted = self._pop_idle(account)
+        elif sum(self.num_open.values()) >= self.max_browsers:
+          evicted = self._pop_idle()
+        else:
+          self.num_open[account] += 1
+          browser = None
+          break
+        if evicted:
+          to_quit.append(evicted)
+          continue
+        if not waiting:
+          logging.info('Waiting for a browser of {}'.format(args.email))
+          waiting = True
+        self.cond.wait()
+    for evicted in to_quit:
+      _quit(evicted)
+
+    if browser is not None and not _logged_in(browser):
+      logging.info('Browser of {} is no longer logged in'.format(args.email))
+      _quit(browser)
+      browser = None
+    if browser is None:
+      # The slot of the browser is kept while logging in.
+      try:
+        browser = _Browser(account, key,
+                           common.open_browser_and_connect(args))
+      except Exception:
+        with self.cond:
+          self.num_open[account] -= 1
+          self.cond.notify_all()
+        raise
+    return browser
+
+  def release(self, browser, healthy=True):
+    """Give back a browser after a command, restarting it if needed."""
+    browser.num_jobs += 1
+    browser.last_used = time.time()
+    reason = None
+    if not healthy:
+      reason = 'failed'
+    elif browser.num_jobs >= self.max_jobs:
+      reason = 'ran {} commands'.format(browser.num_jobs)
+    elif time.time() - browser.created > self.max_age:
+      reason = 'is too old'
+    elif self.max_mb:
+      memory = _memory_mb(browser)
+      if memory > self.max_mb:
+        reason = 'uses {:.0f}MB'.format(memory)
+    if reason:
+      logging.info('Browser {}, closing it'.format(reason))
+      _quit(browser)
+    with self.cond:
+      if reason:
+        self.num_open[browser.account] -= 1
+      else:
+        self.idle[browser.key].append(browser)
+      self.cond.notify_all()
+
+  def reap(self):
+    """Close idle browsers that are too old or unused for too long."""
+    now = time.time()
+    to_quit = []
+    with self.cond:
+      for key, browsers in self.idle.items():
+        for browser in list(browsers):
+          if (now - browser.created > self.max_age or
+              now - browser.last_used > self.idle_timeout):
+            browsers.remove(browser)
+            self.num_open[browser.account] -= 1
+            to_quit.append(browser)
+      self.cond.notify_all()
+    for browser in to_quit:
+      logging.info('Closing idle browser of {}'.format(browser.account[1]))
+      _quit(browser)
+
+  def start_reaper(self, interval=60):
+    """Call `reap` every `interval` seconds from a background thread."""
+
+    def reap():
+      while True:
+        time.sleep(interval)
+        self.reap()
+
+    reaper = threading.Thread(target=reap)
+    reaper.daemon = True
+    reaper.start()
+
+  def close(self):
+    """Close all idle browsers."""
+    with self.cond:
+      browsers = [b for browsers in self.idle.values() for b in browsers]
+      self.idle.clear()
+      self.num_open.clear()
+    for browser in browsers:
+      _quit(browser)
+
+  def _pop_idle(self, account=None):
+    """Remove the least recently used idle browser. Must hold `cond`.
+
+    Args:
+      account: If set, only remove a browser of this account.
+    """
+    browsers = [b for browsers in self.idle.values() for b in browsers
+                if account is None or b.account == account]
+    if not browsers:
+      return None
+    browser = min(browsers, key=lambda b: b.last_used)
+    self.idle[browser.key].remove(browser)
+    self.num_open[browser.account] -= 1
+    return browser
+
+
+def _logged_in(browser):
+  """Reload the page and return whether it is still a page of the game."""
+  try:
+    browser.b.refresh()
+    return bool(sln.finds(browser.b, By.ID, 'playerName', timeout=5,
+                          timeout_ok=True))
+  except WebDriverException:
+    return False
+
+
+def _memory_mb(browser):
+  """Return the resident memory of a browser, or its JS heap, in MB."""
+  try:
+    memory = sln.browser_memory_mb(browser.b)
+  except WebDriverException:
+    return 0
+  return memory['rss_mb'] or memory['js_heap_mb'] or 0
+
+
+def _quit(browser):
+  try:
+    browser.b.quit()
+  except WebDriverException:
+    pass
+
+
+class _ClientLogHandler(logging.Handler):
+  """Forward the logs of a command to the client that started it.
+
+  Logs are those of the thread running the command, and of the threads it
+  starts, which are named "<name of the thread>/<name>".
+  """
+
+  def __init__(self, reply, level):
+    super(_ClientLogHandler, self).__init__(level)
+    self.reply = reply
+    self.thread_name = threading.current_thread().name
+    self.setFormatter(logging.Formatter(
+        '[%(levelname)s] %(asctime)s: %(message)s', '%Y-%m-%d %H:%M:%S'))
+
+  def emit(self, record):
+    if (record.threadName != self.thread_name and
+        not record.threadName.startswith(self.thread_name + '/')):
+      return
+    try:
+      self.reply(log=self.format(record))
+    except IOError:
+      pass
+
+
+class _Handler(socketserver.StreamRequestHandler):
+  """Run the command of a client and send back its logs and exit code."""
+
+  _job_ids = itertools.count(1)
+
+  def handle(self):
+    # Threads of the command are named after this one, see _ClientLogHandler.
+    threading.current_thread().name = 'job{}'.format(next(self._job_ids))
+    try:
+      request = json.loads(self.rfile.readline().decode())
+      command, argv = request['command'], request['argv']
+    except (ValueError, KeyError, TypeError):
+      return self._reply(exit=2, error='Invalid request')
+    if command not in COMMANDS:
+      return self._reply(exit=2, error='Unknown command {}'.format(command))
+
+    build_arg_parser, run = COMMANDS[command]
+    try:
+      args = build_arg_parser().parse_args(argv)
+    except SystemExit as e:
+      return self._reply(exit=e.code or 2, error='Invalid args')
+    if args.metrics_json or args.metrics_prom:
+      return self._reply(exit=2, error='Metrics are not recorded by the '
+                         'browser daemon, run the command without it')
+    args.browser_daemon = None
+
+    log_handler = _ClientLogHandler(
+        self._reply, logging.INFO if args.verbose else logging.WARNING)
+    logging.getLogger().addHandler(log_handler)
+    try:
+      logging.info('Running {} for {}'.format(command, args.email))
+      self._run(run, args)
+      self._reply(exit=0)
+    except Exception as e:
+      logging.exception('Command {} failed'.format(command))
+      self._reply(exit=1, error='{}: {}'.format(type(e).__name__, e))
+    finally:
+      logging.getLogger().removeHandler(log_handler)
+
+  def _run(self, run, args):
+    pool = self.server.pool
+    browser = pool.acquire(args)
+    healthy = True
+    try:
+      run(browser.b, args)
+    except WebDriverException:
+      healthy = False
+      raise
+    finally:
+      pool.release(browser, healthy)
+
+  def _reply(self, **reply):
+    self.wfile.write((json.dumps(reply) + '\n').encode())
+    self.wfile.flush()
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  daemon_threads = True
+
+
+def serve(socket_path, pool, reap_interval=60):
+  """Serve commands on a Unix socket until interrupted."""
+  if os.path.exists(socket_path):
+    os.remove(socket_path)
+  # Only the user may run commands with the browsers: create the socket
+  # without permissions for others, rather than restricting it after bind().
+  old_umask = os.umask(0o177)
+  try:
+    server = Server(socket_path, _Handler)
+  finally:
+    os.umask(old_umask)
+  server.pool = pool
+
+  pool.start_reaper(reap_interval)
+  logging.info('Serving commands on {}'.format(socket_path))
+  try:
+    server.serve_forever()
+  finally:
+    server.server_close()
+    os.remove(socket_path)
+    pool.close()
+
+
+def main():
+  arg_parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  arg_parser.add_argument('--socket', type=str, required=True,
+                          help='Unix socket to serve commands on')
+  arg_parser.add_argument('--browsers_per_account', type=int, default=1)
+  arg_parser.add_argument('--max_browsers', type=int, default=4,
+                          help='Max browsers open at a time')
+  arg_parser.add_argument('--max_browser_age', type=float, default=60,
+                          help='Minutes after which browsers are restarted')
+  arg_parser.add_argument('--max_browser_jobs', type=int, default=50,
+                          help='Num commands after which browsers are '
+                          'restarted')
+  arg_parser.add_argument(
+      '--max_browser_mb', type=float, default=1000,
+      help='Restart browsers using more memory (0 to never restart)')
+  arg_parser.add_argument('--idle_timeout', type=float, default=15,
+                          help='Minutes after which unused browsers are '
+                          'closed')
+  arg_parser.add_argument('-v', '--verbose', type=bool,
+                          default=False, help='Verbose output')
+  args = arg_parser.parse_args()
+
+  common.setup_logging(args)
+  # Logs of commands are sent to their clients, whatever the daemon's output.
+  logging.getLogger().setLevel(logging.INFO)
+  pool = BrowserPool(args.browsers_per_account, args.max_browsers,
+                     args.max_browser_age * 60, args.max_browser_jobs,
+                     args.max_browser_mb, args.idle_timeout * 60)
+  try:
+    serve(args.socket, pool)
+  except KeyboardInterrupt:
+    pass
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,135 @@
+"""Tests of browser_daemon.py that do not need a browser."""
+import argparse
+import logging
+import os
+import stat
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import browser_daemon
+import daemon_client
+
+
+class ClientLogHandlerTest(unittest.TestCase):
+
+  def log_from(self, name, message):
+    thread = threading.Thread(target=logging.warning, args=(message,),
+                              name=name)
+    thread.start()
+    thread.join()
+
+  def test_forwards_logs_of_threads_started_by_the_command(self):
+    logs = []
+    self.addCleanup(setattr, threading.current_thread(), 'name',
+                    threading.current_thread().name)
+    threading.current_thread().name = 'job7'
+    handler = browser_daemon._ClientLogHandler(
+        lambda log: logs.append(log), logging.INFO)
+    logging.getLogger().addHandler(handler)
+    try:
+      logging.warning('command')
+      self.log_from('job7/scan_stage', 'stage')
+      self.log_from('job70', 'other command')
+      self.log_from('worker', 'other thread')
+    finally:
+      logging.getLogger().removeHandler(handler)
+    self.assertEqual([log.split(': ', 1)[1] for log in logs],
+                     ['command', 'stage'])
+
+
+class HandlerTest(unittest.TestCase):
+
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.socket_path = os.path.join(tmp.name, 'daemon.sock')
+    server = browser_daemon.Server(self.socket_path, browser_daemon._Handler)
+    server.pool = None  # commands are rejected before using it
+    self.addCleanup(server.server_close)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    self.addCleanup(server.shutdown)
+
+  def test_rejects_metrics(self):
+    argv = ['-c=test', '-u=a@b.c', '-p=pwd', '--max_reports=10',
+            '--num_attacks=1', '--metrics_json=/tmp/metrics.json']
+    self.assertEqual(daemon_client.submit(self.socket_path, 'attack', argv),
+                     2)
+
+
+def _args(**options):
+  return argparse.Namespace(**dict(
+      {'server_url': None, 'tld': 'fr', 'email': 'a@b.c', 'univ_name': 'Alpha',
+       'univ_num': None, 'headless': True, 'lean': False, 'profile_dir': None},
+      **options))
+
+
+class BrowserPoolTest(unittest.TestCase):
+
+  def setUp(self):
+    for name, value in [('_logged_in', True), ('_quit', None),
+                        ('_memory_mb', 0)]:
+      patcher = mock.patch.object(browser_daemon, name, return_value=value)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+    patcher = mock.patch.object(browser_daemon.common,
+                                'open_browser_and_connect')
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    self.pool = browser_daemon.BrowserPool(browsers_per_account=1)
+
+  def test_reuses_browsers_with_the_same_options(self):
+    browser = self.pool.acquire(_args())
+    self.pool.release(browser)
+    self.assertIs(self.pool.acquire(_args()), browser)
+
+  def test_caps_browsers_per_account_whatever_their_options(self):
+    headless = self.pool.acquire(_args())
+    self.pool.release(headless)
+    # The idle browser with other options is closed to make room.
+    browser = self.pool.acquire(_args(headless=False))
+    self.assertIsNot(browser, headless)
+    browser_daemon._quit.assert_called_once_with(headless)
+    self.assertEqual(sum(self.pool.num_open.values()), 1)
+
+    # A busy browser is waited for.
+    acquired = []
+    thread = threading.Thread(
+        target=lambda: acquired.append(self.pool.acquire(_args(lean=True))))
+    thread.start()
+    thread.join(0.1)
+    self.assertEqual(acquired, [])
+    self.pool.release(browser)
+    thread.join()
+    self.assertEqual(len(acquired), 1)
+    self.assertEqual(sum(self.pool.num_open.values()), 1)
+
+
+class ServeTest(unittest.TestCase):
+
+  def test_socket_is_only_accessible_by_the_user(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    socket_path = os.path.join(tmp.name, 'daemon.sock')
+    modes = []
+
+    def serve_forever(server):
+      modes.append(stat.S_IMODE(os.stat(socket_path).st_mode))
+
+    old_umask = os.umask(0o022)
+    self.addCleanup(os.umask, old_umask)
+    pool = mock.Mock()
+    with mock.patch.object(browser_daemon.Server, 'serve_forever',
+                           serve_forever):
+      browser_daemon.serve(socket_path, pool)
+    self.assertEqual(modes, [0o600])
+    self.assertEqual(os.umask(0o022), 0o022)
+    self.assertFalse(os.path.exists(socket_path))
+    pool.close.assert_called_once_with()
+
+
+if __name__ == '__main__':
+  unittest.main()
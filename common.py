@@ -1,13 +1,54 @@
 """General utility functions."""
+import json
 import logging
+import os
+import re
 import sys
+from urllib import parse
 
 from selenium import webdriver
 from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import WebDriverException
 from selenium.webdriver.common.by import By
 
+import metrics
 import selenium_lib as sln
 
+# URL patterns blocked in lean mode: fonts, media and ad/analytics hosts.
+BLOCKED_URLS = [
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.mp3', '*.mp4', '*.ogg', '*.webm',
+    '*openx*', '*doubleclick.net*', '*googlesyndication.com*',
+    '*google-analytics.com*', '*googletagmanager.com*', '*adnxs.com*',
+    '*facebook.net*', '*hotjar.com*', '*criteo.*',
+]
+
+# Chrome prefs of lean mode: 2 blocks the content.
+_LEAN_PREFS = {
+    'profile.managed_default_content_settings.images': 2,
+    'profile.managed_default_content_settings.plugins': 2,
+    'profile.managed_default_content_settings.popups': 2,
+    'profile.managed_default_content_settings.notifications': 2,
+    'profile.managed_default_content_settings.media_stream': 2,
+    'profile.managed_default_content_settings.geolocation': 2,
+}
+
+# Chrome features not needed by the bot.
+_LEAN_ARGS = [
+    '--blink-settings=imagesEnabled=false',
+    '--disable-background-networking',
+    '--disable-component-update',
+    '--disable-default-apps',
+    '--disable-extensions',
+    '--disable-sync',
+    '--disable-translate',
+    '--disable-features=MediaRouter,OptimizationHints,Translate',
+    '--metrics-recording-only',
+    '--mute-audio',
+    '--no-default-browser-check',
+    '--no-first-run',
+]
+
 
 def register_args(arg_parser):
   """Register command-line args."""
@@ -27,10 +68,42 @@ def register_args(arg_parser):
   group.add_argument('--univ_name', type=str, help='Name of univ')
 
   # Program args.
+  arg_parser.add_argument(
+      '--server_url', type=str,
+      help='URL of the login page; defaults to http://www.ogame.<tld>')
   arg_parser.add_argument('--headless', type=bool,
                           default=False, help='Use headless browser')
+  arg_parser.add_argument(
+      '--lean', type=bool, default=False,
+      help='Block images, fonts, media and ads, do not wait for subresources '
+      'to load, and disable unneeded Chrome features')
   arg_parser.add_argument('-v', '--verbose', type=bool,
                           default=False, help='Verbose output')
+  arg_parser.add_argument(
+      '--browser_daemon', type=str,
+      help='If present, Unix socket of browser_daemon.py, which runs the '
+      'command in one of its browsers instead of opening a new one')
+
+  # Session args.
+  arg_parser.add_argument(
+      '--session_dir', type=str,
+      help='If present, save the game session of each account and univ in '
+      'this dir, and reuse it instead of logging in while it is valid')
+  arg_parser.add_argument(
+      '--profile_dir', type=str,
+      help='If present, use this dir as Chrome user data dir, to also keep '
+      'cache and local storage between runs')
+
+  # Metrics args.
+  arg_parser.add_argument(
+      '--metrics_json', type=str,
+      help='If present, write timing of browser calls and phases to this file')
+  arg_parser.add_argument(
+      '--metrics_prom', type=str,
+      help='If present, write the same metrics in Prometheus text format')
+  arg_parser.add_argument(
+      '--metrics_interval', type=float,
+      help='If present, also write metrics every N seconds, not only at exit')
 
 
 def setup_logging(args):
@@ -42,19 +115,39 @@ def setup_logging(args):
         datefmt='%Y-%m-%d %H:%M:%S')
 
 
+def setup_metrics(args):
+  """Setup recording of metrics, if requested."""
+  if args.metrics_json or args.metrics_prom:
+    metrics.start(args.metrics_json, args.metrics_prom, args.metrics_interval)
+
+
 def open_browser_and_connect(args):
   """Open a Chrome browser and connect to OGame account."""
+  with metrics.phase('login'):
+    return _connect(args)
+
+
+def _connect(args):
+  """Open a Chrome browser and log in, or resume the saved session."""
   b = _open_browser(args)
 
-  url = 'http://www.ogame.' + args.tld
+  session_path = _session_path(args)
+  if session_path and _resume_session(b, session_path):
+    return b
+
+  url = args.server_url or 'http://www.ogame.' + args.tld
   logging.info('Navigating to ' + url)
   b.get(url)
 
-  # Close ad.
+  # Close ad. In lean mode ads are blocked, so only close one already there.
   try:
-    sln.find(sln.find(
-        b, By.CLASS_NAME, 'openX_int_closeButton', timeout=3),
-        By.TAG_NAME, 'a').click()
+    if args.lean:
+      for close in b.find_elements_by_class_name('openX_int_closeButton'):
+        sln.find(close, By.TAG_NAME, 'a', timeout=1).click()
+    else:
+      sln.find(sln.find(
+          b, By.CLASS_NAME, 'openX_int_closeButton', timeout=3),
+          By.TAG_NAME, 'a').click()
   except TimeoutException:
     pass
 
@@ -100,13 +193,96 @@ def open_browser_and_connect(args):
   b.switch_to.window(b.window_handles[-1])
   logging.info('Switched to tab ' + b.current_url)
 
+  if session_path:
+    _save_session(b, session_path)
   return b
 
 
+def _session_path(args):
+  """Return the session file of the account and univ, or None."""
+  if not args.session_dir:
+    return None
+  univ = args.univ_name or str(args.univ_num)
+  name = re.sub(r'[^\w.@-]', '_', '_'.join([args.tld, args.email, univ]))
+  return os.path.join(os.path.expanduser(args.session_dir), name + '.json')
+
+
+def _save_session(b, path):
+  """Save the game URL and cookies of the current tab."""
+  session = {
+      'url': b.current_url,
+      'cookies': b.get_cookies(),
+  }
+  os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+  # Cookies give access to the account: keep them private to the user.
+  fd = os.open(path + '.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+  with os.fdopen(fd, 'w') as f:
+    json.dump(session, f)
+  os.replace(path + '.tmp', path)
+  logging.info('Saved session to ' + path)
+
+
+def _resume_session(b, path):
+  """Restore a saved session and go to the game.
+
+  Returns:
+    Whether the session was still valid, in which case the browser is on the
+    game tab; otherwise a full login is needed.
+  """
+  try:
+    with open(path) as f:
+      session = json.load(f)
+  except (IOError, ValueError):
+    return False
+
+  # Cookies can only be set for the domain of the current page: open a page
+  # of the game server first, which is fast even when not found.
+  url = parse.urlsplit(session['url'])
+  b.get(parse.urlunsplit((url.scheme, url.netloc, '/favicon.ico', '', '')))
+  for cookie in session['cookies']:
+    cookie = {k: v for k, v in cookie.items() if k in (
+        'name', 'value', 'path', 'domain', 'secure', 'httpOnly', 'expiry')}
+    if 'expiry' in cookie:
+      cookie['expiry'] = int(cookie['expiry'])
+    try:
+      b.add_cookie(cookie)
+    except WebDriverException:
+      logging.info('Could not restore cookie {}'.format(cookie['name']))
+
+  logging.info('Resuming session at ' + session['url'])
+  b.get(session['url'])
+  # Expired sessions get redirected to the login page.
+  if (parse.urlsplit(b.current_url).netloc != url.netloc or
+      not sln.finds(b, By.ID, 'playerName', timeout=5, timeout_ok=True)):
+    logging.info('Saved session has expired, logging in')
+    return False
+  _save_session(b, path)  # with refreshed cookies
+  return True
+
+
 def _open_browser(args):
   """Open a Chrome browser."""
   logging.info('Opening Chrome')
   options = webdriver.ChromeOptions()
   if args.headless:
     options.set_headless()
-  return webdriver.Chrome(options=options)
+  if args.profile_dir:
+    options.add_argument('--user-data-dir=' + os.path.abspath(
+        os.path.expanduser(args.profile_dir)))
+  if not args.lean:
+    return webdriver.Chrome(options=options)
+
+  for arg in _LEAN_ARGS:
+    options.add_argument(arg)
+  options.add_experimental_option('prefs', _LEAN_PREFS)
+  capabilities = options.to_capabilities()
+  # Return once the DOM is ready, without waiting for stylesheets and images.
+  capabilities['pageLoadStrategy'] = 'eager'
+  b = webdriver.Chrome(options=options, desired_capabilities=capabilities)
+  # Prefs cannot block fonts and ad scripts: intercept them by URL.
+  try:
+    b.execute_cdp_cmd('Network.enable', {})
+    b.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URLS})
+  except (AttributeError, WebDriverException) as e:
+    logging.warn('Could not block URLs: {}'.format(e))
+  return b
@@ -0,0 +1,24 @@
+"""Tests of common.py that do not need a browser."""
+import argparse
+import os
+import unittest
+
+import common
+
+
+class SessionPathTest(unittest.TestCase):
+
+  def test_expands_home(self):
+    arg_parser = argparse.ArgumentParser()
+    common.register_args(arg_parser)
+    args = arg_parser.parse_args([
+        '-c=fr', '-u=a@b.c', '-p=pwd', '--univ_name=Alpha',
+        '--session_dir=~/.bogame/sessions'])
+    self.assertEqual(
+        common._session_path(args),
+        os.path.join(os.path.expanduser('~'), '.bogame', 'sessions',
+                     'fr_a@b.c_Alpha.json'))
+
+
+if __name__ == '__main__':
+  unittest.main()
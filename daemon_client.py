@@ -0,0 +1,39 @@
+"""Submit a command to `browser_daemon.py` and print its output."""
+import json
+import logging
+import socket
+import sys
+
+
+def submit(socket_path, command, argv):
+  """Run a command in the browser daemon and wait for it to finish.
+
+  Args:
+    socket_path: Unix socket of the daemon.
+    command: Name of the command, e.g. "scan".
+    argv: Command-line args of the command.
+
+  Returns:
+    Exit code of the command.
+  """
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    sock.connect(socket_path)
+  except (IOError, OSError) as e:
+    logging.error('Could not connect to browser daemon at {}: {}'.format(
+        socket_path, e))
+    return 1
+  with sock, sock.makefile('rwb') as f:
+    f.write((json.dumps({'command': command, 'argv': argv}) + '\n').encode())
+    f.flush()
+    for line in f:
+      reply = json.loads(line.decode())
+      if 'log' in reply:
+        print(reply['log'])
+        sys.stdout.flush()
+      elif 'exit' in reply:
+        if reply.get('error'):
+          print(reply['error'], file=sys.stderr)
+        return reply['exit']
+  print('Browser daemon closed the connection', file=sys.stderr)
+  return 1
@@ -0,0 +1,130 @@
+"""Send fleets in batches, grouped by origin planet.
+
+Instead of clicking through the fleet pages for each fleet, posts the forms of
+the last fleet page and of the fleet sending, either from within the game tab
+(a single script per origin planet) or over an HTTP session.
+"""
+import collections
+import itertools
+import logging
+from urllib import parse
+
+import html_lib
+import http_lib
+import selenium_lib as sln
+
+# Mission IDs.
+ATTACK = 1
+
+# Posts the fleet3 form, then the form it returns with the mission set, for
+# each fleet in turn. Calls back with whether each fleet was sent.
+_SEND_FLEETS_JS = """
+var url = arguments[0], planetId = arguments[1], fleets = arguments[2];
+var mission = arguments[3], callback = arguments[arguments.length - 1];
+function post(target, fields) {
+  var body = new URLSearchParams();
+  Object.keys(fields).forEach(function(k) { body.append(k, fields[k]); });
+  return fetch(target, {method: 'POST', body: body,
+                        credentials: 'same-origin'}).then(function(response) {
+    if (!response.ok) {
+      throw new Error(target + ': ' + response.status);
+    }
+    return response.text();
+  });
+}
+var results = [];
+fleets.reduce(function(chain, fields) {
+  return chain.then(function() {
+    return post(url + '?page=fleet3&cp=' + planetId, fields);
+  }).then(function(html) {
+    var form = new DOMParser().parseFromString(html, 'text/html')
+        .getElementById('sendFleet');
+    if (!form) {
+      throw new Error('No fleet form');
+    }
+    var data = {};
+    Array.prototype.forEach.call(form.querySelectorAll('input'), function(e) {
+      data[e.name] = e.value;
+    });
+    data.mission = mission;
+    return post(new URL(form.getAttribute('action'), url).href, data);
+  }).then(function(html) {
+    results.push(html.indexOf('id="movements"') >= 0);
+  }, function(e) {
+    results.push(false);
+  });
+}, Promise.resolve()).then(function() { callback(results); });
+"""
+
+
+def by_origin(raids):
+  """Group raids by origin planet.
+
+  Returns:
+    List of (planet num, list of `planner.Raid`s), by planet num.
+  """
+  raids = sorted(raids, key=lambda r: r.planet_num)
+  return [(planet_num, list(group)) for planet_num, group in itertools.groupby(
+      raids, key=lambda r: r.planet_num)]
+
+
+def fleet_fields(coords, ships):
+  """Return the fields of the fleet page form to send `ships` to `coords`."""
+  fields = collections.OrderedDict(
+      ('am{}'.format(ship_id), num) for ship_id, num in sorted(ships.items()))
+  fields['galaxy'] = coords.galaxy
+  fields['system'] = coords.system
+  fields['position'] = coords.position
+  return fields
+
+
+def send_in_browser(b, planet_id, raids, mission=ATTACK, timeout=60):
+  """Send raids from a planet with a single in-page script.
+
+  Args:
+    b: Browser, on any page of the game.
+    planet_id: ID of the origin planet.
+    raids: List of `planner.Raid`s from that planet.
+    mission: Mission ID.
+    timeout: Max seconds to send all raids.
+
+  Returns:
+    List of whether each raid was sent.
+  """
+  fleets = [fleet_fields(r.coords, r.ships) for r in raids]
+  return sln.execute_async(b, _SEND_FLEETS_JS, http_lib.game_url(b),
+                           planet_id, fleets, mission, timeout=timeout)
+
+
+def send_http(session, url, planet_id, raids, mission=ATTACK):
+  """Send raids from a planet over an HTTP session.
+
+  Args:
+    session: `requests.Session` logged in the game.
+    url: URL of the game's index.php.
+    planet_id: ID of the origin planet.
+    raids: List of `planner.Raid`s from that planet.
+    mission: Mission ID.
+
+  Returns:
+    List of whether each raid was sent.
+  """
+  results = []
+  for raid in raids:
+    try:
+      form = html_lib.parse(http_lib.post_page(
+          session, url, 'fleet3', fleet_fields(raid.coords, raid.ships),
+          cp=planet_id).text).find(id='sendFleet')
+      if form is None:
+        raise IOError('No fleet form')
+      data = {e.get('name'): e.get('value', '')
+              for e in form.find_all('input') if e.get('name')}
+      data['mission'] = mission
+      response = session.post(parse.urljoin(url, form.get('action')),
+                              data=data, timeout=10)
+      response.raise_for_status()
+      results.append('id="movements"' in response.text)
+    except IOError as e:
+      logging.warn('Could not send fleet to {}: {}'.format(raid.coords, e))
+      results.append(False)
+  return results
@@ -1,6 +1,10 @@
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+import logging
+import queue
 import smtplib
+import threading
+import time
 
 
 def send_email(smtp_host, smtp_port, login, password, addr_to, subject, body):
@@ -14,3 +18,136 @@ def send_email(smtp_host, smtp_port, login, password, addr_to, subject, body):
   smtp.login(login, password)
   smtp.sendmail(login, addr_to, msg.as_string())
   smtp.quit()
+
+
+class EmailSender(object):
+  """Send emails from a background thread over a persistent connection.
+
+  `send` only queues the email. Emails queued within `digest_delay` seconds of
+  each other, or while waiting for `min_interval` seconds since the last email,
+  are sent as a single digest. Emails that could not be sent are sent again
+  with more emails queued meanwhile, after `retry_delay` seconds, doubling up
+  to `max_retry_delay`.
+
+  The connection requires STARTTLS unless `plaintext` is set, e.g. for a local
+  test server.
+  """
+
+  def __init__(self, smtp_host, smtp_port, login, password, addr_to,
+               digest_delay=10, min_interval=60, retry_delay=30,
+               max_retry_delay=600, plaintext=False):
+    self.smtp_host = smtp_host
+    self.smtp_port = smtp_port
+    self.login = login
+    self.password = password
+    self.addr_to = addr_to
+    self.digest_delay = digest_delay
+    self.min_interval = min_interval
+    self.retry_delay = retry_delay
+    self.max_retry_delay = max_retry_delay
+    self.plaintext = plaintext
+    self.smtp = None
+    self.last_sent = 0
+    self.queue = queue.Queue()
+    self.thread = threading.Thread(
+        target=self._run,
+        name='{}/email'.format(threading.current_thread().name))
+    self.thread.daemon = True
+    self.thread.start()
+
+  def send(self, subject, body):
+    """Queue an email and return immediately."""
+    self.queue.put((subject, body))
+
+  def close(self, timeout=None):
+    """Send queued emails, without waiting for digests, and disconnect.
+
+    Emails are tried once more, and dropped if they still cannot be sent.
+    """
+    self.queue.put(None)
+    self.thread.join(timeout)
+
+  def _run(self):
+    emails = []  # not sent yet
+    closing = False
+    retry_delay = self.retry_delay
+    while not closing:
+      if emails:
+        # Sending failed: retry later, with the emails queued meanwhile.
+        deadline = time.time() + retry_delay
+        retry_delay = min(2 * retry_delay, self.max_retry_delay)
+      else:
+        item = self.queue.get()
+        if item is None:
+          break
+        emails.append(item)
+        deadline = max(time.time() + self.digest_delay,
+                       self.last_sent + self.min_interval)
+
+      # Gather more emails until the digest delay and the rate limit are over.
+      while True:
+        try:
+          item = self.queue.get(timeout=max(0, deadline - time.time()))
+        except queue.Empty:
+          break
+        if item is None:
+          closing = True
+          break
+        emails.append(item)
+
+      try:
+        self._send_digest(emails)
+        emails = []
+        retry_delay = self.retry_delay
+      except (smtplib.SMTPException, IOError) as e:
+        self._disconnect()
+        logging.error('Could not send {} emails{}: {}'.format(
+            len(emails), '' if closing else
+            ', retrying in {:.0f}s'.format(retry_delay), e))
+    self._disconnect()
+
+  def _send_digest(self, emails):
+    if len(emails) == 1:
+      subject, body = emails[0]
+    else:
+      subject = '{} (and {} more)'.format(emails[0][0], len(emails) - 1)
+      body = '\n\n'.join('== {} ==\n\n{}'.format(s, b) for s, b in emails)
+    msg = MIMEMultipart()
+    msg['To'] = self.addr_to
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
+
+    try:
+      self._connection().sendmail(self.login, self.addr_to, msg.as_string())
+    except smtplib.SMTPServerDisconnected:
+      # The server closed the idle connection: reconnect once.
+      self.smtp = None
+      self._connection().sendmail(self.login, self.addr_to, msg.as_string())
+    self.last_sent = time.time()
+    logging.info('Sent email "{}" to {}'.format(subject, self.addr_to))
+
+  def _connection(self):
+    if self.smtp is None:
+      smtp = smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=30)
+      smtp.ehlo()
+      if smtp.has_extn('starttls'):
+        smtp.starttls()
+        smtp.ehlo()
+      elif not self.plaintext:
+        smtp.close()
+        raise smtplib.SMTPNotSupportedError(
+            '{} does not support STARTTLS'.format(self.smtp_host))
+      else:
+        logging.warn('Sending to {} in plaintext'.format(self.smtp_host))
+      if self.password and smtp.has_extn('auth'):
+        smtp.login(self.login, self.password)
+      self.smtp = smtp
+    return self.smtp
+
+  def _disconnect(self):
+    if self.smtp is not None:
+      try:
+        self.smtp.quit()
+      except (smtplib.SMTPException, IOError):
+        pass
+      self.smtp = None
@@ -0,0 +1,61 @@
+"""Tests of email_lib.EmailSender against the SMTP stand-in of mock_server."""
+import smtplib
+import time
+import unittest
+from unittest import mock
+
+import email_lib
+import mock_server
+
+
+class EmailSenderTest(unittest.TestCase):
+
+  def setUp(self):
+    self.server = mock_server.serve_smtp()
+    self.addCleanup(self.server.shutdown)
+    self.host, self.port = self.server.server_address
+
+  def new_sender(self, **kwargs):
+    kwargs.setdefault('digest_delay', 0)
+    kwargs.setdefault('min_interval', 0)
+    return email_lib.EmailSender(self.host, self.port, 'me', 'pwd', 'you',
+                                 **kwargs)
+
+  def test_requires_starttls(self):
+    sender = self.new_sender(retry_delay=60)
+    sender.send('Attack alert', 'body')
+    sender.close(timeout=10)
+    self.assertEqual(self.server.messages, [])
+
+  def test_plaintext_opt_in(self):
+    sender = self.new_sender(plaintext=True)
+    sender.send('Attack alert', 'body')
+    sender.close(timeout=10)
+    self.assertEqual(len(self.server.messages), 1)
+    self.assertIn('Subject: Attack alert', self.server.messages[0])
+
+  def test_retries_failed_emails(self):
+    sender = self.new_sender(plaintext=True, retry_delay=0.1)
+    send_digest = sender._send_digest
+    failures = []
+
+    def fail_once(emails):
+      if not failures:
+        failures.append(emails)
+        raise smtplib.SMTPServerDisconnected('down')
+      send_digest(emails)
+
+    with mock.patch.object(sender, '_send_digest', side_effect=fail_once):
+      sender.send('Attack alert', 'first')
+      for _ in range(50):
+        if self.server.messages:
+          break
+        time.sleep(0.05)
+      sender.close(timeout=10)
+    self.assertEqual(len(failures), 1)
+    self.assertEqual(len(self.server.messages), 1)
+    self.assertIn('first', self.server.messages[0])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,155 @@
+"""Inventory of the ships on each planet of the account.
+
+The fleet page of every planet is fetched at once, from within the game tab or
+over HTTP, instead of clicking through the planets, then kept up to date
+locally as fleets are dispatched.
+"""
+from concurrent import futures
+import logging
+import re
+import threading
+
+import html_lib
+import http_lib
+import planner
+import report_parser
+import selenium_lib as sln
+
+_SHIP_BUTTON_RE = re.compile(r'^button(\d+)$')
+_PLANET_ID_RE = re.compile(r'^planet-(\d+)$')
+
+# Fetches all URLs in parallel with the page's cookies and calls back with
+# their bodies, or with {error: ...}.
+_FETCH_PAGES_JS = """
+var urls = arguments[0], callback = arguments[arguments.length - 1];
+Promise.all(urls.map(function(url) {
+  return fetch(url, {credentials: 'same-origin'}).then(function(response) {
+    if (!response.ok) {
+      throw new Error(url + ': ' + response.status);
+    }
+    return response.text();
+  });
+})).then(callback, function(e) { callback({error: String(e)}); });
+"""
+
+
+def parse_planets(html):
+  """Parse the planet list of a game page.
+
+  Args:
+    html: (str or html_lib.Element) Game page, or already parsed document.
+
+  Returns:
+    List of (planet ID, `Coords`), in the order of the list.
+  """
+  doc = html_lib.parse(html) if isinstance(html, str) else html
+  planet_list = doc.find(id='planetList')
+  if planet_list is None:
+    return []
+  planets = []
+  for planet in planet_list.find_all(class_='smallplanet'):
+    m = _PLANET_ID_RE.match(planet.get('id', ''))
+    coords = planet.find(class_='planet-koords')
+    if m and coords is not None:
+      planets.append((m.group(1), report_parser.parse_coords(coords.text)))
+  return planets
+
+
+def parse_ships(html):
+  """Parse the ships available on the fleet page of a planet.
+
+  Returns:
+    Dict of ship ID -> count, without ships the planet has none of.
+  """
+  doc = html_lib.parse(html) if isinstance(html, str) else html
+  ships = {}
+  for e in doc.iter():
+    m = _SHIP_BUTTON_RE.match(e.get('id', ''))
+    level = e.find(class_='level') if m else None
+    if level is None or not level.text:
+      continue
+    # The level may be preceded by the name of the ship.
+    num = report_parser.parse_number(level.text.split()[-1])
+    if num > 0:
+      ships[int(m.group(1))] = num
+  return ships
+
+
+class FleetInventory(object):
+  """Ships on each planet, updated locally as fleets are sent."""
+
+  def __init__(self, origins, planet_ids):
+    """Constructor.
+
+    Args:
+      origins: Dict of planet num -> `planner.Origin`.
+      planet_ids: Dict of planet num -> planet ID in the game.
+    """
+    self._origins = origins
+    self.planet_ids = planet_ids
+
+  def origins(self):
+    """Return a copy of the inventory, as a dict of planet num -> `Origin`."""
+    return {i: planner.Origin(o.coords, dict(o.ships))
+            for i, o in self._origins.items()}
+
+  def dispatched(self, planet_num, ships):
+    """Remove `ships` (dict of ship ID -> num) sent from `planet_num`."""
+    available = self._origins[planet_num].ships
+    for ship_id, num in ships.items():
+      available[ship_id] = max(0, available.get(ship_id, 0) - num)
+
+
+def from_browser(b, timeout=30):
+  """Read the ships of all planets with a single in-page script.
+
+  Args:
+    b: Browser, on any page of the game.
+    timeout: Max seconds to fetch all fleet pages.
+
+  Returns:
+    `FleetInventory`.
+  """
+  planets = parse_planets(b.page_source)
+  logging.info('Found {} planets'.format(len(planets)))
+  url = http_lib.game_url(b)
+  urls = ['{}?page=fleet1&cp={}'.format(url, planet_id)
+          for planet_id, _ in planets]
+  pages = sln.execute_async(b, _FETCH_PAGES_JS, urls, timeout=timeout)
+  if isinstance(pages, dict):
+    raise IOError('Could not fetch fleet pages: {}'.format(pages['error']))
+
+  return _inventory(planets, pages)
+
+
+def from_session(session, url, concurrency=4):
+  """Read the ships of all planets over an HTTP session.
+
+  Args:
+    session: `requests.Session` logged in the game.
+    url: URL of the game's index.php.
+    concurrency: Num fleet pages fetched at a time.
+
+  Returns:
+    `FleetInventory`.
+  """
+  planets = parse_planets(http_lib.get_page(session, url, 'overview'))
+  logging.info('Found {} planets'.format(len(planets)))
+  prefix = threading.current_thread().name + '/fleet'
+  with futures.ThreadPoolExecutor(max_workers=concurrency,
+                                  thread_name_prefix=prefix) as executor:
+    pages = list(executor.map(
+        lambda planet: http_lib.get_page(session, url, 'fleet1', cp=planet[0]),
+        planets))
+  return _inventory(planets, pages)
+
+
+def _inventory(planets, pages):
+  """Return the `FleetInventory` of (planet ID, `Coords`) and fleet pages."""
+  origins, planet_ids = {}, {}
+  for i, ((planet_id, coords), page) in enumerate(zip(planets, pages)):
+    ships = parse_ships(page)
+    logging.info('Planet {} [{}] has {}'.format(i, coords, ships))
+    origins[i] = planner.Origin(coords, ships)
+    planet_ids[i] = planet_id
+  return FleetInventory(origins, planet_ids)
@@ -0,0 +1,84 @@
+"""On-disk index of the galaxy, to skip systems seen recently."""
+import logging
+import sqlite3
+import time
+
+import galaxy_parser
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS systems (
+  galaxy INTEGER NOT NULL,
+  system INTEGER NOT NULL,
+  last_seen REAL NOT NULL,
+  PRIMARY KEY (galaxy, system)
+);
+CREATE TABLE IF NOT EXISTS planets (
+  galaxy INTEGER NOT NULL,
+  system INTEGER NOT NULL,
+  position INTEGER NOT NULL,
+  planet_name TEXT,
+  player_name TEXT,
+  player_id TEXT,
+  classes TEXT,
+  rank INTEGER,
+  has_espionage INTEGER,
+  last_seen REAL NOT NULL,
+  PRIMARY KEY (galaxy, system, position)
+);
+"""
+
+
+class GalaxyIndex(object):
+  """SQLite index of (galaxy, system, position) rows with a last-seen time."""
+
+  def __init__(self, path):
+    self.path = path
+    self.db = sqlite3.connect(path)
+    self.db.executescript(_SCHEMA)
+    logging.info('Opened galaxy index {}'.format(path))
+
+  def close(self):
+    self.db.close()
+
+  def update(self, galaxy, system, rows, now=None):
+    """Replace the rows of a system and mark it as seen."""
+    now = time.time() if now is None else now
+    with self.db:
+      self.db.execute('DELETE FROM planets WHERE galaxy = ? AND system = ?',
+                      (galaxy, system))
+      self.db.executemany(
+          'INSERT INTO planets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+          [(galaxy, system, r.position, r.planet_name, r.player_name,
+            r.player_id, ' '.join(r.classes), r.rank,
+            r.espionage_selector is not None, now) for r in rows])
+      self.db.execute('INSERT OR REPLACE INTO systems VALUES (?, ?, ?)',
+                      (galaxy, system, now))
+
+  def last_seen(self, galaxy, system):
+    """Return when a system was last seen, or None if never."""
+    row = self.db.execute(
+        'SELECT last_seen FROM systems WHERE galaxy = ? AND system = ?',
+        (galaxy, system)).fetchone()
+    return row[0] if row else None
+
+  def fresh_systems(self, galaxy, ttl, now=None):
+    """Return rows of systems seen less than `ttl` seconds ago.
+
+    Returns:
+      Dict of system -> list of `galaxy_parser.SystemRow`s.
+    """
+    now = time.time() if now is None else now
+    systems = {s: [] for s, in self.db.execute(
+        'SELECT system FROM systems WHERE galaxy = ? AND last_seen >= ?',
+        (galaxy, now - ttl))}
+    for (system, position, planet_name, player_name, player_id, classes, rank,
+         has_espionage) in self.db.execute(
+             'SELECT system, position, planet_name, player_name, player_id, '
+             'classes, rank, has_espionage FROM planets '
+             'WHERE galaxy = ? ORDER BY system, position', (galaxy,)):
+      if system in systems:
+        systems[system].append(galaxy_parser.SystemRow(
+            position, planet_name, player_name, player_id, classes.split(),
+            rank, galaxy_parser.espionage_selector(position)
+            if has_espionage else None))
+    return systems
@@ -0,0 +1,56 @@
+"""Tests of galaxy_index.py."""
+import os
+import tempfile
+import unittest
+
+import galaxy_index
+from galaxy_parser import SystemRow
+
+
+def _row(position, rank=1234, espionage=True):
+  return SystemRow(
+      position=position, planet_name='Colony', player_name='Alice',
+      player_id='100005', classes=['playername', 'inactive', 'tooltipRel'],
+      rank=rank, espionage_selector='[data-bogame-espionage="{}"]'.format(
+          position) if espionage else None)
+
+
+class GalaxyIndexTest(unittest.TestCase):
+
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.path = os.path.join(tmp.name, 'index.db')
+    self.index = galaxy_index.GalaxyIndex(self.path)
+    self.addCleanup(self.index.close)
+
+  def test_fresh_systems_within_ttl(self):
+    self.index.update(1, 101, [_row(4), _row(7, espionage=False)], now=1000)
+    self.index.update(1, 102, [], now=500)
+    self.index.update(2, 101, [_row(4)], now=1000)
+
+    self.assertEqual(self.index.fresh_systems(1, ttl=100, now=1050),
+                     {101: [_row(4), _row(7, espionage=False)]})
+    # Systems without planets are fresh too.
+    self.assertEqual(self.index.fresh_systems(1, ttl=600, now=1050),
+                     {101: [_row(4), _row(7, espionage=False)], 102: []})
+    self.assertEqual(self.index.fresh_systems(1, ttl=100, now=1200), {})
+    self.assertEqual(self.index.last_seen(1, 101), 1000)
+    self.assertIsNone(self.index.last_seen(1, 103))
+
+  def test_update_replaces_rows(self):
+    self.index.update(1, 101, [_row(4), _row(7)], now=1000)
+    self.index.update(1, 101, [_row(4, rank=1300)], now=2000)
+    self.assertEqual(self.index.fresh_systems(1, ttl=100, now=2000),
+                     {101: [_row(4, rank=1300)]})
+
+  def test_persists_across_runs(self):
+    self.index.update(1, 101, [_row(4)], now=1000)
+    self.index.close()
+    self.index = galaxy_index.GalaxyIndex(self.path)
+    self.assertEqual(self.index.fresh_systems(1, ttl=100, now=1000),
+                     {101: [_row(4)]})
+
+
+if __name__ == '__main__':
+  unittest.main()
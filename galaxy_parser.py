@@ -0,0 +1,98 @@
+"""Parse the galaxy table of a system."""
+import collections
+
+import html_lib
+
+SystemRow = collections.namedtuple(
+    'SystemRow', ['position', 'planet_name', 'player_name', 'player_id',
+                  'classes', 'rank', 'espionage_selector'])
+
+
+def espionage_selector(position):
+  """CSS selector of the espionage button tagged by `scan.read_system`."""
+  return '[data-bogame-espionage="{}"]'.format(position)
+
+
+def player_id(rel):
+  """Return the player ID of the `rel` of a player link, e.g. "player100005".
+
+  IDs are those of the public data files, e.g. "100005", so that ranks read
+  from either match.
+  """
+  return rel[len('player'):] if rel.startswith('player') else rel
+
+
+def row_from_dict(raw):
+  """Build a `SystemRow` from raw strings, or None if there is no position."""
+  try:
+    position = int(raw['position'])
+  except ValueError:
+    return None
+  try:
+    rank = int(raw['rank'].replace('.', '').replace(',', ''))
+  except ValueError:
+    rank = None
+  return SystemRow(
+      position=position, planet_name=raw['planet_name'],
+      player_name=raw['player_name'], player_id=raw['player_id'],
+      classes=raw['classes'].split(), rank=rank,
+      espionage_selector=raw['espionage_selector'])
+
+
+def parse_system(html):
+  """Parse all rows of a system out of the galaxy content HTML.
+
+  Mirrors what `scan.read_system` reads from the live page, so the same
+  filtering applies to both.
+
+  Args:
+    html: (str or html_lib.Element) Galaxy content, or already parsed document.
+
+  Returns:
+    List of `SystemRow`s.
+  """
+  doc = html_lib.parse(html) if isinstance(html, str) else html
+
+  # Tooltips are looked up by ID, which may be duplicated in the page.
+  by_id = collections.defaultdict(list)
+  for e in doc.iter():
+    if 'id' in e.attrs:
+      by_id[e.attrs['id']].append(e)
+
+  rows = []
+  for player in doc.find_all(class_='playername'):
+    tr = player.parent
+    position = tr.find(class_='position')
+    planet_name = tr.find(class_='planetname')
+    link = player.find('a')
+    rel = link.get('rel', '') if link is not None else ''
+    rank = ''
+    for tooltip in by_id.get(rel, []) if rel else []:
+      rank_link = tooltip.find('a')
+      rank = rank_link.text if rank_link is not None else ''
+      if rank:
+        break
+    row = row_from_dict({
+        'position': position.text if position is not None else '',
+        'planet_name': planet_name.text if planet_name is not None else '',
+        'player_name': (link if link is not None else player).text,
+        'player_id': player_id(rel),
+        'classes': player.get('class', ''),
+        'rank': rank,
+        'espionage_selector': None,
+    })
+    if row is not None:
+      if tr.find(class_='espionage') is not None:
+        row = row._replace(espionage_selector=espionage_selector(row.position))
+      rows.append(row)
+  return rows
+
+
+def parse_slots_used(html):
+  """Return the number of fleet slots in use, or None if not in the page."""
+  doc = html_lib.parse(html) if isinstance(html, str) else html
+  slot_used = doc.find(id='slotUsed')
+  try:
+    return int(slot_used.text)
+  except (AttributeError, ValueError):
+    return None
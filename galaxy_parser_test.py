@@ -0,0 +1,56 @@
+"""Tests of galaxy_parser.py on a saved galaxy page."""
+import os
+import unittest
+
+import galaxy_parser
+from galaxy_parser import SystemRow
+
+_TESTDATA = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'testdata')
+
+
+def _read(name):
+  with open(os.path.join(_TESTDATA, name)) as f:
+    return f.read()
+
+
+class ParseSystemTest(unittest.TestCase):
+
+  def setUp(self):
+    self.html = _read('galaxy_1_101.html')
+
+  def test_parse_system(self):
+    self.assertEqual(galaxy_parser.parse_system(self.html), [
+        SystemRow(position=1, planet_name='Homeworld', player_name='Me',
+                  player_id='', classes=['playername', 'js_no_action'],
+                  rank=None, espionage_selector=None),
+        SystemRow(position=2, planet_name='', player_name='', player_id='',
+                  classes=['playername'], rank=None, espionage_selector=None),
+        SystemRow(position=4, planet_name='Colony', player_name='Alice',
+                  player_id='100005',
+                  classes=['playername', 'inactive', 'tooltipRel'],
+                  rank=1234,
+                  espionage_selector='[data-bogame-espionage="4"]'),
+        # Rank is in the second tooltip with the player's ID.
+        SystemRow(position=7, planet_name='Outpost', player_name='Bob',
+                  player_id='100006', classes=['playername', 'normal'],
+                  rank=17, espionage_selector='[data-bogame-espionage="7"]'),
+        # No espionage button in vacation mode.
+        SystemRow(position=9, planet_name='Beach', player_name='Carol',
+                  player_id='100007',
+                  classes=['playername', 'vacation', 'tooltipRel'],
+                  rank=3456, espionage_selector=None),
+    ])
+
+  def test_parse_slots_used(self):
+    self.assertEqual(galaxy_parser.parse_slots_used(self.html), 3)
+    self.assertIsNone(galaxy_parser.parse_slots_used('<table></table>'))
+
+  def test_player_id(self):
+    self.assertEqual(galaxy_parser.player_id('player100005'), '100005')
+    self.assertEqual(galaxy_parser.player_id('100005'), '100005')
+    self.assertEqual(galaxy_parser.player_id(''), '')
+
+
+if __name__ == '__main__':
+  unittest.main()
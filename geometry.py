@@ -0,0 +1,100 @@
+"""Distances and flight times in the universe."""
+import math
+
+# Base speed of ships, by ship ID.
+SMALL_CARGO = 202
+LARGE_CARGO = 203
+ESPIONAGE_PROBE = 210
+SHIP_SPEED = {
+    SMALL_CARGO: 5000,
+    LARGE_CARGO: 7500,
+    ESPIONAGE_PROBE: 100000000,
+}
+
+
+def distance(a, b, num_galaxies=7, num_systems=499):
+  """Return the distance between coords `a` and `b`.
+
+  Galaxies and systems are donuts: the first one is next to the last one.
+  """
+  if a[0] != b[0]:
+    d = abs(a[0] - b[0])
+    return 20000 * min(d, num_galaxies - d)
+  if a[1] != b[1]:
+    d = abs(a[1] - b[1])
+    return 2700 + 95 * min(d, num_systems - d)
+  if a[2] != b[2]:
+    return 1000 + 5 * abs(a[2] - b[2])
+  return 5
+
+
+def flight_time(dist, ship_speed, speed_pct=100, fleet_speed=1):
+  """Return the one-way flight time in seconds.
+
+  Args:
+    dist: Distance, see `distance`.
+    ship_speed: Speed of the slowest ship of the fleet.
+    speed_pct: Speed setting of the fleet, between 10 and 100.
+    fleet_speed: Fleet speed multiplier of the universe.
+  """
+  return (35000. / speed_pct * math.sqrt(dist * 10. / ship_speed) + 10) / (
+      fleet_speed)
+
+
+class DistanceTable(object):
+  """Distances from a few origins to every system of the universe.
+
+  Rows of distances from each origin to each (galaxy, system) are computed
+  once, so that ordering the whole universe by closest origin is only lookups.
+  Flight times are cached by distance, of which there are few distinct ones.
+  """
+
+  def __init__(self, origins, num_galaxies=7, num_systems=499):
+    """Constructor.
+
+    Args:
+      origins: List of coords of the origins.
+      num_galaxies: Num galaxies of the universe.
+      num_systems: Num systems per galaxy.
+    """
+    self.origins = list(origins)
+    self.num_galaxies = num_galaxies
+    self.num_systems = num_systems
+    # rows[i][galaxy - 1][system - 1] is the distance from origin i to a planet
+    # of another system, or of the origin's own system at position 1.
+    self.rows = [[[distance(o, (g, s, 1), num_galaxies, num_systems)
+                   for s in range(1, num_systems + 1)]
+                  for g in range(1, num_galaxies + 1)]
+                 for o in self.origins]
+    self._flight_times = {}
+
+  def distance(self, i, coords):
+    """Return the distance from origin `i` to `coords`."""
+    origin = self.origins[i]
+    if tuple(origin[:2]) == tuple(coords[:2]):
+      return distance(origin, coords, self.num_galaxies, self.num_systems)
+    return self.rows[i][coords[0] - 1][coords[1] - 1]
+
+  def flight_time(self, i, coords, ship_speed, speed_pct=100, fleet_speed=1):
+    """Return the one-way flight time from origin `i` to `coords`."""
+    key = (self.distance(i, coords), ship_speed, speed_pct, fleet_speed)
+    if key not in self._flight_times:
+      self._flight_times[key] = flight_time(*key)
+    return self._flight_times[key]
+
+  def closest(self, coords):
+    """Return the indices of origins, closest to `coords` first."""
+    return sorted(range(len(self.origins)),
+                  key=lambda i: (self.distance(i, coords), i))
+
+  def system_order(self, galaxy):
+    """Return the systems of `galaxy`, closest to any origin first."""
+    rows = [row[galaxy - 1] for row in self.rows]
+    return sorted(range(1, self.num_systems + 1),
+                  key=lambda s: (min(row[s - 1] for row in rows), s))
+
+  def galaxy_order(self):
+    """Return galaxies with an origin, closest to all origins first."""
+    galaxies = sorted(set(o[0] for o in self.origins))
+    return sorted(galaxies, key=lambda g: (sum(
+        min(row[g - 1]) for row in self.rows), g))
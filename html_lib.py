@@ -0,0 +1,134 @@
+"""Minimal DOM to parse page snapshots without a browser."""
+from html.parser import HTMLParser
+
+# Elements that never have content nor closing tag.
+VOID_ELEMENTS = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+    'param', 'source', 'track', 'wbr'])
+
+# Opening one of these elements implicitly closes the listed open elements.
+_IMPLICIT_END = {
+    'li': frozenset(['li']),
+    'option': frozenset(['option']),
+    'p': frozenset(['p']),
+    'td': frozenset(['td', 'th']),
+    'th': frozenset(['td', 'th']),
+    'tr': frozenset(['tr', 'td', 'th']),
+}
+
+
+class Element(object):
+  """An HTML element. Children are either `Element`s or strings."""
+
+  def __init__(self, tag, attrs, parent=None):
+    self.tag = tag
+    self.attrs = attrs
+    self.parent = parent
+    self.children = []
+
+  def __repr__(self):
+    return '<Element {} {}>'.format(self.tag, self.attrs)
+
+  def get(self, name, default=None):
+    """Return an attribute."""
+    return self.attrs.get(name, default)
+
+  @property
+  def classes(self):
+    """List of classes."""
+    return self.attrs.get('class', '').split()
+
+  @property
+  def text(self):
+    """Text content, with whitespace collapsed like a rendered page."""
+    return ' '.join(''.join(self.iter_text()).split())
+
+  def iter_text(self):
+    """Yield all text nodes under this element."""
+    stack = [self]
+    while stack:
+      node = stack.pop()
+      if isinstance(node, str):
+        yield node
+      else:
+        stack.extend(reversed(node.children))
+
+  def iter(self):
+    """Yield all descendant elements in document order."""
+    stack = [c for c in reversed(self.children) if isinstance(c, Element)]
+    while stack:
+      node = stack.pop()
+      yield node
+      stack.extend(
+          c for c in reversed(node.children) if isinstance(c, Element))
+
+  def find_all(self, tag=None, class_=None, id=None, **attrs):
+    """Return descendants matching tag, class, id and attributes."""
+    return [e for e in self.iter() if e.matches(tag, class_, id, **attrs)]
+
+  def find(self, tag=None, class_=None, id=None, **attrs):
+    """Return first descendant matching the filters, or None."""
+    for e in self.iter():
+      if e.matches(tag, class_, id, **attrs):
+        return e
+    return None
+
+  def matches(self, tag=None, class_=None, id=None, **attrs):
+    """Whether this element matches tag, class, id and attributes."""
+    if tag is not None and self.tag != tag:
+      return False
+    if class_ is not None and class_ not in self.classes:
+      return False
+    if id is not None and self.attrs.get('id') != id:
+      return False
+    for name, value in attrs.items():
+      name = name.replace('_', '-')
+      if value is True:
+        if name not in self.attrs:
+          return False
+      elif self.attrs.get(name) != value:
+        return False
+    return True
+
+
+class _TreeBuilder(HTMLParser):
+  """Build an `Element` tree out of HTMLParser events."""
+
+  def __init__(self):
+    super(_TreeBuilder, self).__init__(convert_charrefs=True)
+    self.root = Element('#document', {})
+    self.stack = [self.root]
+
+  def handle_starttag(self, tag, attrs):
+    implicit_end = _IMPLICIT_END.get(tag)
+    if implicit_end and self.stack[-1].tag in implicit_end:
+      self.stack.pop()
+    element = Element(
+        tag, {k: v if v is not None else '' for k, v in attrs},
+        self.stack[-1])
+    self.stack[-1].children.append(element)
+    if tag not in VOID_ELEMENTS:
+      self.stack.append(element)
+
+  def handle_startendtag(self, tag, attrs):
+    self.handle_starttag(tag, attrs)
+    if tag not in VOID_ELEMENTS:
+      self.stack.pop()
+
+  def handle_endtag(self, tag):
+    # Close up to the matching element; ignore stray closing tags.
+    for i in range(len(self.stack) - 1, 0, -1):
+      if self.stack[i].tag == tag:
+        del self.stack[i:]
+        return
+
+  def handle_data(self, data):
+    self.stack[-1].children.append(data)
+
+
+def parse(html):
+  """Parse an HTML string and return the document root `Element`."""
+  builder = _TreeBuilder()
+  builder.feed(html)
+  builder.close()
+  return builder.root
@@ -0,0 +1,49 @@
+"""Util functions to talk to the game over HTTP with the browser's session."""
+import logging
+from urllib import parse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def game_url(b):
+  """Return the URL of the game's index.php from the browser's current URL."""
+  return base_url(b.current_url)
+
+
+def base_url(url):
+  """Return `url` without its query and fragment."""
+  url = parse.urlsplit(url)
+  return parse.urlunsplit((url.scheme, url.netloc, url.path, '', ''))
+
+
+def session_from_browser(b, pool_size=10):
+  """Return a pooled HTTP session logged in with the browser's cookies."""
+  session = requests.Session()
+  adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+  session.mount('http://', adapter)
+  session.mount('https://', adapter)
+  session.headers['User-Agent'] = b.execute_script(
+      'return navigator.userAgent;')
+  session.headers['X-Requested-With'] = 'XMLHttpRequest'
+  for cookie in b.get_cookies():
+    session.cookies.set(cookie['name'], cookie['value'],
+                        domain=cookie.get('domain'), path=cookie.get('path'))
+  logging.info('Copied {} cookies from browser'.format(len(session.cookies)))
+  return session
+
+
+def get_page(session, url, page, timeout=10, **params):
+  """GET an ajax page of the game and return its body."""
+  params = dict(params, page=page, ajax=1)
+  response = session.get(url, params=params, timeout=timeout)
+  response.raise_for_status()
+  return response.text
+
+
+def post_page(session, url, page, data, timeout=10, **params):
+  """POST to an ajax page of the game and return the response."""
+  params = dict(params, page=page, ajax=1)
+  response = session.post(url, params=params, data=data, timeout=timeout)
+  response.raise_for_status()
+  return response
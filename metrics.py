@@ -0,0 +1,206 @@
+"""Opt-in timing of selenium_lib calls and of named phases.
+
+Disabled by default, in which case instrumented functions are called directly.
+Once enabled, records count, time, timeouts and a latency histogram per helper
+and caller location, and per phase. Results are exported as JSON and in the
+Prometheus text format.
+"""
+import atexit
+import collections
+import contextlib
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+
+from selenium.common.exceptions import TimeoutException
+
+# Upper bounds of the latency histogram buckets, in seconds.
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+
+_enabled = False
+_lock = threading.Lock()
+_calls = {}  # (helper, caller) -> _Stats
+_phases = {}  # phase -> _Stats
+_local = threading.local()
+
+
+class _Stats(object):
+  """Count, total time, timeout hits and histogram of some calls."""
+
+  def __init__(self):
+    self.count = 0
+    self.total = 0.
+    self.timeouts = 0
+    self.buckets = [0] * len(BUCKETS)
+
+  def add(self, seconds, timeout=False):
+    self.count += 1
+    self.total += seconds
+    self.timeouts += int(timeout)
+    for i, bound in enumerate(BUCKETS):
+      if seconds <= bound:
+        self.buckets[i] += 1
+        break
+
+  def to_dict(self):
+    return collections.OrderedDict([
+        ('count', self.count),
+        ('total_seconds', self.total),
+        ('timeouts', self.timeouts),
+        ('buckets', collections.OrderedDict(
+            (str(b), n) for b, n in zip(BUCKETS, self.buckets))),
+    ])
+
+
+def enable():
+  global _enabled
+  _enabled = True
+
+
+def enabled():
+  return _enabled
+
+
+def instrumented(fn):
+  """Decorate a selenium_lib helper to record its calls when enabled.
+
+  A call is a timeout hit if it raised `TimeoutException` or lasted its whole
+  `timeout` arg (helpers with `timeout_ok` swallow the exception). Calls made
+  by other instrumented helpers are not recorded on their own.
+  """
+  signature = inspect.signature(fn)
+
+  @functools.wraps(fn)
+  def wrapper(*args, **kwargs):
+    if not _enabled or getattr(_local, 'depth', 0):
+      return fn(*args, **kwargs)
+    frame = inspect.currentframe().f_back
+    caller = '{}:{}'.format(
+        os.path.basename(frame.f_code.co_filename), frame.f_lineno)
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    timeout = bound.arguments.get('timeout')
+
+    _local.depth = 1
+    start = time.time()
+    timed_out = False
+    try:
+      return fn(*args, **kwargs)
+    except TimeoutException:
+      timed_out = True
+      raise
+    finally:
+      _local.depth = 0
+      seconds = time.time() - start
+      timed_out = timed_out or (timeout is not None and seconds >= timeout)
+      with _lock:
+        _calls.setdefault((fn.__name__, caller), _Stats()).add(
+            seconds, timed_out)
+
+  return wrapper
+
+
+@contextlib.contextmanager
+def phase(name):
+  """Time a named phase, e.g. `with metrics.phase('login'):`."""
+  if not _enabled:
+    yield
+    return
+  start = time.time()
+  try:
+    yield
+  finally:
+    seconds = time.time() - start
+    with _lock:
+      _phases.setdefault(name, _Stats()).add(seconds)
+
+
+def to_dict():
+  """Return all metrics as a JSON-serializable dict."""
+  with _lock:
+    return collections.OrderedDict([
+        ('calls', [collections.OrderedDict(
+            [('helper', helper), ('caller', caller)] +
+            list(stats.to_dict().items()))
+                   for (helper, caller), stats in sorted(
+                       _calls.items(), key=lambda x: -x[1].total)]),
+        ('phases', collections.OrderedDict(
+            (name, stats.to_dict()) for name, stats in sorted(
+                _phases.items(), key=lambda x: -x[1].total))),
+    ])
+
+
+def to_prometheus():
+  """Return all metrics in the Prometheus text format."""
+  lines = []
+
+  def histogram(metric, labels, stats):
+    for bound, num in zip(BUCKETS, _cumulative(stats.buckets)):
+      le = '+Inf' if bound == float('inf') else repr(float(bound))
+      lines.append('{}_bucket{{{},le="{}"}} {}'.format(metric, labels, le, num))
+    lines.append('{}_sum{{{}}} {}'.format(metric, labels, stats.total))
+    lines.append('{}_count{{{}}} {}'.format(metric, labels, stats.count))
+
+  with _lock:
+    lines.append('# TYPE bogame_selenium_call_seconds histogram')
+    for (helper, caller), stats in sorted(_calls.items()):
+      histogram('bogame_selenium_call_seconds', _labels(
+          helper=helper, caller=caller), stats)
+    lines.append('# TYPE bogame_selenium_call_timeouts_total counter')
+    for (helper, caller), stats in sorted(_calls.items()):
+      lines.append('bogame_selenium_call_timeouts_total{{{}}} {}'.format(
+          _labels(helper=helper, caller=caller), stats.timeouts))
+    lines.append('# TYPE bogame_phase_seconds histogram')
+    for name, stats in sorted(_phases.items()):
+      histogram('bogame_phase_seconds', _labels(phase=name), stats)
+  return '\n'.join(lines) + '\n'
+
+
+def _cumulative(buckets):
+  total = 0
+  for num in buckets:
+    total += num
+    yield total
+
+
+def _labels(**labels):
+  return ','.join('{}="{}"'.format(k, str(v).replace('"', '\\"'))
+                  for k, v in sorted(labels.items()))
+
+
+def write(json_path=None, prometheus_path=None):
+  """Write metrics to the given files."""
+  if json_path:
+    _write_atomic(json_path, json.dumps(to_dict(), indent=2))
+  if prometheus_path:
+    _write_atomic(prometheus_path, to_prometheus())
+
+
+def _write_atomic(path, content):
+  """Write a file so that readers never see it half written."""
+  tmp = path + '.tmp'
+  with open(tmp, 'w') as f:
+    f.write(content)
+  os.replace(tmp, path)
+
+
+def start(json_path=None, prometheus_path=None, interval=None):
+  """Enable metrics and write them at exit, and every `interval` seconds."""
+  enable()
+  atexit.register(write, json_path, prometheus_path)
+  logging.info('Recording metrics to {}'.format(
+      ', '.join(p for p in (json_path, prometheus_path) if p)))
+  if interval:
+
+    def loop():
+      while True:
+        time.sleep(interval)
+        write(json_path, prometheus_path)
+
+    thread = threading.Thread(target=loop)
+    thread.daemon = True
+    thread.start()
@@ -0,0 +1,749 @@
+"""Local stand-in for the game server, serving a synthetic universe.
+
+Serves the login page, account list and the game pages the bot uses
+(overview, galaxy, messages, fleet dispatch and event list), with the ids and
+classes the bot looks for. Everything is deterministic given the seed.
+
+Example:
+
+  python3 mock_server.py --port=8080 --num_players=10000
+
+The login page is then at http://localhost:8080/ (pass it as --server_url).
+With --smtp_port, emails can also be sent to a local SMTP stand-in.
+"""
+import argparse
+import collections
+import html
+import json
+import logging
+import random
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib import parse
+
+import common
+
+Player = collections.namedtuple('Player', ['id', 'name', 'rank', 'status'])
+
+Planet = collections.namedtuple('Planet', ['name', 'player'])
+
+# A planet of the account; `ships` is a dict of ship ID -> count.
+OwnPlanet = collections.namedtuple('OwnPlanet', ['id', 'name', 'coords',
+                                                 'ships'])
+
+# A fleet of the account in flight.
+Fleet = collections.namedtuple('Fleet', ['id', 'mission', 'origin', 'coords',
+                                         'ships', 'arrival_time',
+                                         'return_time'])
+
+# A fleet of another player attacking the account.
+HostileFleet = collections.namedtuple('HostileFleet', ['id', 'origin', 'coords',
+                                                       'arrival_time'])
+
+Message = collections.namedtuple('Message', ['id', 'date', 'coords', 'name',
+                                             'resources', 'fleet_pts',
+                                             'defense_pts'])
+
+# Classes of the player name cell for each status.
+STATUS_CLASSES = collections.OrderedDict([
+    ('normal', ['normal']),
+    ('inactive', ['inactive', 'tooltipRel']),
+    ('longinactive', ['longinactive', 'tooltipRel']),
+    ('honorable', ['honorableTarget', 'tooltipRel']),
+    ('strong', ['stronghonorableTarget', 'tooltipRel']),
+    ('noob', ['noob', 'tooltipRel']),
+    ('vacation', ['vacation', 'tooltipRel']),
+    ('banned', ['banned', 'tooltipRel']),
+])
+
+_STATUS_WEIGHTS = [50, 20, 10, 5, 5, 4, 5, 1]
+
+# Status letters of the public players.xml for each status.
+API_STATUSES = {'inactive': 'i', 'longinactive': 'I', 'vacation': 'v',
+                'banned': 'b'}
+
+# Ships of each planet of the account.
+_SHIPS = collections.OrderedDict([(202, 50), (203, 100), (210, 50)])
+
+# Mission types.
+ATTACK = 1
+ESPIONAGE = 6
+
+MESSAGES_PER_PAGE = 10
+
+UNIVERSE_NAME = 'Mockiverse'
+
+
+class Universe(object):
+  """Deterministic synthetic universe and the state of one account."""
+
+  def __init__(self, seed=0, num_galaxies=7, num_systems=499, num_players=1000,
+               planets_per_player=3, num_own_planets=3, num_reports=50,
+               flight_time=5):
+    self.num_galaxies = num_galaxies
+    self.num_systems = num_systems
+    self.flight_time = flight_time
+    self.lock = threading.Lock()
+    rng = random.Random(seed)
+
+    ranks = list(range(1, num_players + 1))
+    rng.shuffle(ranks)
+    statuses = rng.choices(
+        list(STATUS_CLASSES), weights=_STATUS_WEIGHTS, k=num_players)
+    self.players = [
+        Player(100000 + i, 'Player{}'.format(i), rank, status)
+        for i, (rank, status) in enumerate(zip(ranks, statuses))]
+
+    self.planets = {}
+    num_slots = num_galaxies * num_systems * 15
+    num_planets = min(num_players * planets_per_player + num_own_planets,
+                      num_slots)
+    slots = rng.sample(range(num_slots), num_planets)
+    coords = [(slot // (num_systems * 15) + 1,
+               slot // 15 % num_systems + 1,
+               slot % 15 + 1) for slot in slots]
+    for i, c in enumerate(coords[num_own_planets:]):
+      player = self.players[i % num_players]
+      self.planets[c] = Planet('Colony {}'.format(i), player)
+
+    # Our account.
+    self.own_planets = [
+        OwnPlanet(33620000 + i, 'Homeworld' if i == 0 else 'Colony',
+                  c, dict(_SHIPS))
+        for i, c in enumerate(coords[:num_own_planets])]
+    self.current_planet = 0
+    self.fleets = []
+    self.hostile_fleets = []
+    self.messages = []
+    self.last_id = 0
+    targets = sorted(self.planets)
+    for i in range(num_reports):
+      self.add_report(rng.choice(targets),
+                      date=time.time() - (num_reports - i) * 60)
+
+  def next_id(self):
+    self.last_id += 1
+    return self.last_id
+
+  def system(self, galaxy, system):
+    """Return the 15 positions of a system as (position, planet or None)."""
+    return [(p, self.planets.get((galaxy, system, p))) for p in range(1, 16)]
+
+  def planet_info(self, coords):
+    """Return deterministic (resources, fleet pts, defense pts) of a planet."""
+    rng = random.Random('{}:{}:{}'.format(*coords))
+    resources = [rng.randint(0, 2000000), rng.randint(0, 1000000),
+                 rng.randint(0, 300000)]
+    fleet_pts = rng.choice([0, 0, 0, rng.randint(1, 100000)])
+    defense_pts = rng.choice([0, 0, rng.randint(1, 100000)])
+    return resources, fleet_pts, defense_pts
+
+  def add_report(self, coords, date=None):
+    """Add a probe report about `coords` to the messages."""
+    resources, fleet_pts, defense_pts = self.planet_info(coords)
+    planet = self.planets.get(coords)
+    self.messages.insert(0, Message(
+        self.next_id(), time.time() if date is None else date, coords,
+        planet.name if planet else 'Planet', resources, fleet_pts,
+        defense_pts))
+
+  def active_fleets(self, now=None):
+    """Return fleets in flight, and bring back ships of returned ones."""
+    now = time.time() if now is None else now
+    with self.lock:
+      for fleet in [f for f in self.fleets if f.return_time <= now]:
+        self.fleets.remove(fleet)
+        ships = self.own_planets[fleet.origin].ships
+        for ship_id, num in fleet.ships.items():
+          ships[ship_id] += num
+      return list(self.fleets)
+
+  def add_attack(self, delay=600, planet_num=0):
+    """Send a hostile fleet to one of our planets, arriving in `delay`s."""
+    with self.lock:
+      origin = sorted(self.planets)[self.next_id() % len(self.planets)]
+      fleet = HostileFleet(self.next_id(), origin,
+                           self.own_planets[planet_num].coords,
+                           time.time() + delay)
+      self.hostile_fleets.append(fleet)
+      return fleet
+
+  def active_attacks(self, now=None):
+    """Return hostile fleets that have not arrived yet."""
+    now = time.time() if now is None else now
+    with self.lock:
+      self.hostile_fleets = [
+          f for f in self.hostile_fleets if f.arrival_time > now]
+      return list(self.hostile_fleets)
+
+  @property
+  def slots_used(self):
+    return len(self.active_fleets())
+
+  def send_fleet(self, mission, coords, ships, planet_num=None):
+    """Send a fleet from the current planet; return it or None if impossible."""
+    self.active_fleets()
+    with self.lock:
+      planet_num = self.current_planet if planet_num is None else planet_num
+      available = self.own_planets[planet_num].ships
+      ships = {s: n for s, n in ships.items() if n > 0}
+      if not ships or any(available.get(s, 0) < n for s, n in ships.items()):
+        return None
+      for ship_id, num in ships.items():
+        available[ship_id] -= num
+      now = time.time()
+      fleet = Fleet(self.next_id(), mission, planet_num, coords, ships,
+                    now + self.flight_time, now + 2 * self.flight_time)
+      self.fleets.append(fleet)
+      if mission == ESPIONAGE:
+        self.add_report(coords)
+      return fleet
+
+
+def galaxy_html(universe, galaxy, system):
+  """Render the galaxy table of a system like the game does."""
+  rows = []
+  for position, planet in universe.system(galaxy, system):
+    if planet is None:
+      rows.append(
+          '<tr class="row empty_filter">'
+          '<td class="position js_no_action">{}</td>'
+          '<td class="planetname"></td>'
+          '<td class="playername"></td>'
+          '<td class="action"></td></tr>'.format(position))
+      continue
+    player = planet.player
+    rows.append(
+        '<tr class="row">'
+        '<td class="position js_no_action">{position}</td>'
+        '<td class="planetname">{planet}</td>'
+        '<td class="playername {classes}">'
+        '<a href="javascript:void(0);" rel="player{id}">'
+        '<span class="status_abbr_{status}">{name}</span></a>'
+        '<div id="player{id}" class="htmlTooltip" style="display: none;">'
+        '<h1>Player: <span>{name}</span></h1>'
+        '<ul class="ListLinks"><li class="rank">Rank: '
+        '<a href="#">{rank}</a></li></ul></div></td>'
+        '<td class="action"><a href="javascript:void(0);" class="espionage" '
+        'onclick="sendShips(6,{galaxy},{system},{position},1,1);">'
+        '<span class="icon icon_eye"></span></a></td></tr>'.format(
+            position=position, planet=html.escape(planet.name),
+            classes=' '.join(STATUS_CLASSES[player.status]), id=player.id,
+            status=player.status, name=html.escape(player.name),
+            rank=player.rank, galaxy=galaxy, system=system))
+  return (
+      '<table id="galaxytable" data-galaxy="{}" data-system="{}"><tbody>{}'
+      '</tbody><tfoot><tr><td>Slots: <span id="slotUsed">{}</span></td></tr>'
+      '</tfoot></table>'.format(
+          galaxy, system, ''.join(rows), universe.slots_used))
+
+
+def messages_html(universe, page):
+  """Render a page of probe reports like the game does."""
+  num_pages = max(1, -(-len(universe.messages) // MESSAGES_PER_PAGE))
+  page = min(max(page, 1), num_pages)
+  start = (page - 1) * MESSAGES_PER_PAGE
+  msgs = []
+  for msg in universe.messages[start:start + MESSAGES_PER_PAGE]:
+    metal, crystal, deuterium = msg.resources
+    msgs.append(
+        '<li class="msg " data-msg-id="{id}"><div class="msg_head">'
+        '<span class="msg_title blue_txt"><a class="txt_link" href="#">'
+        '{name} [{g}:{s}:{p}]</a></span>'
+        '<span class="msg_date fright">{date}</span></div>'
+        '<span class="msg_content">'
+        '<div class="compacting"><span class="ctn ctn4">Activity: 0</span>'
+        '</div><div class="compacting">'
+        '<span class="resspan">Metal: {metal}</span>'
+        '<span class="resspan">Crystal: {crystal}</span>'
+        '<span class="resspan">Deuterium: {deuterium}</span></div>'
+        '<div class="compacting">'
+        '<span class="ctn ctn4 tooltipLeft">Fleets: {fleet}</span>'
+        '<span class="ctn ctn4 fright tooltipRight">Defense: {defense}</span>'
+        '</div></span></li>'.format(
+            id=msg.id, name=html.escape(msg.name), g=msg.coords[0],
+            s=msg.coords[1], p=msg.coords[2],
+            date=time.strftime('%d.%m.%Y %H:%M:%S', time.localtime(msg.date)),
+            metal=_number(metal), crystal=_number(crystal),
+            deuterium=_number(deuterium), fleet=_number(msg.fleet_pts),
+            defense=_number(msg.defense_pts)))
+
+  def li(label, target):
+    return ('<li class="p_li" onclick="location.href=\'index.php?page=messages'
+            '&p={}\'"><a href="#">{}</a></li>'.format(target, label))
+
+  pagination = (
+      '<ul class="pagination">{}{}<li class="curPage">{}/{}</li>{}{}</ul>'
+      .format(li('|&lt;&lt;', 1), li('&lt;', page - 1), page, num_pages,
+              li('&gt;', page + 1), li('&gt;&gt;|', num_pages)))
+  return '<ul class="tab_inner">{}</ul>{}'.format(''.join(msgs), pagination)
+
+
+def event_list_html(universe):
+  """Render the fleet movements of the event list."""
+  rows = []
+  for fleet in universe.active_fleets():
+    for return_flight, arrival_time in [('false', fleet.arrival_time),
+                                        ('true', fleet.return_time)]:
+      rows.append(
+          '<tr class="eventFleet" id="eventRow-{}" data-mission-type="{}" '
+          'data-return-flight="{}" data-arrival-time="{}">'
+          '<td class="countDown"><span class="friendly">{}s</span></td>'
+          '<td class="coordsOrigin">[{}:{}:{}]</td>'
+          '<td class="destCoords">[{}:{}:{}]</td></tr>'.format(
+              fleet.id, fleet.mission, return_flight, int(arrival_time),
+              int(arrival_time - time.time()),
+              *(universe.own_planets[fleet.origin].coords + fleet.coords)))
+  for fleet in universe.active_attacks():
+    rows.append(
+        '<tr class="eventFleet" id="eventRow-{}" data-mission-type="{}" '
+        'data-return-flight="false" data-arrival-time="{}">'
+        '<td class="countDown"><span class="hostile">{}s</span></td>'
+        '<td class="coordsOrigin">[{}:{}:{}]</td>'
+        '<td class="destCoords">[{}:{}:{}]</td></tr>'.format(
+            fleet.id, ATTACK, int(fleet.arrival_time),
+            int(fleet.arrival_time - time.time()),
+            *(fleet.origin + fleet.coords)))
+  return '<table id="eventContent"><tbody>{}</tbody></table>'.format(
+      ''.join(rows))
+
+
+def _number(n):
+  """Format numbers like the game, e.g. 1.234.567."""
+  return '{:,}'.format(n).replace(',', '.')
+
+
+_GALAXY_JS = """
+function loadContent() {
+  var g = document.getElementById('galaxy_input');
+  var s = document.getElementById('system_input');
+  var loading = document.createElement('div');
+  loading.id = 'galaxyLoading';
+  document.body.appendChild(loading);
+  var xhr = new XMLHttpRequest();
+  xhr.open('POST', 'index.php?page=galaxyContent&ajax=1');
+  xhr.setRequestHeader('Content-Type', 'application/x-www-form-urlencoded');
+  xhr.onload = function() {
+    document.getElementById('galaxyContent').innerHTML =
+        JSON.parse(xhr.responseText).galaxy;
+    loading.parentNode.removeChild(loading);
+  };
+  xhr.send('galaxy=' + g.value + '&system=' + s.value);
+}
+function sendShips(mission, galaxy, system, position, type, count) {
+  var xhr = new XMLHttpRequest();
+  xhr.open('POST', 'index.php?page=minifleet&ajax=1');
+  xhr.setRequestHeader('Content-Type', 'application/x-www-form-urlencoded');
+  xhr.onload = function() {
+    var slots = document.getElementById('slotUsed');
+    if (JSON.parse(xhr.responseText).response.success && slots) {
+      slots.textContent = parseInt(slots.textContent) + 1;
+    }
+  };
+  xhr.send('mission=' + mission + '&galaxy=' + galaxy + '&system=' + system +
+           '&position=' + position + '&type=' + type + '&shipCount=' + count);
+}
+"""
+
+
+class Handler(BaseHTTPRequestHandler):
+  """Serve pages of `self.server.universe`."""
+
+  def do_GET(self):
+    self._route(parse.parse_qs(parse.urlsplit(self.path).query))
+
+  def do_POST(self):
+    length = int(self.headers.get('Content-Length', 0))
+    params = parse.parse_qs(parse.urlsplit(self.path).query)
+    params.update(parse.parse_qs(self.rfile.read(length).decode()))
+    self._route(params)
+
+  @property
+  def universe(self):
+    return self.server.universe
+
+  def _route(self, params):
+    params = {k: v[-1] for k, v in params.items()}
+    path = parse.urlsplit(self.path).path
+    if path in ('/', '/index.html'):
+      return self._send(200, _LOGIN_HTML)
+    if path == '/accounts':
+      return self._send(200, _ACCOUNTS_HTML.format(name=UNIVERSE_NAME))
+    if path.startswith('/assets/'):
+      return self._send_asset(path[len('/assets/'):])
+    if path.startswith('/api/'):
+      return self._send_api(path[len('/api/'):])
+    if path != '/game/index.php':
+      return self._send(404, 'Not found')
+
+    if 'cp' in params:
+      for i, planet in enumerate(self.universe.own_planets):
+        if str(planet.id) == params['cp']:
+          self.universe.current_planet = i
+    page = params.get('page', 'overview')
+    handler = getattr(self, '_page_' + page, None)
+    if handler is None:
+      return self._send(404, 'Unknown page {}'.format(page))
+    handler(params)
+
+  def _page_overview(self, params):
+    self._send_layout('overview', '<div id="overviewcomponent"></div>')
+
+  def _page_galaxy(self, params):
+    galaxy, system, _ = self._current_coords()
+    self._send_layout('galaxy', (
+        '<div id="galaxyHeader">'
+        '<input id="galaxy_input" value="{g}" onfocus="this.value=\'\'">'
+        '<input id="system_input" value="{s}" onfocus="this.value=\'\'">'
+        '<a class="btn_blue" href="javascript:void(0);" '
+        'onclick="loadContent();">Go</a></div>'
+        '<div id="galaxyContent">{content}</div>'
+        '<script>{js}</script>').format(
+            g=galaxy, s=system, content=galaxy_html(
+                self.universe, galaxy, system), js=_GALAXY_JS))
+
+  def _page_galaxyContent(self, params):
+    try:
+      galaxy, system = int(params['galaxy']), int(params['system'])
+    except (KeyError, ValueError):
+      return self._send(400, 'Missing galaxy or system')
+    self._send_json({'galaxy': galaxy_html(self.universe, galaxy, system)})
+
+  def _page_minifleet(self, params):
+    try:
+      coords = (int(params['galaxy']), int(params['system']),
+                int(params['position']))
+      count = int(params.get('shipCount', 1))
+      mission = int(params.get('mission', ESPIONAGE))
+    except (KeyError, ValueError):
+      return self._send(400, 'Missing coords')
+    fleet = self.universe.send_fleet(mission, coords, {210: count})
+    self._send_json({'response': {'success': fleet is not None}})
+
+  def _page_messages(self, params):
+    self._send_layout('messages', messages_html(
+        self.universe, int(params.get('p', 1))))
+
+  def _page_eventList(self, params):
+    self._send(200, event_list_html(self.universe))
+
+  def _page_fleet1(self, params):
+    self.universe.active_fleets()
+    ships = self.universe.own_planets[self.universe.current_planet].ships
+    buttons = ''.join(
+        '<div id="button{id}"><span class="level">{num}</span>'
+        '<input class="fleetValues" name="am{id}" type="text"></div>'.format(
+            id=ship_id, num=num) for ship_id, num in ships.items() if num)
+    self._send_layout('fleet1', (
+        '<form id="shipsChosen" method="post" action="index.php?page=fleet2">'
+        '{}<a id="continue" href="javascript:void(0);" '
+        'onclick="document.getElementById(\'shipsChosen\').submit();">'
+        'Continue</a></form>').format(buttons))
+
+  def _page_fleet2(self, params):
+    galaxy, system, position = self._current_coords()
+    hidden = self._hidden_ships(params)
+    submit_on_enter = (
+        'onkeydown="if (event.keyCode == 13) this.form.submit();"')
+    self._send_layout('fleet2', (
+        '<form method="post" action="index.php?page=fleet3">{hidden}'
+        '<input id="galaxy" name="galaxy" value="{g}" {enter}>'
+        '<input id="system" name="system" value="{s}" {enter}>'
+        '<input id="position" name="position" value="{p}" {enter}>'
+        '</form>').format(hidden=hidden, g=galaxy, s=system, p=position,
+                          enter=submit_on_enter))
+
+  def _page_fleet3(self, params):
+    hidden = self._hidden_ships(params) + ''.join(
+        '<input type="hidden" name="{}" value="{}">'.format(k, params.get(k))
+        for k in ('galaxy', 'system', 'position'))
+    self._send_layout('fleet3', (
+        '<form id="sendFleet" method="post" action="index.php?page=movement">'
+        '{}<input type="hidden" id="mission" name="mission" value="0">'
+        '<a id="missionButton1" href="javascript:void(0);" onclick="'
+        'document.getElementById(\'mission\').value = 1;">Attack</a>'
+        '<a id="start" href="javascript:void(0);" onclick="'
+        'document.getElementById(\'sendFleet\').submit();">Send</a>'
+        '</form>').format(hidden))
+
+  def _page_movement(self, params):
+    if 'mission' in params:
+      try:
+        coords = (int(params['galaxy']), int(params['system']),
+                  int(params['position']))
+        ships = {int(k[2:]): int(v or 0) for k, v in params.items()
+                 if k.startswith('am')}
+        fleet = self.universe.send_fleet(int(params['mission']), coords, ships)
+      except (KeyError, ValueError):
+        return self._send(400, 'Invalid fleet')
+      if fleet is None:
+        # Like the game, go back to the fleet page with an error.
+        return self._send_layout('fleet1', (
+            '<div id="fleetStatusBar" class="error">'
+            'Not enough ships</div>'))
+    self._send_layout('movement', '<div id="movements">{}</div>'.format(
+        event_list_html(self.universe)))
+
+  def _current_coords(self):
+    return self.universe.own_planets[self.universe.current_planet].coords
+
+  def _hidden_ships(self, params):
+    return ''.join('<input type="hidden" name="{}" value="{}">'.format(k, v)
+                   for k, v in params.items() if k.startswith('am'))
+
+  def _send_layout(self, page, content):
+    planets = ''.join(
+        '<div class="smallplanet" id="planet-{id}">'
+        '<a class="planetlink" href="index.php?page={page}&cp={id}">'
+        '<span class="planet-name">{name}</span>'
+        '<span class="planet-koords">[{g}:{s}:{p}]</span></a></div>'.format(
+            id=planet.id, page=page, name=planet.name, g=planet.coords[0],
+            s=planet.coords[1], p=planet.coords[2])
+        for planet in self.universe.own_planets)
+    menu = ''.join(
+        '<li><a class="menubutton" href="index.php?page={}">{}</a></li>'.format(
+            target, target)
+        for target in ['overview'] * 7 + ['fleet1', 'galaxy', 'overview'])
+    self._send(200, _LAYOUT_HTML.format(
+        alert='soon' if self.universe.active_attacks() else 'noAttack',
+        planets=planets, menu=menu, content=content))
+
+  def _send_asset(self, name):
+    """Send art, fonts and ads of the given size, after some latency."""
+    if name not in ASSETS:
+      return self._send(404, 'Not found')
+    content_type, size_kb = ASSETS[name]
+    time.sleep(self.server.asset_latency)
+    if content_type.endswith('javascript'):
+      body = _AD_JS
+    else:
+      body = 'x' * (size_kb * 1024)
+    self._send(200, body, content_type)
+
+  def _send_api(self, name):
+    """Send a public data file of the universe."""
+    universe = self.universe
+    if name == 'players.xml':
+      body = '<players serverId="mock">{}</players>'.format(''.join(
+          '<player id="{}" name="{}" status="{}"/>'.format(
+              p.id, p.name, API_STATUSES.get(p.status, ''))
+          for p in universe.players))
+    elif name == 'highscore.xml':
+      body = '<highscore category="1" type="0">{}</highscore>'.format(
+          ''.join('<player position="{}" id="{}" score="0"/>'.format(
+              p.rank, p.id) for p in universe.players))
+    elif name == 'universe.xml':
+      body = '<universe serverId="mock">{}</universe>'.format(''.join(
+          '<planet id="{}" player="{}" name="{}" coords="{}:{}:{}"/>'.format(
+              i, planet.player.id, planet.name, *coords)
+          for i, (coords, planet) in enumerate(sorted(
+              universe.planets.items()))))
+    elif name == 'serverData.xml':
+      body = ('<serverData serverId="mock"><name>{}</name>'
+              '<galaxies>{}</galaxies><systems>{}</systems>'
+              '<speedFleet>1</speedFleet></serverData>').format(
+                  UNIVERSE_NAME, universe.num_galaxies, universe.num_systems)
+    else:
+      return self._send(404, 'Not found')
+    self._send(200, body, 'text/xml; charset=utf-8')
+
+  def _send_json(self, obj):
+    self._send(200, json.dumps(obj), 'application/json')
+
+  def _send(self, code, body, content_type='text/html; charset=utf-8'):
+    body = body.encode()
+    self.send_response(code)
+    self.send_header('Content-Type', content_type)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, fmt, *args):
+    logging.debug(fmt, *args)
+
+
+_LOGIN_HTML = """<!DOCTYPE html>
+<html><body>
+<div class="openX_int_closeButton">
+<a href="javascript:void(0);" onclick="this.parentNode.style.display='none';"
+>Close</a></div>
+<a id="ui-id-1" href="javascript:void(0);">Login</a>
+<form action="/accounts" method="get">
+<input id="usernameLogin" name="email" type="text">
+<input id="passwordLogin" name="password" type="password">
+<button id="loginSubmit" type="submit">Login</button>
+</form>
+</body></html>
+"""
+
+_ACCOUNTS_HTML = """<!DOCTYPE html>
+<html><body>
+<div id="accountlist"><div class="rt-table"><div class="rt-tbody">
+<div class="rt-tr"><div class="server-name-cell">{name}</div>
+<button onclick="window.open('/game/index.php?page=overview');">Play</button>
+</div></div></div></div>
+</body></html>
+"""
+
+# Name -> (content type, size in KB) of the art, fonts and ads of the pages.
+ASSETS = collections.OrderedDict([
+    ('style.css', ('text/css', 0)),
+    ('font.woff2', ('font/woff2', 100)),
+    ('background.jpg', ('image/jpeg', 500)),
+    ('planet.png', ('image/png', 50)),
+    ('openx/ad.js', ('application/javascript', 0)),
+    ('openx/banner.jpg', ('image/jpeg', 200)),
+])
+
+_AD_JS = """
+var banner = new Image();
+banner.src = '/assets/openx/banner.jpg?' + Date.now();
+document.body.appendChild(banner);
+"""
+
+_LAYOUT_HTML = """<!DOCTYPE html>
+<html><head>
+<style>
+@font-face {{font-family: Game; src: url(/assets/font.woff2);}}
+body {{font-family: Game; background: url(/assets/background.jpg);}}
+</style>
+<link rel="stylesheet" href="/assets/style.css">
+</head><body>
+<img src="/assets/planet.png"><img src="/assets/planet.png?2">
+<script src="/assets/openx/ad.js"></script>
+<div id="attack_alert" class="tooltip {alert}"></div>
+<span id="playerName">Player: <span class="textBeefy">Bot</span></span>
+<a class="messages" href="index.php?page=messages">Messages</a>
+<ul id="links">{menu}</ul>
+<div id="planetList">{planets}</div>
+<div id="contentWrapper">{content}</div>
+</body></html>
+"""
+
+
+def serve(universe, host='localhost', port=0, asset_latency=0.05):
+  """Start serving `universe` in a background thread and return the server.
+
+  Art, fonts and ads of the pages are served after `asset_latency` seconds.
+
+  The port is picked automatically when `port` is 0; it can be read from
+  `server.server_address`. Stop the server with `server.shutdown()`.
+  """
+  server = ThreadingHTTPServer((host, port), Handler)
+  server.daemon_threads = True
+  server.universe = universe
+  server.asset_latency = asset_latency
+  thread = threading.Thread(target=server.serve_forever)
+  thread.daemon = True
+  thread.start()
+  logging.info('Serving mock game at http://{}:{}/'.format(
+      *server.server_address))
+  return server
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+  """Accept emails without TLS, and any credentials, into `server.messages`."""
+
+  def handle(self):
+    self._reply('220 localhost mock SMTP')
+    data = None
+    while True:
+      line = self.rfile.readline()
+      if not line:
+        return
+      line = line.decode('utf-8', 'replace').rstrip('\r\n')
+      if data is not None:
+        if line == '.':
+          with self.server.lock:
+            self.server.messages.append('\n'.join(data))
+          logging.info('Received email of {} lines'.format(len(data)))
+          data = None
+          self._reply('250 OK')
+        else:
+          data.append(line[1:] if line.startswith('.') else line)
+        continue
+      command = line.split(' ', 1)[0].upper()
+      if command == 'EHLO':
+        self._reply('250-localhost', '250 AUTH PLAIN LOGIN')
+      elif command == 'AUTH':
+        self._reply('235 Authenticated')
+      elif command == 'DATA':
+        data = []
+        self._reply('354 End data with <CR><LF>.<CR><LF>')
+      elif command == 'QUIT':
+        self._reply('221 Bye')
+        return
+      elif command in ('HELO', 'MAIL', 'RCPT', 'RSET', 'NOOP'):
+        self._reply('250 OK')
+      else:
+        self._reply('502 Not implemented')
+
+  def _reply(self, *lines):
+    self.wfile.write(''.join(l + '\r\n' for l in lines).encode())
+
+
+def serve_smtp(host='localhost', port=0):
+  """Start an SMTP stand-in in a background thread and return the server.
+
+  Received emails are in `server.messages`, as raw strings.
+  """
+  server = socketserver.ThreadingTCPServer((host, port), SmtpHandler)
+  server.daemon_threads = True
+  server.lock = threading.Lock()
+  server.messages = []
+  thread = threading.Thread(target=server.serve_forever)
+  thread.daemon = True
+  thread.start()
+  logging.info('Serving mock SMTP at {}:{}'.format(*server.server_address))
+  return server
+
+
+def server_url(server):
+  """Return the URL of the login page of a server started by `serve`."""
+  return 'http://{}:{}/'.format(*server.server_address)
+
+
+def main():
+  arg_parser = argparse.ArgumentParser()
+  arg_parser.add_argument('--host', type=str, default='localhost')
+  arg_parser.add_argument('--port', type=int, default=8080)
+  arg_parser.add_argument('--seed', type=int, default=0)
+  arg_parser.add_argument('--num_galaxies', type=int, default=7)
+  arg_parser.add_argument('--num_systems', type=int, default=499)
+  arg_parser.add_argument('--num_players', type=int, default=1000)
+  arg_parser.add_argument('--num_reports', type=int, default=50)
+  arg_parser.add_argument('--flight_time', type=float, default=5,
+                          help='One-way flight time of all fleets in seconds')
+  arg_parser.add_argument('--smtp_port', type=int,
+                          help='If present, also serve SMTP on this port, '
+                          'without TLS (see --smtp_plaintext of '
+                          'attack_alert.py)')
+  arg_parser.add_argument('--attack_every', type=float,
+                          help='If present, send a hostile fleet every N '
+                          'seconds')
+  arg_parser.add_argument('-v', '--verbose', type=bool,
+                          default=False, help='Verbose output')
+  args = arg_parser.parse_args()
+
+  common.setup_logging(args)
+  universe = Universe(args.seed, args.num_galaxies, args.num_systems,
+                      args.num_players, num_reports=args.num_reports,
+                      flight_time=args.flight_time)
+  server = serve(universe, args.host, args.port)
+  if args.smtp_port:
+    serve_smtp(args.host, args.smtp_port)
+  try:
+    while True:
+      time.sleep(args.attack_every or 3600)
+      if args.attack_every:
+        logging.info('Sending hostile fleet {}'.format(
+            universe.add_attack().id))
+  except KeyboardInterrupt:
+    server.shutdown()
+
+
+if __name__ == '__main__':
+  main()
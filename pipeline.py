@@ -0,0 +1,263 @@
+"""Scan, read reports and raid continuously, as concurrent stages.
+
+The scan sends probes with the browser as `scan.py` does. Meanwhile, new probe
+reports are read from the messages over HTTP as they arrive, and undefended
+targets are raided right away, also over HTTP. Probes and raids share the fleet
+slots (--parallelism); raids waiting for a slot hold off new probes.
+
+Example:
+
+  python3 pipeline.py -c=<country> -u=<email> -p=<password> \\
+    --rank_min=1000 --rank_max=2000 --parallelism=10 --max_scans=100 \\
+    --num_attacks=20 --backend=http --verbose=true
+"""
+import itertools
+import logging
+import queue
+import sys
+import threading
+import time
+
+import common
+import daemon_client
+import dispatch
+import fleet_inventory
+import html_lib
+import http_lib
+import planner
+import report_parser
+import report_store
+import scan
+import slot_scheduler
+
+
+class SharedBudget(scan.ScanBudget):
+  """Fleet slots shared by probes and raids.
+
+  Counts all missions of the galaxy page, not only probes, and all fleets sent
+  in `num_sent`, while `num_probes` counts probes for --max_scans. Slots
+  wanted by raids are not given to probes.
+  """
+
+  def __init__(self, max_scans, fleet_slots):
+    super(SharedBudget, self).__init__(max_scans, fleet_slots)
+    self.initial_num_missions.value = 0
+    self.initial_num_returns.value = 0
+    self.num_probes = 0
+    self.num_pending_raids = 0
+
+  def done(self):
+    return self.num_probes >= self.max_scans
+
+  def num_allowed(self, num_ongoing_missions, num_sent_at_load):
+    return min(
+        self.num_free(num_ongoing_missions, num_sent_at_load) -
+        self.num_pending_raids,
+        self.max_scans - self.num_probes)
+
+  def num_free(self, num_ongoing_missions, num_sent_at_load):
+    """Num free slots. Must be called with `lock` held."""
+    num_sent_since_load = self.num_sent.value - num_sent_at_load
+    return self.parallelism - num_ongoing_missions - num_sent_since_load
+
+  def add_sent(self, num):
+    super(SharedBudget, self).add_sent(num)
+    self.num_probes += num
+
+  def add_raids(self, num):
+    """Record `num` raids sent. Must be called with `lock` held."""
+    self.num_sent.value += num
+
+
+class Pipeline(object):
+  """Scan, ingest and attack stages, each in its own thread."""
+
+  def __init__(self, b, args):
+    self.b = b
+    self.args = args
+    self.url = http_lib.game_url(b)
+    # Sessions are not shared across threads.
+    self.ingest_session = http_lib.session_from_browser(b)
+    self.attack_session = http_lib.session_from_browser(b)
+    self.budget = SharedBudget(args.max_scans, args.parallelism)
+    self.reports = queue.Queue()  # new `Report`s, then None when done
+    self.scan_done = threading.Event()
+    self.raided = set()  # coords raided during the run
+
+  def run(self):
+    """Run all stages until the scan is done and its reports are handled."""
+    stages = [self.scan_stage, self.ingest_stage, self.attack_stage]
+    # Threads are named after the thread running the pipeline, to which the
+    # browser daemon forwards their logs.
+    parent = threading.current_thread().name
+    threads = [threading.Thread(target=self._run_stage, args=(stage,),
+                                name='{}/{}'.format(parent, stage.__name__))
+               for stage in stages]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    logging.info('Sent {} probes and {} raids'.format(
+        self.budget.num_probes, len(self.raided)))
+
+  def _run_stage(self, stage):
+    try:
+      stage()
+    except Exception:
+      logging.exception('Stage {} failed'.format(stage.__name__))
+      # Let the other stages finish.
+      self.scan_done.set()
+      self.reports.put(None)
+
+  def scan_stage(self):
+    """Send probes with the browser."""
+    try:
+      scan.scan(self.b, self.args, self.budget)
+    finally:
+      self.scan_done.set()
+
+  def ingest_stage(self):
+    """Read new probe reports and queue them for the attack stage."""
+    store = None
+    if self.args.store:
+      store = report_store.ReportStore(self.args.store)
+    # Reports already in the inbox predate the run.
+    seen = set(r.msg_id for r in self.fetch_new_reports(set(), max_pages=1))
+    logging.info('Ignoring {} reports already there'.format(len(seen)))
+    drain_until = None
+    while drain_until is None or time.time() < drain_until:
+      time.sleep(self.args.ingest_interval)
+      try:
+        reports = self.fetch_new_reports(seen)
+      except IOError as e:
+        logging.warn('Could not read messages: {}'.format(e))
+        continue
+      seen.update(r.msg_id for r in reports)
+      if store is not None:
+        store.add(reports)
+      for report in reports:
+        self.reports.put(report)
+      if reports:
+        logging.info('Queued {} new reports'.format(len(reports)))
+      if drain_until is None and self.scan_done.is_set():
+        # Wait for the last probes to report back.
+        drain_until = time.time() + self.args.drain
+    self.reports.put(None)
+
+  def fetch_new_reports(self, seen, max_pages=None):
+    """Return reports not in `seen`, newest first, paging until a seen one."""
+    reports = []
+    for page in itertools.islice(itertools.count(1), max_pages):
+      # The game pages messages with `p`, 20 is the tab of probe reports.
+      doc = html_lib.parse(http_lib.get_page(
+          self.ingest_session, self.url, 'messages', tab=20, p=page))
+      page_reports = report_parser.parse_messages(doc)
+      new_reports = [r for r in page_reports if r.msg_id not in seen]
+      reports.extend(new_reports)
+      pagination = report_parser.parse_pagination(doc)
+      if (len(new_reports) < len(page_reports) or not page_reports or
+          not pagination or pagination[0] >= pagination[1]):
+        break
+    return reports
+
+  def attack_stage(self):
+    """Raid undefended targets of new reports as they arrive."""
+    args = self.args
+    inventory, inventory_time = None, 0
+    done = False
+    while not done and len(self.raided) < args.num_attacks:
+      # Take all reports queued so far, waiting for at least one.
+      reports = [self.reports.get()]
+      while True:
+        try:
+          reports.append(self.reports.get_nowait())
+        except queue.Empty:
+          break
+      done = None in reports
+      targets = [(r.coords, r.planet_info) for r in reports
+                 if r is not None and r.coords not in self.raided]
+      if not targets:
+        continue
+
+      if time.time() - inventory_time > args.inventory_ttl:
+        # Ships come back from earlier raids, so read them again sometimes.
+        inventory = fleet_inventory.from_session(self.attack_session, self.url)
+        inventory_time = time.time()
+      raids = planner.plan(targets, inventory.origins(),
+                           args.num_attacks - len(self.raided), args)
+      logging.info('{} raids out of {} new reports'.format(
+          len(raids), len(targets)))
+      if raids:
+        self.send_raids(raids, inventory)
+
+  def send_raids(self, raids, inventory):
+    """Send raids as fleet slots free up, holding off probes meanwhile."""
+    budget = self.budget
+    while raids:
+      num_sent_at_load = budget.num_sent.value
+      num_ongoing = slot_scheduler.count_fleets_in_flight(http_lib.get_page(
+          self.attack_session, self.url, 'eventList'))
+      with budget.lock:
+        num_free = budget.num_free(num_ongoing, num_sent_at_load)
+        budget.num_pending_raids = max(0, len(raids) - num_free)
+        batch, raids = raids[:max(0, num_free)], raids[max(0, num_free):]
+        for planet_num, group in dispatch.by_origin(batch):
+          results = dispatch.send_http(
+              self.attack_session, self.url, inventory.planet_ids[planet_num],
+              group)
+          for raid, ok in zip(group, results):
+            if ok:
+              inventory.dispatched(planet_num, raid.ships)
+              self.raided.add(raid.coords)
+              budget.add_raids(1)
+              logging.info('Raided {} with {} from planet #{}'.format(
+                  raid.coords, raid.ships, planet_num))
+      if raids:
+        logging.info('{} raids waiting for a fleet slot'.format(len(raids)))
+        time.sleep(self.args.ingest_interval)
+
+
+def build_arg_parser():
+  """Return the parser of command-line args."""
+  arg_parser = scan.build_arg_parser()
+  arg_parser.description = (
+      'Scan, read reports and raid continuously. --parallelism is the num '
+      'fleet slots shared by probes and raids.')
+
+  arg_parser.add_argument('--num_attacks', type=int, required=True,
+                          help='Max num of raids')
+  arg_parser.add_argument('--ingest_interval', type=float, default=10,
+                          help='Seconds between reads of new reports')
+  arg_parser.add_argument(
+      '--drain', type=float, default=120,
+      help='Seconds to keep reading reports once the scan is done')
+  arg_parser.add_argument(
+      '--inventory_ttl', type=float, default=300,
+      help='Seconds after which ships are counted again before raiding')
+  arg_parser.add_argument(
+      '--store', type=str,
+      help='If present, SQLite file where new reports are also stored')
+
+  return arg_parser
+
+
+def main():
+  arg_parser = build_arg_parser()
+  args = arg_parser.parse_args()
+  if args.shards > 1:
+    arg_parser.error('--shards is not supported by the pipeline')
+  if args.browser_daemon:
+    sys.exit(daemon_client.submit(args.browser_daemon, 'pipeline',
+                                  sys.argv[1:]))
+
+  common.setup_logging(args)
+  common.setup_metrics(args)
+  b = common.open_browser_and_connect(args)
+  try:
+    Pipeline(b, args).run()
+  finally:
+    b.quit()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,120 @@
+"""Plan raids: which planet attacks which target with which cargos."""
+import collections
+import heapq
+import itertools
+import logging
+import math
+
+import geometry
+
+# Cargo capacity by ship ID, largest first.
+CAPACITY = collections.OrderedDict([
+    (geometry.LARGE_CARGO, 25000),
+    (geometry.SMALL_CARGO, 5000),
+])
+
+# Share of a planet's resources that can be plundered.
+PLUNDER_RATIO = 0.5
+
+# A planet of ours and its ships, as a dict of ship ID -> count.
+Origin = collections.namedtuple('Origin', ['coords', 'ships'])
+
+Raid = collections.namedtuple(
+    'Raid', ['coords', 'planet_num', 'ships', 'plunder', 'flight_time'])
+
+
+def compose_fleet(loot, ships):
+  """Pick cargos to carry `loot` out of available `ships`, largest first.
+
+  Returns:
+    Dict of ship ID -> count, possibly not enough to carry everything.
+  """
+  fleet = {}
+  for ship_id, capacity in CAPACITY.items():
+    if loot <= 0:
+      break
+    num = min(ships.get(ship_id, 0), int(math.ceil(loot / float(capacity))))
+    if num > 0:
+      fleet[ship_id] = num
+      loot -= num * capacity
+  return fleet
+
+
+def _option(target, loot, origin, ships, args):
+  """Return (resources per fleet-hour, fleet, plunder, flight time) or None."""
+  fleet = compose_fleet(loot, ships)
+  if not fleet:
+    return None
+  plunder = min(loot, sum(CAPACITY[s] * n for s, n in fleet.items()))
+  speed = min(geometry.SHIP_SPEED[s] for s in fleet)
+  duration = geometry.flight_time(
+      geometry.distance(origin, target, args.num_galaxies, args.num_systems),
+      speed, fleet_speed=args.fleet_speed)
+  return plunder * 3600. / (2 * duration), fleet, plunder, duration
+
+
+def plan(reports, origins, max_raids, args):
+  """Assign cargos of our planets to undefended targets.
+
+  Raids are picked greedily by resources brought back per hour of fleet slot
+  (round trip), recomputing a raid's fleet when an earlier raid used some of
+  the ships it relied on. Origins and targets without coords are skipped.
+
+  Args:
+    reports: List of (`Coords`, `PlanetInfo`).
+    origins: Dict of planet num -> `Origin`.
+    max_raids: Max num of raids.
+    args: Command-line args with universe geometry (num_galaxies, num_systems,
+      fleet_speed).
+
+  Returns:
+    List of `Raid`s, best first.
+  """
+  for planet_num, origin in origins.items():
+    if origin.coords is None:
+      logging.warn('Not raiding from planet #{}: unknown coords'.format(
+          planet_num))
+  origins = {p: o for p, o in origins.items() if o.coords is not None}
+  available = {p: dict(o.ships) for p, o in origins.items()}
+  loots = {}
+  heap = []
+  counter = itertools.count()  # breaks ties in the heap
+  for coords, planet_info in reports:
+    if coords is None:
+      logging.warn('Not raiding target of a report without coords: {}'.format(
+          planet_info))
+      continue
+    # Skip planets with defense.
+    if planet_info.fleet_pts > 0 or planet_info.defense_pts > 0:
+      continue
+    loot = int(PLUNDER_RATIO * (
+        planet_info.metal + planet_info.crystal + planet_info.deuterium))
+    if loot <= 0 or coords in loots:
+      continue
+    loots[coords] = loot
+    for planet_num, origin in origins.items():
+      option = _option(coords, loot, origin.coords, available[planet_num], args)
+      if option:
+        heapq.heappush(
+            heap, (-option[0], next(counter), coords, planet_num, option[1]))
+
+  raids = []
+  while heap and len(raids) < max_raids:
+    _, _, coords, planet_num, fleet = heapq.heappop(heap)
+    if coords not in loots:
+      continue  # already raided
+    option = _option(coords, loots[coords], origins[planet_num].coords,
+                     available[planet_num], args)
+    if not option:
+      continue
+    rate, new_fleet, plunder, duration = option
+    if new_fleet != fleet:
+      # Ships were used by another raid in the meantime.
+      heapq.heappush(
+          heap, (-rate, next(counter), coords, planet_num, new_fleet))
+      continue
+    for ship_id, num in fleet.items():
+      available[planet_num][ship_id] -= num
+    del loots[coords]
+    raids.append(Raid(coords, planet_num, fleet, plunder, duration))
+  return raids
@@ -0,0 +1,32 @@
+"""Tests of planner.py."""
+import argparse
+import unittest
+
+import geometry
+import planner
+from report_parser import Coords
+from report_parser import PlanetInfo
+
+_ARGS = argparse.Namespace(num_galaxies=7, num_systems=499, fleet_speed=1)
+
+
+class PlanTest(unittest.TestCase):
+
+  def test_skips_origins_and_targets_without_coords(self):
+    origins = {
+        0: planner.Origin(None, {geometry.LARGE_CARGO: 10}),
+        1: planner.Origin(Coords(1, 100, 8), {geometry.LARGE_CARGO: 10}),
+    }
+    reports = [
+        (None, PlanetInfo(500000, 0, 0, 0, 0)),
+        (Coords(1, 101, 4), PlanetInfo(100000, 0, 0, 0, 0)),
+    ]
+    with self.assertLogs(level='WARNING') as logs:
+      raids = planner.plan(reports, origins, 10, _ARGS)
+    self.assertEqual([(r.coords, r.planet_num, r.ships) for r in raids],
+                     [(Coords(1, 101, 4), 1, {geometry.LARGE_CARGO: 2})])
+    self.assertEqual(len(logs.output), 2)
+
+
+if __name__ == '__main__':
+  unittest.main()
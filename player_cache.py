@@ -0,0 +1,94 @@
+"""Cache of players seen in the galaxy, to skip reading their ranks again."""
+import collections
+import logging
+import sqlite3
+import time
+
+Player = collections.namedtuple(
+    'Player', ['player_id', 'name', 'rank', 'classes'])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+  player_id TEXT PRIMARY KEY,
+  name TEXT,
+  rank INTEGER NOT NULL,
+  classes TEXT,
+  last_seen REAL NOT NULL
+);
+"""
+
+
+class PlayerCache(object):
+  """Players by ID, kept in memory and optionally in a SQLite file.
+
+  Only players with a rank are cached. Classes (inactive, vacation, etc.) are
+  kept for reference, but those of the galaxy page are more recent.
+  """
+
+  def __init__(self, path=None, ttl=None):
+    """Constructor.
+
+    Args:
+      path: If present, SQLite file to load players from and save them to.
+      ttl: Seconds after which players on disk are read again, or None to
+        always use them.
+    """
+    self.players = {}
+    self.db = None
+    if path:
+      self.db = sqlite3.connect(path, timeout=30)
+      self.db.executescript(_SCHEMA)
+      min_seen = time.time() - ttl if ttl is not None else 0
+      for player_id, name, rank, classes in self.db.execute(
+          'SELECT player_id, name, rank, classes FROM players '
+          'WHERE last_seen >= ?', (min_seen,)):
+        self.players[player_id] = Player(player_id, name, rank,
+                                         classes.split())
+      logging.info('Loaded {} players from {}'.format(len(self.players), path))
+
+  def __len__(self):
+    return len(self.players)
+
+  def __contains__(self, player_id):
+    return player_id in self.players
+
+  def close(self):
+    if self.db is not None:
+      self.db.close()
+
+  def rank(self, player_id):
+    """Return the rank of a player, or None if unknown."""
+    player = self.players.get(player_id)
+    return player.rank if player else None
+
+  def known_ids(self):
+    """Return the IDs of all cached players."""
+    return list(self.players)
+
+  def add(self, players):
+    """Cache `Player`s in memory only, e.g. from the universe data files."""
+    for player in players:
+      self.players.setdefault(player.player_id, player)
+
+  def fill(self, rows):
+    """Return `galaxy_parser.SystemRow`s with missing ranks from the cache."""
+    return [row._replace(rank=self.rank(row.player_id))
+            if not row.rank and row.player_id in self.players else row
+            for row in rows]
+
+  def update(self, rows):
+    """Cache the players of `galaxy_parser.SystemRow`s that have a rank."""
+    new = {}
+    for row in rows:
+      if row.player_id and row.rank:
+        player = Player(row.player_id, row.player_name, row.rank, row.classes)
+        if self.players.get(row.player_id) != player:
+          new[row.player_id] = player
+    self.players.update(new)
+    if self.db is not None and new:
+      now = time.time()
+      with self.db:
+        self.db.executemany(
+            'INSERT OR REPLACE INTO players VALUES (?, ?, ?, ?, ?)',
+            [(p.player_id, p.name, p.rank, ' '.join(p.classes), now)
+             for p in new.values()])
@@ -0,0 +1,168 @@
+"""Write probe reports to a file as they are parsed.
+
+Rows are flushed after each page of messages, so the file can be read while
+reports are still being gathered. Formats:
+
+  - csv: one row per report, with a header.
+  - ndjson: one JSON object per line.
+  - parquet: one row group per page (requires pyarrow).
+
+CSV and NDJSON files can be appended to and compressed with gzip, bz2 or xz.
+Appending to a compressed file adds a new stream to it, which readers like
+zcat handle. Only gzip is flushed after each page; bz2 and xz files are
+complete once closed.
+"""
+import bz2
+import collections
+import csv
+import gzip
+import io
+import json
+import logging
+import lzma
+import os
+
+try:
+  import pyarrow
+  import pyarrow.parquet
+except ImportError:
+  pyarrow = None
+
+from report_parser import Coords
+from report_parser import PlanetInfo
+
+COLUMNS = ('msg_id', 'timestamp') + Coords._fields + PlanetInfo._fields
+
+FORMATS = ('csv', 'ndjson', 'parquet')
+
+COMPRESSIONS = collections.OrderedDict([
+    ('gzip', '.gz'),
+    ('bz2', '.bz2'),
+    ('xz', '.xz'),
+])
+
+_OPENERS = {
+    None: open,
+    'gzip': gzip.open,
+    'bz2': bz2.open,
+    'xz': lzma.open,
+}
+
+
+def infer_format(path):
+  """Return (format, compression) from the extensions of `path`."""
+  compression = None
+  root, ext = os.path.splitext(path)
+  for name, suffix in COMPRESSIONS.items():
+    if ext == suffix:
+      compression = name
+      root, ext = os.path.splitext(root)
+  fmt = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson',
+         '.parquet': 'parquet'}.get(ext)
+  return fmt, compression
+
+
+def to_row(report):
+  """Return the values of a `Report` in `COLUMNS` order."""
+  return ((report.msg_id, report.timestamp) + tuple(report.coords) +
+          tuple(report.planet_info))
+
+
+class _TextWriter(object):
+  """Base class of line-oriented writers."""
+
+  def __init__(self, path, append=False, compression=None):
+    self.path = path
+    is_new = not (append and os.path.exists(path) and os.path.getsize(path))
+    self.f = io.TextIOWrapper(
+        _OPENERS[compression](path, 'ab' if append else 'wb'),
+        encoding='utf-8', newline='')
+    self.start(is_new)
+
+  def start(self, is_new):
+    pass
+
+  def flush(self):
+    self.f.flush()
+
+  def close(self):
+    self.f.close()
+
+
+class CsvWriter(_TextWriter):
+
+  def start(self, is_new):
+    self.writer = csv.writer(self.f)
+    if is_new:
+      self.writer.writerow(COLUMNS)
+
+  def write(self, report):
+    self.writer.writerow(to_row(report))
+
+
+class NdjsonWriter(_TextWriter):
+
+  def write(self, report):
+    self.f.write(json.dumps(collections.OrderedDict(
+        zip(COLUMNS, to_row(report)))) + '\n')
+
+
+class ParquetWriter(object):
+  """Buffer reports and write them as a row group on each flush."""
+
+  def __init__(self, path, append=False, compression=None):
+    if pyarrow is None:
+      raise ValueError('Writing Parquet requires pyarrow')
+    if append:
+      raise ValueError('Parquet files cannot be appended to')
+    self.schema = pyarrow.schema(
+        [('msg_id', pyarrow.string()), ('timestamp', pyarrow.float64())] +
+        [(c, pyarrow.int64()) for c in Coords._fields + PlanetInfo._fields])
+    self.writer = pyarrow.parquet.ParquetWriter(
+        path, self.schema, compression=compression or 'snappy')
+    self.rows = []
+
+  def write(self, report):
+    self.rows.append(to_row(report))
+
+  def flush(self):
+    if not self.rows:
+      return
+    columns = list(zip(*self.rows))
+    self.writer.write_table(pyarrow.Table.from_arrays(
+        [pyarrow.array(c, type=f.type) for c, f in zip(columns, self.schema)],
+        schema=self.schema))
+    self.rows = []
+
+  def close(self):
+    self.flush()
+    self.writer.close()
+
+
+def open_writer(path, fmt=None, append=False, compression=None):
+  """Open a writer of reports.
+
+  Args:
+    path: Output file.
+    fmt: One of `FORMATS`; inferred from the extension of `path` if None.
+    append: Whether to append to an existing file.
+    compression: One of `COMPRESSIONS` (for Parquet, any codec pyarrow
+      supports); inferred from the extension of `path` if None.
+
+  Returns:
+    Writer with `write(report)`, `flush()` and `close()` methods.
+  """
+  inferred_fmt, inferred_compression = infer_format(path)
+  fmt = fmt or inferred_fmt
+  compression = compression or inferred_compression
+  writers = {'csv': CsvWriter, 'ndjson': NdjsonWriter,
+             'parquet': ParquetWriter}
+  if fmt not in writers:
+    raise ValueError('Unknown export format for {}; use one of {}'.format(
+        path, ', '.join(FORMATS)))
+  if fmt != 'parquet' and compression not in _OPENERS:
+    raise ValueError('Unknown compression {}; use one of {}'.format(
+        compression, ', '.join(COMPRESSIONS)))
+  logging.info('Exporting reports to {} ({}{})'.format(
+      path, fmt, ', ' + compression if compression else ''))
+  return writers[fmt](path, append=append, compression=compression)
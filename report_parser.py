@@ -0,0 +1,180 @@
+"""Parse probe reports out of a snapshot of the messages page.
+
+Runs without a browser, so it can be benchmarked on saved pages:
+
+  python3 report_parser.py messages_page1.html messages_page2.html
+"""
+import collections
+import logging
+import re
+import sys
+import time
+
+import html_lib
+
+Coords = collections.namedtuple('Coords', ['galaxy', 'system', 'position'])
+
+PlanetInfo = collections.namedtuple(
+    'PlanetInfo', ['metal', 'crystal', 'deuterium', 'fleet_pts', 'defense_pts'])
+
+Report = collections.namedtuple(
+    'Report', ['msg_id', 'timestamp', 'coords', 'planet_info'])
+
+# Format of message dates, e.g. "17.10.2018 12:34:56".
+DATE_FORMAT = '%d.%m.%Y %H:%M:%S'
+
+_COORDS_RE = re.compile(r'\[(\d+):(\d+):(\d+)\]')
+_NUMBER_RE = re.compile(r'(-?[\d.,\' ]*\d)\s*([a-zA-Z]*)$')
+_MULTIPLIERS = {
+    '': 1,
+    'k': 10**3,
+    'm': 10**6, 'mn': 10**6, 'mio': 10**6,
+    'b': 10**9, 'bn': 10**9, 'g': 10**9, 'md': 10**9, 'mrd': 10**9,
+}
+
+
+def parse_number(f):
+  """Parse numbers like 123.456, 1,234M or 2.5Bn.
+
+  Without a suffix, dots, commas, apostrophes and spaces are thousand
+  separators. With a suffix, the last dot or comma is the decimal separator.
+
+  Raises:
+    ValueError: if `f` is not a number.
+  """
+  m = _NUMBER_RE.search(f.replace('\xa0', ' ').strip())
+  if not m:
+    raise ValueError('Could not parse number: {!r}'.format(f))
+  digits, suffix = m.group(1).replace(' ', '').replace("'", ''), m.group(2)
+  multiplier = _MULTIPLIERS.get(suffix.lower())
+  if multiplier is None:
+    raise ValueError('Unknown suffix in number: {!r}'.format(f))
+  if multiplier == 1:
+    return int(digits.replace('.', '').replace(',', ''))
+  sep = max(digits.rfind('.'), digits.rfind(','))
+  if sep >= 0:
+    digits = (digits[:sep].replace('.', '').replace(',', '') + '.' +
+              digits[sep + 1:])
+  return int(round(float(digits) * multiplier))
+
+
+def parse_numbers(fs):
+  """Parse a sequence of numbers (see `parse_number`)."""
+  return [parse_number(f) for f in fs]
+
+
+def parse_coords(f):
+  """Parse coords in texts like "Planet [1:234:5]", or None if there are none."""
+  m = _COORDS_RE.search(f)
+  return Coords(*map(int, m.groups())) if m else None
+
+
+def parse_date(f):
+  """Parse a message date into a Unix timestamp, or None if it is invalid."""
+  try:
+    return time.mktime(time.strptime(f.strip(), DATE_FORMAT))
+  except ValueError:
+    return None
+
+
+def _value(element):
+  """Return the number at the end of texts like "Metal: 1.234"."""
+  return element.text.split(' ')[-1]
+
+
+def parse_report(msg):
+  """Parse one `.msg` element into a `Report`, or None if not a probe report."""
+  msg_id = msg.get('data-msg-id')
+
+  # Parse resources.
+  resspans = msg.find_all(class_='resspan')
+  if len(resspans) != 3:
+    logging.warn('Skipping message: could not parse resources')
+    return None
+
+  # Parse fleet info.
+  compactings = msg.find_all(class_='compacting')
+  counts = compactings[-1].find_all(class_='ctn') if compactings else []
+  if len(counts) != 2:
+    logging.warn('Skipping message: could not parse fleet info')
+    return None
+
+  try:
+    metal, crystal, deuterium, fleet_pts, defense_pts = parse_numbers(
+        [_value(e) for e in resspans + counts])
+  except ValueError as e:
+    logging.warn('Skipping message: {}'.format(e))
+    return None
+
+  # Parse target coords from the message title.
+  title = msg.find(class_='msg_title')
+  links = title.find_all('a') if title is not None else []
+  if len(links) != 1:
+    logging.warn('Skipping message: could not parse message title')
+    return None
+  # Text is of the form "<planet name> [galaxy:system:position]"
+  coords = parse_coords(links[0].text)
+  if not coords:
+    logging.warn('Skipping message: could not parse coords')
+    return None
+
+  date = msg.find(class_='msg_date')
+  timestamp = parse_date(date.text) if date is not None else None
+
+  return Report(
+      msg_id, timestamp, coords,
+      PlanetInfo(metal, crystal, deuterium, fleet_pts, defense_pts))
+
+
+def parse_messages(html):
+  """Parse all probe reports in a messages page snapshot.
+
+  Args:
+    html: (str or html_lib.Element) Page source, or already parsed document.
+
+  Returns:
+    List of `Report`s in page order. Messages that are not probe reports are
+    skipped.
+  """
+  doc = html_lib.parse(html) if isinstance(html, str) else html
+  reports = []
+  for msg in doc.find_all(class_='msg'):
+    report = parse_report(msg)
+    if report is not None:
+      reports.append(report)
+  return reports
+
+
+def parse_message_ids(html):
+  """Return the `data-msg-id` of all messages in page order."""
+  doc = html_lib.parse(html) if isinstance(html, str) else html
+  return [msg.get('data-msg-id') for msg in doc.find_all(class_='msg')]
+
+
+def parse_pagination(html):
+  """Return (current page, total pages), or None if there is no pagination."""
+  doc = html_lib.parse(html) if isinstance(html, str) else html
+  pagination = doc.find(class_='pagination')
+  lis = pagination.find_all('li') if pagination is not None else []
+  if len(lis) != 5:
+    return None
+  try:
+    cur_page, total_pages = map(int, lis[2].text.split('/'))
+  except ValueError:
+    return None
+  return cur_page, total_pages
+
+
+def main():
+  for path in sys.argv[1:]:
+    with open(path) as f:
+      html = f.read()
+    start = time.time()
+    reports = parse_messages(html)
+    elapsed = time.time() - start
+    print('{}: {} reports in {:.1f}ms ({:,} bytes)'.format(
+        path, len(reports), elapsed * 1000, len(html)))
+
+
+if __name__ == '__main__':
+  main()
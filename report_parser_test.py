@@ -0,0 +1,66 @@
+"""Tests of report_parser.py on a saved messages page."""
+import os
+import time
+import unittest
+
+import report_parser
+from report_parser import Coords
+from report_parser import PlanetInfo
+from report_parser import Report
+
+_TESTDATA = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'testdata')
+
+
+def _read(name):
+  with open(os.path.join(_TESTDATA, name)) as f:
+    return f.read()
+
+
+def _timestamp(*date):
+  return time.mktime(date + (0, 0, -1))
+
+
+class ParseMessagesTest(unittest.TestCase):
+
+  def setUp(self):
+    self.html = _read('messages.html')
+
+  def test_parse_messages(self):
+    # The combat report in between is skipped.
+    with self.assertLogs(level='WARNING'):
+      reports = report_parser.parse_messages(self.html)
+    self.assertEqual(reports, [
+        Report('8312', _timestamp(2018, 10, 17, 12, 34, 56),
+               Coords(1, 101, 4), PlanetInfo(1234567, 2500000, 0, 0, 0)),
+        Report('8309', _timestamp(2018, 10, 17, 12, 29, 3),
+               Coords(1, 101, 7), PlanetInfo(45000, 12300, 1500, 8000,
+                                             1200000)),
+    ])
+
+  def test_parse_message_ids(self):
+    self.assertEqual(report_parser.parse_message_ids(self.html),
+                     ['8312', '8311', '8309'])
+
+  def test_parse_pagination(self):
+    self.assertEqual(report_parser.parse_pagination(self.html), (1, 3))
+
+
+class ParseNumberTest(unittest.TestCase):
+
+  def test_parse_number(self):
+    for text, number in [('1.234.567', 1234567), ('1,234', 1234),
+                         ("12'300", 12300), ('2,5Mn', 2500000),
+                         ('1.5k', 1500), ('3Bn', 3000000000),
+                         ('-42', -42)]:
+      self.assertEqual(report_parser.parse_number(text), number, text)
+
+  def test_invalid_number(self):
+    with self.assertRaises(ValueError):
+      report_parser.parse_number('many')
+    with self.assertRaises(ValueError):
+      report_parser.parse_number('12 parsecs')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,77 @@
+"""On-disk store of probe reports, to gather them incrementally."""
+import logging
+import sqlite3
+import time
+
+from report_parser import Coords
+from report_parser import PlanetInfo
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+  msg_id TEXT PRIMARY KEY,
+  timestamp REAL,
+  galaxy INTEGER NOT NULL,
+  system INTEGER NOT NULL,
+  position INTEGER NOT NULL,
+  metal INTEGER NOT NULL,
+  crystal INTEGER NOT NULL,
+  deuterium INTEGER NOT NULL,
+  fleet_pts INTEGER NOT NULL,
+  defense_pts INTEGER NOT NULL,
+  ingested REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_by_coords
+  ON reports (galaxy, system, position, timestamp);
+"""
+
+
+class ReportStore(object):
+  """SQLite store of `report_parser.Report`s keyed by message ID."""
+
+  def __init__(self, path):
+    self.path = path
+    self.db = sqlite3.connect(path)
+    self.db.executescript(_SCHEMA)
+    logging.info('Opened report store {} ({} reports)'.format(
+        path, len(self)))
+
+  def __len__(self):
+    return self.db.execute('SELECT COUNT(*) FROM reports').fetchone()[0]
+
+  def __contains__(self, msg_id):
+    return self.db.execute('SELECT 1 FROM reports WHERE msg_id = ?',
+                           (msg_id,)).fetchone() is not None
+
+  def close(self):
+    self.db.close()
+
+  def add(self, reports):
+    """Add reports; those already ingested are ignored."""
+    now = time.time()
+    with self.db:
+      self.db.executemany(
+          'INSERT OR IGNORE INTO reports VALUES '
+          '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+          [(r.msg_id, r.timestamp) + tuple(r.coords) + tuple(r.planet_info) +
+           (now,) for r in reports])
+
+  def latest(self, limit=None):
+    """Return the latest report of each planet.
+
+    Args:
+      limit: If present, only return the `limit` most recently probed planets.
+
+    Returns:
+      Dict of `Coords` -> `PlanetInfo`.
+    """
+    # Message IDs increase over time, so they break ties and replace missing
+    # timestamps.
+    query = (
+        'SELECT galaxy, system, position, metal, crystal, deuterium, '
+        "fleet_pts, defense_pts, MAX(printf('%020.3f%020d', "
+        'COALESCE(timestamp, 0), CAST(msg_id AS INTEGER))) AS recency '
+        'FROM reports GROUP BY galaxy, system, position ORDER BY recency DESC')
+    if limit is not None:
+      query += ' LIMIT {:d}'.format(limit)
+    return {Coords(*row[:3]): PlanetInfo(*row[3:8])
+            for row in self.db.execute(query)}
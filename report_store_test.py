@@ -0,0 +1,64 @@
+"""Tests of report_store.py."""
+import os
+import tempfile
+import unittest
+
+import report_store
+from report_parser import Coords
+from report_parser import PlanetInfo
+from report_parser import Report
+
+
+def _report(msg_id, timestamp, coords, metal):
+  return Report(msg_id=msg_id, timestamp=timestamp, coords=coords,
+                planet_info=PlanetInfo(metal, 0, 0, 0, 0))
+
+
+class ReportStoreTest(unittest.TestCase):
+
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.path = os.path.join(tmp.name, 'reports.db')
+    self.store = report_store.ReportStore(self.path)
+    self.addCleanup(self.store.close)
+
+  def test_add_ignores_known_reports(self):
+    self.store.add([_report('1001', 1000., Coords(1, 101, 4), 100)])
+    self.store.add([_report('1001', 1000., Coords(1, 101, 4), 999),
+                    _report('1002', 1100., Coords(1, 102, 5), 200)])
+    self.assertEqual(len(self.store), 2)
+    self.assertIn('1001', self.store)
+    self.assertNotIn('1003', self.store)
+    self.assertEqual(self.store.latest()[Coords(1, 101, 4)].metal, 100)
+
+  def test_latest_report_per_coords(self):
+    self.store.add([
+        _report('1001', 1000., Coords(1, 101, 4), 100),
+        _report('1003', 3000., Coords(1, 101, 4), 300),
+        _report('1002', 2000., Coords(1, 102, 5), 200),
+        # Same time: the higher message ID is the newest.
+        _report('1005', 2000., Coords(1, 102, 5), 250),
+        _report('1004', 2000., Coords(1, 102, 5), 240),
+        # Missing timestamps are older than any other.
+        _report('1006', None, Coords(1, 103, 6), 10),
+        _report('1007', 500., Coords(1, 103, 6), 20),
+    ])
+    self.assertEqual(
+        {coords: info.metal for coords, info in self.store.latest().items()},
+        {Coords(1, 101, 4): 300, Coords(1, 102, 5): 250,
+         Coords(1, 103, 6): 20})
+    # The most recently probed planets first.
+    self.assertEqual(list(self.store.latest(limit=2)),
+                     [Coords(1, 101, 4), Coords(1, 102, 5)])
+
+  def test_reports_persist_across_opens(self):
+    self.store.add([_report('1001', 1000., Coords(1, 101, 4), 100)])
+    self.store.close()
+    store = report_store.ReportStore(self.path)
+    self.addCleanup(store.close)
+    self.assertIn('1001', store)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,261 @@
+"""Run the commands of several accounts and univs on a few browsers.
+
+Jobs are read from a JSON config, e.g.:
+
+  {
+    "workers": 2,
+    "defaults": {"session_dir": "~/.bogame/sessions", "headless": true},
+    "accounts": [
+      {"tld": "fr", "email": "<email>", "password": "<password>",
+       "univ_name": "<univ>", "fleet_slots": 12,
+       "jobs": [
+         {"command": "attack_alert", "every": 10,
+          "args": {"smtp_host": "<host>", "smtp_port": 587, ...}},
+         {"command": "scan", "every": 120,
+          "args": {"rank_min": 1000, "rank_max": 2000, "parallelism": 10,
+                   "max_scans": 100}}]}]
+  }
+
+Args of a job are those of the command's command line, merged with those of
+its account and the defaults. Jobs run once, or every N minutes with "every".
+
+At most "workers" jobs run at a time, each with a browser of its account, so
+that memory and CPU grow with the num workers rather than with the num
+accounts. Jobs of an account run one at a time, except alerts, which run with a
+second browser of the account rather than wait for a scan to finish. Alerts run
+first, then jobs of the accounts with the most free fleet slots, as counted
+after their last job.
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+
+from selenium.common.exceptions import WebDriverException
+
+import attack
+import browser_daemon
+import common
+import scan
+
+# Account keys that are not command-line args.
+_ACCOUNT_KEYS = ('jobs', 'fleet_slots')
+
+
+class Job(object):
+  """A command to run for an account, once or every `every` seconds."""
+
+  def __init__(self, command, args, fleet_slots, every=None):
+    self.command = command
+    self.args = args
+    self.key = browser_daemon.account_key(args)
+    self.fleet_slots = fleet_slots
+    self.every = every
+    self.next_run = 0
+
+  def __str__(self):
+    return '{} for {} ({})'.format(
+        self.command, self.args.email, self.args.univ_name or
+        self.args.univ_num)
+
+
+def to_argv(options):
+  """Return command-line args from a dict of option name -> value."""
+  argv = []
+  for name, value in sorted(options.items()):
+    if value is None:
+      continue
+    if isinstance(value, bool):
+      # Flags are parsed with bool(), which is only False for ''.
+      value = 'true' if value else ''
+    argv.append('--{}={}'.format(name, value))
+  return argv
+
+
+def load_jobs(config):
+  """Return the `Job`s of a config dict.
+
+  Raises:
+    ValueError: if the args of a job are invalid.
+  """
+  jobs = []
+  for account in config['accounts']:
+    for spec in account['jobs']:
+      options = dict(config.get('defaults', {}))
+      options.update((k, v) for k, v in account.items()
+                     if k not in _ACCOUNT_KEYS)
+      options.update(spec.get('args', {}))
+      command = spec['command']
+      if command not in browser_daemon.COMMANDS:
+        raise ValueError('Unknown command {}'.format(command))
+      arg_parser = browser_daemon.COMMANDS[command][0]()
+      try:
+        args = arg_parser.parse_args(to_argv(options))
+        if command == 'attack':
+          attack.validate_args(arg_parser, args)
+      except SystemExit:
+        raise ValueError('Invalid args for {} of {}'.format(
+            command, account.get('email')))
+      if getattr(args, 'shards', 1) > 1 or getattr(args, 'daemon', False):
+        raise ValueError('{} of {} would open its own browsers'.format(
+            command, account.get('email')))
+      if args.metrics_json or args.metrics_prom:
+        raise ValueError('Metrics of {} of {} would not be recorded'.format(
+            command, account.get('email')))
+      if command == 'attack_alert' and args.profile_dir:
+        raise ValueError('attack_alert of {} runs alongside other jobs, which '
+                         'cannot share --profile_dir'.format(
+                             account.get('email')))
+      fleet_slots = account.get('fleet_slots') or getattr(
+          args, 'parallelism', 1)
+      every = spec.get('every')
+      jobs.append(Job(command, args, fleet_slots,
+                      every * 60 if every else None))
+  return jobs
+
+
+class Runner(object):
+  """Run `Job`s with a bounded num of workers sharing a `BrowserPool`."""
+
+  def __init__(self, jobs, pool, num_workers):
+    self.jobs = list(jobs)
+    self.pool = pool
+    self.num_workers = num_workers
+    self.cond = threading.Condition()
+    self.busy = set()  # `lane`s of running jobs
+    self.free_slots = {}  # account key -> free fleet slots after last job
+
+  def run(self):
+    """Run jobs until none is left, i.e. forever if some are periodic."""
+    workers = [threading.Thread(target=self._work, name='worker{}'.format(i))
+               for i in range(self.num_workers)]
+    for worker in workers:
+      # Let interrupts exit while jobs run.
+      worker.daemon = True
+      worker.start()
+    for worker in workers:
+      worker.join()
+
+  def lane(self, job):
+    """Return the lane of a job, in which jobs run one at a time.
+
+    Alerts of an account have their own lane, so as not to wait for scans.
+    """
+    return job.key, job.command == 'attack_alert'
+
+  def priority(self, job):
+    """Return the priority of a job, higher first."""
+    free_slots = self.free_slots.get(job.key, job.fleet_slots)
+    return (job.command == 'attack_alert', free_slots, -job.next_run)
+
+  def next_job(self):
+    """Wait for the job to run next and return it, or None if none is left."""
+    with self.cond:
+      while True:
+        if not self.jobs:
+          return None
+        now = time.time()
+        ready = [j for j in self.jobs
+                 if self.lane(j) not in self.busy and j.next_run <= now]
+        if ready:
+          job = max(ready, key=self.priority)
+          self.jobs.remove(job)
+          self.busy.add(self.lane(job))
+          return job
+        waiting = [j.next_run for j in self.jobs
+                   if self.lane(j) not in self.busy]
+        self.cond.wait(max(min(waiting) - now, 0.1) if waiting else None)
+
+  def _work(self):
+    while True:
+      job = self.next_job()
+      if job is None:
+        return
+      try:
+        self.run_job(job)
+      finally:
+        with self.cond:
+          self.busy.discard(self.lane(job))
+          if job.every:
+            job.next_run = time.time() + job.every
+            self.jobs.append(job)
+          self.cond.notify_all()
+
+  def run_job(self, job):
+    """Run a job with a browser of its account."""
+    logging.info('Running {}'.format(job))
+    run = browser_daemon.COMMANDS[job.command][1]
+    try:
+      browser = self.pool.acquire(job.args)
+    except Exception:
+      logging.exception('Could not open a browser for {}'.format(job))
+      return
+    healthy = True
+    try:
+      run(browser.b, job.args)
+    except WebDriverException:
+      healthy = False
+      logging.exception('{} failed'.format(job))
+    except Exception:
+      logging.exception('{} failed'.format(job))
+    finally:
+      if healthy:
+        self._count_free_slots(job, browser.b)
+      self.pool.release(browser, healthy)
+    logging.info('Done with {}'.format(job))
+
+  def _count_free_slots(self, job, b):
+    try:
+      num_missions = scan.count_missions(b)
+    except Exception:
+      num_missions = None
+    if num_missions is None:
+      logging.warn('Could not count missions of {}'.format(job.args.email))
+      return
+    with self.cond:
+      self.free_slots[job.key] = job.fleet_slots - num_missions
+    logging.info('{} has {} free fleet slots'.format(
+        job.args.email, self.free_slots[job.key]))
+
+
+def main():
+  arg_parser = argparse.ArgumentParser(description=(
+      'Run the commands of several accounts and univs on a few browsers.'))
+  arg_parser.add_argument('--config', type=str, required=True,
+                          help='JSON file of accounts and their jobs')
+  arg_parser.add_argument('--max_browser_age', type=float, default=60,
+                          help='Minutes after which browsers are restarted')
+  arg_parser.add_argument(
+      '--max_browser_mb', type=float, default=1000,
+      help='Restart browsers using more memory (0 to never restart)')
+  arg_parser.add_argument('-v', '--verbose', type=bool,
+                          default=False, help='Verbose output')
+  args = arg_parser.parse_args()
+
+  with open(args.config) as f:
+    config = json.load(f)
+  try:
+    jobs = load_jobs(config)
+  except (KeyError, ValueError) as e:
+    arg_parser.error('Invalid config {}: {}'.format(args.config, e))
+
+  common.setup_logging(args)
+  num_workers = config.get('workers', 1)
+  logging.info('Running {} jobs with {} workers'.format(len(jobs),
+                                                        num_workers))
+  # A browser per worker at most: idle browsers of other accounts are closed
+  # to make room. Accounts have a second browser for alerts.
+  pool = browser_daemon.BrowserPool(
+      browsers_per_account=2, max_browsers=num_workers,
+      max_age=args.max_browser_age * 60, max_mb=args.max_browser_mb)
+
+  pool.start_reaper()
+  try:
+    Runner(jobs, pool, num_workers).run()
+  finally:
+    pool.close()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,44 @@
+"""Tests of the scheduling of runner.py, without browsers."""
+import unittest
+
+import browser_daemon
+import runner
+
+
+def _config(**account):
+  account = dict({
+      'tld': 'fr', 'email': 'a@b.c', 'password': 'pwd', 'univ_name': 'Alpha',
+      'fleet_slots': 12,
+      'jobs': [
+          {'command': 'attack_alert', 'every': 10,
+           'args': {'smtp_host': 'localhost', 'smtp_port': 587,
+                    'smtp_user': 'me', 'smtp_password': 'pwd',
+                    'email_to': 'you'}},
+          {'command': 'scan', 'every': 120,
+           'args': {'rank_min': 1000, 'rank_max': 2000, 'parallelism': 10,
+                    'max_scans': 100}}]}, **account)
+  return {'accounts': [account]}
+
+
+class RunnerTest(unittest.TestCase):
+
+  def test_alerts_do_not_wait_for_other_jobs_of_the_account(self):
+    alert, scan = runner.load_jobs(_config())
+    r = runner.Runner([scan], pool=None, num_workers=2)
+    self.assertIs(r.next_job(), scan)
+    r.jobs.append(alert)
+    self.assertIs(r.next_job(), alert)
+
+  def test_jobs_of_an_account_share_its_key(self):
+    alert, scan = runner.load_jobs(_config())
+    alert.args.headless = not scan.args.headless
+    self.assertEqual(browser_daemon.account_key(alert.args), scan.key)
+    self.assertEqual(alert.key, scan.key)
+
+  def test_alerts_cannot_share_a_profile_dir(self):
+    with self.assertRaises(ValueError):
+      runner.load_jobs(_config(profile_dir='/tmp/profile'))
+
+
+if __name__ == '__main__':
+  unittest.main()
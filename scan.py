@@ -1,64 +1,523 @@
 """Scan closest targets satisfying filters (e.g. inactive, rank > 600)."""
 import argparse
+import collections
+from concurrent import futures
+import heapq
+import json
 import logging
+import multiprocessing
+import sys
+import threading
 import time
+from xml.etree import ElementTree
 
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
 
 import common
+import daemon_client
+import fleet_inventory
+import galaxy_index
+import galaxy_parser
+import geometry
+import http_lib
+import metrics
+import player_cache
 import selenium_lib as sln
+import slot_scheduler
+import universe_data
 
 
-def scan(b, args):
+class ScanBudget(object):
+  """Scans and fleet slots shared by all the shards of a scan.
+
+  The number of ongoing missions is read from the galaxy page, which only
+  reflects probes sent before it was loaded. Probes sent since by any shard
+  are counted with `num_sent`, and their times with `send_times`, so that the
+  scheduler of each shard knows of all probes in flight. While waiting for
+  slots, missions are counted from the return flights of the event list
+  instead, each count being offset by that of the same source when starting.
+  """
+
+  def __init__(self, max_scans, parallelism, manager=None):
+    self.max_scans = max_scans
+    self.parallelism = parallelism
+    if manager:
+      self.lock = manager.Lock()
+      self.num_sent = manager.Value('i', 0)
+      self.send_times = manager.list()
+      self.initial_num_missions = manager.Value('i', -1)
+      self.initial_num_returns = manager.Value('i', -1)
+    else:
+      self.lock = threading.Lock()
+      self.num_sent = _Value(0)
+      self.send_times = []
+      self.initial_num_missions = _Value(-1)
+      self.initial_num_returns = _Value(-1)
+
+  def done(self):
+    """Whether --max_scans was reached."""
+    return self.num_sent.value >= self.max_scans
+
+  def started(self):
+    """Whether missions were counted when starting."""
+    return self.initial_num_missions.value >= 0
+
+  def ongoing(self, num_missions, num_returns=None):
+    """Return num ongoing probe missions given num missions on the page.
+
+    Args:
+      num_missions: Num missions of the galaxy page.
+      num_returns: If present, num return flights of the event list counted
+        along with the page. Only used by the first call, as the offset of
+        `ongoing_from_event_list`.
+    """
+    # We count the number of ongoing probe missions by parsing the galaxy page
+    # so we need to offset it by the number of ongoing when starting.
+    with self.lock:
+      if self.initial_num_missions.value < 0:
+        self.initial_num_missions.value = num_missions
+        if num_returns is not None:
+          self.initial_num_returns.value = num_returns
+      return num_missions - self.initial_num_missions.value
+
+  def ongoing_from_event_list(self, num_returns):
+    """Return num ongoing probe missions given num return flights.
+
+    Returns:
+      Num missions, or None if `num_returns` or the return flights when
+      starting were not counted.
+    """
+    with self.lock:
+      if num_returns is None or self.initial_num_returns.value < 0:
+        return None
+      return num_returns - self.initial_num_returns.value
+
+  def num_allowed(self, num_ongoing_missions, num_sent_at_load):
+    """Num probes that can be sent now. Must be called with `lock` held."""
+    num_sent_since_load = self.num_sent.value - num_sent_at_load
+    return min(
+        self.parallelism - num_ongoing_missions - num_sent_since_load,
+        self.max_scans - self.num_sent.value)
+
+  def add_sent(self, num):
+    """Record `num` probes sent. Must be called with `lock` held."""
+    self.num_sent.value += num
+    self.send_times.extend([time.time()] * num)
+
+
+class ProbeOrigins(object):
+  """Planets probes are sent from, and probes in flight from each.
+
+  Probes are assumed to be back after the round trip computed from the
+  distance, since the galaxy page does not tell where missions come from.
+  """
+
+  def __init__(self, origins, args):
+    """Constructor.
+
+    Args:
+      origins: Dict of planet num -> `planner.Origin`.
+      args: Command-line args with universe geometry.
+    """
+    self.planet_nums = sorted(origins)
+    self.probes = {i: o.ships.get(geometry.ESPIONAGE_PROBE, 0)
+                   for i, o in origins.items()}
+    self.table = geometry.DistanceTable(
+        [origins[i].coords for i in self.planet_nums], args.num_galaxies,
+        args.num_systems)
+    self.fleet_speed = args.fleet_speed
+    self.returns = []  # heap of (return time, planet num)
+    self.current = None  # planet num selected in the game
+
+  def pick(self, galaxy, system):
+    """Return the planet num closest to a system with probes left, or None."""
+    self._land()
+    for i in self.table.closest((galaxy, system, 1)):
+      if self.probes[self.planet_nums[i]] > 0:
+        return self.planet_nums[i]
+    return None
+
+  def sent(self, planet_num, galaxy, system, num):
+    """Record `num` probes sent from `planet_num` to a system."""
+    i = self.planet_nums.index(planet_num)
+    round_trip = 2 * self.table.flight_time(
+        i, (galaxy, system, 1), geometry.SHIP_SPEED[geometry.ESPIONAGE_PROBE],
+        fleet_speed=self.fleet_speed)
+    self.probes[planet_num] -= num
+    for _ in range(num):
+      heapq.heappush(self.returns, (time.time() + round_trip, planet_num))
+
+  def _land(self):
+    while self.returns and self.returns[0][0] <= time.time():
+      self.probes[heapq.heappop(self.returns)[1]] += 1
+
+
+class _Value(object):
+  """Stand-in for `multiprocessing.Value` within a single process."""
+
+  def __init__(self, value):
+    self.value = value
+
+
+# States of a target in a `TargetQueue`.
+PENDING = 'pending'
+SENT = 'sent'
+SKIPPED = 'skipped'
+
+
+class TargetQueue(object):
+  """Targets of a system, by position, and whether a probe was sent to each."""
+
+  def __init__(self, galaxy, system, targets):
+    """Constructor.
+
+    Args:
+      galaxy: Galaxy.
+      system: System.
+      targets: List of `galaxy_parser.SystemRow`s, in order of probing.
+    """
+    self.galaxy = galaxy
+    self.system = system
+    self.targets = collections.OrderedDict((t.position, t) for t in targets)
+    self.states = {position: PENDING for position in self.targets}
+
+  def skip(self, position, reason):
+    logging.info('Skipping {}:{}:{} ({})'.format(
+        self.galaxy, self.system, position, reason))
+    self.states[position] = SKIPPED
+
+  def mark_sent(self, position):
+    self.states[position] = SENT
+
+  def pending(self):
+    """Return targets still to probe, in order."""
+    return [t for p, t in self.targets.items() if self.states[p] == PENDING]
+
+  def done(self):
+    """Whether all targets were probed or skipped."""
+    return PENDING not in self.states.values()
+
+
+def scan(b, args, budget=None):
   """Scan closest targets."""
+  universe = load_universe(b, args)
+  origins = None
+  if args.multi_origin:
+    # Fleet pages are fetched before selecting the planet, since fetching them
+    # changes the planet selected in the game.
+    inventory = fleet_inventory.from_browser(b)
+    origins = ProbeOrigins(inventory.origins(), args)
   home_galaxy, home_system = go_to_galaxy_view(b, args.planet_num)
-  num_missions = 0
-  num_scans = 0
-  initial_num_missions = None
+  budget = budget or ScanBudget(args.max_scans, args.parallelism)
+  scheduler = new_scheduler(b, args)
+  players = new_player_cache(args, universe)
+  try:
+    _scan(b, args, budget, scheduler, origins, players, universe, home_galaxy,
+          home_system)
+  finally:
+    players.close()
+
+
+def _scan(b, args, budget, scheduler, origins, players, universe, home_galaxy,
+          home_system):
+  if origins:
+    origins.current = args.planet_num
+    galaxies = ([args.galaxy] if args.galaxy
+                else origins.table.galaxy_order())
+    for galaxy in galaxies:
+      if budget.done():
+        break
+      systems = _skip_systems(origins.table.system_order(galaxy), args)
+      scan_systems(b, galaxy, prefilter_systems(universe, galaxy, systems, args),
+                   args, budget, scheduler, origins, players)
+    return
 
   # Use home galaxy or galaxy specified in command line.
   galaxy = args.galaxy or home_galaxy
   if not 1 <= galaxy <= args.num_galaxies:
     raise ValueError('Galaxy should be between 1 and {}; got {}'.format(
         args.num_galaxies, galaxy))
+
+  systems = galaxy_systems(galaxy, home_galaxy, home_system, args)
+  scan_systems(b, galaxy, prefilter_systems(universe, galaxy, systems, args),
+               args, budget, scheduler, players=players)
+
+
+def new_scheduler(b, args):
+  """Return a `slot_scheduler.SlotScheduler` for the browser's session."""
+  session, url = None, None
+  if args.backend == 'http':
+    # Fleet movements then tell exactly when probes come back.
+    session, url = http_lib.session_from_browser(b), http_lib.game_url(b)
+  return slot_scheduler.SlotScheduler(args.probe_round_trip, session, url)
+
+
+def new_player_cache(args, universe=None):
+  """Return a `player_cache.PlayerCache`, on disk if --player_cache is set.
+
+  Ranks of the universe data, if present, are cached in memory.
+  """
+  players = player_cache.PlayerCache(args.player_cache,
+                                     args.player_cache_ttl * 3600)
+  if universe:
+    players.add(player_cache.Player(p.player_id, p.name, p.rank, [])
+                for p in universe.players.values() if p.rank)
+  return players
+
+
+def load_universe(b, args):
+  """Load the data files of --universe_data, or return None if not set.
+
+  Stale files are downloaded first. The geometry of the universe in `args` is
+  replaced by that of the server data.
+
+  Returns:
+    `universe_data.UniverseIndex`, or None if the files could neither be
+    downloaded nor read from a previous download.
+  """
+  if not args.universe_data:
+    return None
+  try:
+    universe_data.refresh(
+        args.universe_data, universe_data.api_url(http_lib.game_url(b)),
+        args.universe_data_max_age * 3600)
+  except IOError as e:
+    logging.warn('Could not download universe data: {}'.format(e))
+  try:
+    universe = universe_data.load(args.universe_data)
+  except (IOError, ElementTree.ParseError) as e:
+    logging.warn('Could not read universe data, scanning without it: '
+                 '{}'.format(e))
+    return None
+  server_data = universe.server_data
+  args.num_galaxies = server_data.num_galaxies
+  args.num_systems = server_data.num_systems
+  args.fleet_speed = server_data.fleet_speed
+  return universe
+
+
+def prefilter_systems(universe, galaxy, systems, args):
+  """Return `systems` with a target according to `universe`, if present."""
+  if universe is None:
+    return systems
+  with_targets = universe.systems_with_targets(galaxy, args)
+  filtered = [system for system in systems if system in with_targets]
+  logging.info('{} of {} systems of galaxy {} have targets in universe '
+               'data'.format(len(filtered), len(systems), galaxy))
+  return filtered
+
+
+def galaxy_systems(galaxy, home_galaxy, home_system, args):
+  """Return systems of `galaxy` in scan order, minus --systems_to_skip."""
+  systems = list(
+      iter_coords(home_system, args.num_systems) if galaxy == home_galaxy
+      else range(1, args.num_systems + 1))
+  return _skip_systems(systems, args)
+
+
+def _skip_systems(systems, args):
+  for i, system in enumerate(systems[:args.systems_to_skip]):
+    logging.info('Skipping system {} [{}]'.format(i, system))
+  return systems[args.systems_to_skip:]
+
+
+def scan_systems(b, galaxy, systems, args, budget, scheduler, origins=None,
+                 players=None):
+  """Scan `systems` of `galaxy` in order, until `budget` is exhausted.
+
+  If `origins` (`ProbeOrigins`) is present, probes are sent from the closest
+  planet with probes left, otherwise from the current planet. Ranks of players
+  seen before are taken from `players` (`player_cache.PlayerCache`).
+
+  Returns:
+    Num probes sent.
+  """
   logging.info('Scanning galaxy {}'.format(galaxy))
+  players = players if players is not None else player_cache.PlayerCache()
+
+  # Systems seen recently are read from the index instead of being revisited.
+  index = galaxy_index.GalaxyIndex(args.index) if args.index else None
+  try:
+    return _scan_systems(b, galaxy, systems, args, budget, scheduler, origins,
+                         players, index)
+  finally:
+    if index:
+      index.close()
+
 
-  for i, system in enumerate(
-          iter_coords(home_system, args.num_systems) if galaxy == home_galaxy
-          else range(1, args.num_systems + 1)):
-    if i < args.systems_to_skip:
-      logging.info('Skipping system {} [{}]'.format(i, system))
+def _scan_systems(b, galaxy, systems, args, budget, scheduler, origins,
+                  players, index):
+  num_scans = 0
+  cached = {}
+  if index:
+    cached = index.fresh_systems(galaxy, args.index_ttl * 3600)
+    logging.info('{} systems of galaxy {} are in the index'.format(
+        len(cached), galaxy))
+  stale = [system for system in systems if system not in cached]
+
+  # With the HTTP backend, systems are fetched ahead of the browser, which only
+  # navigates to those that have targets.
+  if args.backend == 'http':
+    session = http_lib.session_from_browser(b, args.http_concurrency)
+    fetched = fetch_systems(session, http_lib.game_url(b), galaxy, stale,
+                            args.http_concurrency)
+  else:
+    fetched = ((system, None) for system in stale)
+
+  for system, rows in _merge(systems, cached, fetched):
+    if budget.done():
+      logging.info('Reached {} scans. Exiting.'.format(budget.max_scans))
+      break
+    if rows is not None:
+      rows = players.fill(rows)
+      players.update(rows)
+    if rows is not None and system not in cached and index:
+      index.update(galaxy, system, rows)
+    if rows is not None and not has_targets(rows, args):
+      logging.info('No target in {}:{}, skipping'.format(galaxy, system))
       continue
 
-    system_done = False
-    num_processed_in_this_system = 0
-    while not system_done:
-      num_ongoing_missions = go_to_system(b, galaxy, system)
-
-      if initial_num_missions is None:
-        initial_num_missions = num_ongoing_missions
-      # We count the number of ongoing probe missions by parsing the galaxy page
-      # so we need to offset it by the number of ongoing when starting this
-      # program.
-      num_ongoing_missions -= initial_num_missions
+    # The system is read once. While waiting for slots, the browser stays on
+    # it and missions are counted from the event list instead.
+    targets = None
+    navigate = True
+    while not budget.done():
+      if origins:
+        planet_num = origins.pick(galaxy, system)
+        if planet_num is None:
+          logging.info('No probe left on any planet')
+          scheduler.wait_for_slot()
+          continue
+        if planet_num != origins.current:
+          switch_planet(b, planet_num)
+          origins.current = planet_num
+          navigate = True
+      num_sent_at_load = budget.num_sent.value
+      counted_at = time.time()
+      if navigate:
+        num_returns = None
+        if not budget.started():
+          # Offset of the missions counted from the event list later on.
+          num_returns = count_missions(b)
+        num_missions = go_to_system(b, galaxy, system)
+        if targets is None:
+          targets = inspect(b, galaxy, system, args, index=index,
+                            players=players)
+        else:
+          # Only tag the espionage buttons of the new page.
+          read_system(b, players.known_ids())
+        navigate = False
+        num_ongoing_missions = budget.ongoing(num_missions, num_returns)
+      else:
+        num_ongoing_missions = budget.ongoing_from_event_list(
+            count_missions(b))
+        if num_ongoing_missions is None:
+          logging.warn('Could not count missions from the event list, '
+                       'reloading the system')
+          navigate = True
+          continue
+      if targets.done():
+        break
+      # Missions of the page are those of all shards, so is the scheduler.
+      scheduler.record(budget.send_times, counted_at)
+      scheduler.observe(num_ongoing_missions)
       logging.info('{} ongoing missions'.format(num_ongoing_missions))
-      logging.info('{} total scans'.format(num_scans))
+      logging.info('{} total scans'.format(budget.num_sent.value))
+
+      # Shards take turns to send probes so that they share fleet slots.
+      with budget.lock:
+        num_allowed = budget.num_allowed(
+            num_ongoing_missions, num_sent_at_load)
+        if num_allowed > 0:
+          num_processed = send_probes(b, targets, num_allowed)
+          budget.add_sent(num_processed)
 
-      if num_ongoing_missions >= args.parallelism:
+      if num_allowed <= 0:
         # Wait until a mission is done.
-        logging.info('Too many missions. Waiting 10s...')
-        time.sleep(10)
+        logging.info('Too many missions')
+        scheduler.wait_for_slot()
         continue
-
-      num_allowed = args.parallelism - num_ongoing_missions
-      num_processed, system_done = inspect(
-          b, num_processed_in_this_system, num_allowed, galaxy, system,
-          args)
-      num_processed_in_this_system += num_processed
+      if origins:
+        origins.sent(origins.current, galaxy, system, num_processed)
       num_scans += num_processed
-      if num_scans >= args.max_scans:
-        logging.info('Reached {} scans. Exiting.'.format(args.max_scans))
-        return
+
+  return num_scans
+
+
+def scan_sharded(args):
+  """Scan with --shards browsers in parallel and return num probes sent."""
+  manager = multiprocessing.Manager()
+  budget = ScanBudget(args.max_scans, args.parallelism, manager)
+  pool = multiprocessing.Pool(args.shards)
+  try:
+    num_scans = pool.starmap(
+        _scan_shard, [(args, i, budget) for i in range(args.shards)])
+  finally:
+    pool.close()
+    pool.join()
+  for i, n in enumerate(num_scans):
+    logging.info('Shard {} sent {} probes'.format(i, n))
+  logging.info('Sent {} probes in total'.format(sum(num_scans)))
+  return sum(num_scans)
+
+
+def shard_systems(shard, home_galaxy, home_system, args):
+  """Return the (galaxy, systems) to scan in a shard.
+
+  With --shard_by=galaxy, shards take turns picking galaxies, closest first.
+  With --shard_by=system, the galaxy is split into ranges of systems.
+  """
+  if args.shard_by == 'galaxy':
+    galaxies = list(iter_coords(home_galaxy, args.num_galaxies))
+    return [(g, galaxy_systems(g, home_galaxy, home_system, args))
+            for g in galaxies[shard::args.shards]]
+  galaxy = args.galaxy or home_galaxy
+  size = -(-args.num_systems // args.shards)  # ceil
+  lo, hi = shard * size + 1, (shard + 1) * size
+  return [(galaxy, [s for s in galaxy_systems(
+      galaxy, home_galaxy, home_system, args) if lo <= s <= hi])]
+
+
+def _scan_shard(args, shard, budget):
+  """Scan a shard in its own browser and return num probes sent."""
+  common.setup_logging(args)
+  # Pool workers do not run exit handlers, so shards write their metrics to
+  # their own files when done.
+  if args.metrics_json or args.metrics_prom:
+    metrics.enable()
+  b = common.open_browser_and_connect(args)
+  try:
+    universe = load_universe(b, args)
+    home_galaxy, home_system = go_to_galaxy_view(b, args.planet_num)
+    scheduler = new_scheduler(b, args)
+    players = new_player_cache(args, universe)
+    try:
+      return _scan_shard_systems(b, args, shard, budget, scheduler, players,
+                                 universe, home_galaxy, home_system)
+    finally:
+      players.close()
+  finally:
+    b.quit()
+    if metrics.enabled():
+      suffix = '.shard{}'.format(shard)
+      metrics.write(args.metrics_json and args.metrics_json + suffix,
+                    args.metrics_prom and args.metrics_prom + suffix)
+
+
+def _scan_shard_systems(b, args, shard, budget, scheduler, players, universe,
+                        home_galaxy, home_system):
+  num_scans = 0
+  for galaxy, systems in shard_systems(shard, home_galaxy, home_system, args):
+    if budget.done():
+      break
+    systems = prefilter_systems(universe, galaxy, systems, args)
+    logging.info('Shard {}: {} systems of galaxy {}'.format(
+        shard, len(systems), galaxy))
+    num_scans += scan_systems(b, galaxy, systems, args, budget, scheduler,
+                              players=players)
+  return num_scans
 
 
 def go_to_galaxy_view(b, planet_num):
@@ -79,64 +538,201 @@ def go_to_galaxy_view(b, planet_num):
   return galaxy, system
 
 
+def switch_planet(b, planet_num):
+  """Select another planet, staying on the galaxy view."""
+  logging.info('Sending probes from planet #{}'.format(planet_num))
+  galaxy_input = sln.find(b, By.ID, 'galaxy_input')
+  planets = sln.finds(sln.find(b, By.ID,
+                               'planetList'), By.CLASS_NAME, 'planetlink')
+  planets[planet_num].click()
+  sln.wait_for(b, EC.staleness_of(galaxy_input))
+
+
+# Counts fleets in flight from the event list, without leaving the page.
+_COUNT_MISSIONS_JS = """
+var callback = arguments[arguments.length - 1];
+fetch('index.php?page=eventList&ajax=1', {credentials: 'same-origin'})
+  .then(function(response) { return response.text(); })
+  .then(function(html) {
+    var doc = new DOMParser().parseFromString(html, 'text/html');
+    callback(doc.querySelectorAll(
+        'tr.eventFleet[data-return-flight="true"]').length);
+  }, function(e) { callback(null); });
+"""
+
+
+def count_missions(b):
+  """Return num return flights of the event list, or None if not readable.
+
+  The galaxy page only counts missions when loaded, so the event list is read
+  from within the page instead. Its count differs from that of the page, e.g.
+  for one-way missions, so only compare it to counts of the event list.
+  """
+  try:
+    return sln.execute_async(b, _COUNT_MISSIONS_JS, timeout=10)
+  except TimeoutException:
+    return None
+
+
 def go_to_system(b, galaxy, system):
   """Navigate to system and return num ongoing missions."""
   logging.info('Navigating to {}:{}'.format(galaxy, system))
-  sln.find(b, By.ID, 'galaxy_input').send_keys(str(galaxy))
-  sln.find(b, By.ID, 'system_input').send_keys(str(system))
-  sln.find(b, By.CSS_SELECTOR, '#galaxyHeader .btn_blue').click()
+  with metrics.phase('galaxy_navigation'):
+    sln.find(b, By.ID, 'galaxy_input').send_keys(str(galaxy))
+    sln.find(b, By.ID, 'system_input').send_keys(str(system))
+    sln.mark_activity(b)
+    sln.find(b, By.CSS_SELECTOR, '#galaxyHeader .btn_blue').click()
+
+    # Wait for the galaxy request to complete and the table to be redrawn.
+    if not sln.wait_for_idle(b, timeout=4):
+      logging.warn('Galaxy view still loading, reading it anyway')
 
-  # Wait for loader to appear, then wait for it to disappear.
-  sln.wait_until(b, By.ID, 'galaxyLoading', timeout=1, timeout_ok=True)
-  sln.wait_until_not(b, By.ID, 'galaxyLoading', timeout=3, timeout_ok=True)
+    return int(sln.find(b, By.ID, 'slotUsed').text)
 
-  return int(sln.find(b, By.ID, 'slotUsed').text)
+
+def fetch_system(session, url, galaxy, system):
+  """Fetch a system over HTTP and return its rows."""
+  body = http_lib.post_page(session, url, 'galaxyContent',
+                            {'galaxy': galaxy, 'system': system}).text
+  # The page answers with JSON wrapping the HTML of the galaxy table.
+  try:
+    body = json.loads(body)['galaxy']
+  except (ValueError, KeyError, TypeError):
+    pass
+  return galaxy_parser.parse_system(body)
+
+
+def fetch_systems(session, url, galaxy, systems, concurrency):
+  """Fetch systems with bounded concurrency.
+
+  Yields:
+    (system, rows) in the order of `systems`. Rows are None if the system could
+    not be fetched, so that callers fall back to the browser.
+  """
+  systems = list(systems)
+  prefix = threading.current_thread().name + '/fetch'
+  with futures.ThreadPoolExecutor(max_workers=concurrency,
+                                  thread_name_prefix=prefix) as executor:
+    pending = collections.deque()
+    for system in systems:
+      pending.append((system, executor.submit(
+          fetch_system, session, url, galaxy, system)))
+      # Keep a bounded window of requests in flight ahead of the consumer.
+      if len(pending) >= 2 * concurrency:
+        yield _result(*pending.popleft())
+    while pending:
+      yield _result(*pending.popleft())
+
+
+def _merge(systems, cached, fetched):
+  """Yield (system, rows) in order, from `cached` or else from `fetched`."""
+  for system in systems:
+    if system in cached:
+      yield system, cached[system]
+    else:
+      yield next(fetched)
+
+
+def _result(system, future):
+  """Return (system, rows) of a fetch future."""
+  try:
+    return system, future.result()
+  except Exception as e:
+    logging.warn('Could not fetch system {}: {}'.format(system, e))
+    return system, None
 
 
 def iter_coords(start, num):
-  """Generator for next element in a donut system/galaxy."""
+  """Generator for next element in a donut system/galaxy numbered 1 to num."""
   yield start
-  odd = num % 2 == 1
-  bound = (num + 2) // 2
+  bound = (num + 1) // 2
   for i in range(1, bound):
-    yield (start + i) % (num + 1)
-    yield (start - i) % (num + 1)
-  if odd:
-    yield (start + bound) % (num + 1)
-
-
-def inspect(b, num_already_processed, num_allowed, galaxy, system, args):
-  """Inspect a system.
+    yield (start - 1 + i) % num + 1
+    yield (start - 1 - i) % num + 1
+  if num % 2 == 0:
+    yield (start - 1 + bound) % num + 1
+
+
+# Reads every player row of the galaxy table at once. The espionage buttons are
+# tagged with a data attribute so they can be found again with a CSS selector.
+# Tooltips are hidden, so textContent is used instead of hovering them. Ranks of
+# the player IDs passed as argument are known already and not looked up.
+_READ_SYSTEM_JS = """
+var known = {};
+(arguments[0] || []).forEach(function(id) { known[id] = true; });
+var rows = [];
+var players = document.querySelectorAll('.playername');
+for (var i = 0; i < players.length; i++) {
+  var player = players[i];
+  var row = player.parentNode;
+  var text = function(parent, selector) {
+    var el = parent && parent.querySelector(selector);
+    return el ? el.textContent.trim() : '';
+  };
+  var link = player.querySelector('a');
+  // Tooltips have the ID of the link's rel, e.g. "player100005", of which
+  // player IDs are the number as in galaxy_parser.player_id.
+  var rel = link ? link.getAttribute('rel') || '' : '';
+  var playerId = rel.replace(/^player/, '');
+  var rank = '';
+  if (playerId && !known[playerId]) {
+    var tooltips = document.querySelectorAll('[id="' + rel + '"]');
+    for (var j = 0; j < tooltips.length && !rank; j++) {
+      rank = text(tooltips[j], 'a');
+    }
+  }
+  var position = text(row, '.position');
+  var selector = null;
+  var espionage = row.querySelector('.espionage');
+  if (espionage && position) {
+    espionage.setAttribute('data-bogame-espionage', position);
+    selector = '[data-bogame-espionage="' + position + '"]';
+  }
+  rows.push({
+    position: position,
+    planet_name: text(row, '.planetname'),
+    player_name: link ? link.textContent.trim() : player.textContent.trim(),
+    player_id: playerId,
+    classes: player.getAttribute('class') || '',
+    rank: rank,
+    espionage_selector: selector
+  });
+}
+return rows;
+"""
+
+
+def read_system(b, known_ids=()):
+  """Read all rows of the current system in a single browser round-trip.
 
   Args:
     b: Browser.
-    num_already_processed: Num already processed in this system.
-    num_allowed: Num probes allowed at this point.
-    galaxy: Galaxy (for debug).
-    system: System (for debug).
-    args: Command-line args.
+    known_ids: IDs of players whose rank is not read, e.g. cached ones.
 
   Returns:
-    num_processed: (int) Number of targets newly processed in this system.
-    done: (bool) Whether the scan was complete.
+    List of `galaxy_parser.SystemRow`s.
   """
-  logging.info('Inspecting [{}:{}]...'.format(galaxy, system))
+  rows = [galaxy_parser.row_from_dict(raw)
+          for raw in b.execute_script(_READ_SYSTEM_JS, list(known_ids)) or []]
+  return [row for row in rows if row is not None]
 
-  # Get list of planets in this system.
-  players = [p for p in sln.finds(b, By.CSS_SELECTOR, '.playername',
-                                  timeout=2, timeout_ok=True)
-             if len(p.get_attribute('class').split()) > 1 and
-             'js_no_action' not in p.get_attribute('class')]
-  logging.info('Found {} players'.format(len(players)))
 
-  # Get list of potential targets based on their class (inactive, strong, etc).
+def is_player(row):
+  """Whether a row holds a player (as opposed to an empty slot or ourself)."""
+  return len(row.classes) > 1 and 'js_no_action' not in row.classes
+
+
+def filter_targets(rows, args):
+  """Return player rows matching the class filters (inactive, strong, etc)."""
   potential_targets = []
-  for player in players:
-    classes = player.get_attribute('class').split()
+  for row in rows:
+    if not is_player(row):
+      continue
+    classes = row.classes
     if len(classes) == 2:  # normal players have 2 classes
       if args.include_normal:
         logging.info('Adding normal player')
-        potential_targets.append(player)
+        potential_targets.append(row)
     elif any(x in classes for x in ['noob', 'vacation', 'vacationlonginactive',
                                     'vacationinactive', 'banned']):
       pass
@@ -150,79 +746,105 @@ def inspect(b, num_already_processed, num_allowed, galaxy, system, args):
         if classname in classes:
           if arg:
             logging.info('Adding {} player'.format(label))
-            potential_targets.append(player)
+            potential_targets.append(row)
           break
       else:  # no known classname found
         logging.warn(
             'Skipping unsupported player (classes = {})'.format(classes))
-  logging.info('Found {} potential targets'.format(len(potential_targets)))
+  return potential_targets
 
-  # Iterate over potential targets and scan those with rank within bounds.
-  num_processed = 0
-  for potential_target in potential_targets:
-    if num_allowed == 0:
-      # Reached max number of concurrent missions.
-      return num_processed, False
-
-    # Find player name.
-    sln.hover(b, potential_target)
-    player_name = potential_target.text
-
-    # Find player ID (sometimes we need to try multiple times).
-    player_id, tries = None, 0
-    while not player_id and tries < 10:
-      tries += 1
-      player_id = sln.find(potential_target, By.TAG_NAME,
-                           'a').get_attribute('rel')
-    if not player_id:
-      logging.warn('Skipping (could not find player ID)')
-      continue
 
-    # Find player rank. Sometimes it can't be done e.g. if player name is empty.
-    player_rank, tries = None, 0
-    while not player_rank and tries < 10:
-      tries += 1
-      for tooltip in sln.finds(b, By.ID, player_id):
-        rank = sln.find(tooltip, By.TAG_NAME, 'a').text
-        if rank:
-          player_rank = int(rank)
-          break
-    if not player_rank:
-      logging.warn('Skipping (could not find player rank')
-      continue
+def has_targets(rows, args):
+  """Whether rows contain a target that passes the class and rank filters."""
+  return any(not row.rank or args.rank_min <= row.rank <= args.rank_max
+             for row in filter_targets(rows, args))
 
-    # Find planet name.
-    planet_name = sln.find(sln.find(potential_target, By.XPATH, '..'),
-                           By.CLASS_NAME, 'planetname').text
 
-    # Find planet position.
-    planet_position = int(
-        sln.find(sln.find(potential_target, By.XPATH, '..'), By.CLASS_NAME,
-                 'position').text)
+def inspect(b, galaxy, system, args, index=None, players=None):
+  """Read the targets of the current system.
 
-    logging.info('Potential target: {}:{}:{} [{}] - {} (rank {})'.format(
-        galaxy, system, planet_position, planet_name, player_name, player_rank))
+  Args:
+    b: Browser, on the system.
+    galaxy: Galaxy.
+    system: System.
+    args: Command-line args.
+    index: If present, `galaxy_index.GalaxyIndex` to update with the system.
+    players: If present, `player_cache.PlayerCache` of players seen before,
+      whose ranks are not read again, updated with the system.
 
-    if not args.rank_min <= player_rank <= args.rank_max:
-      logging.info('Skipping (outside allowed rank bounds)')
-      continue
+  Returns:
+    `TargetQueue` of the targets, those outside rank bounds or that cannot be
+    probed already skipped.
+  """
+  logging.info('Inspecting [{}:{}]...'.format(galaxy, system))
 
-    if num_already_processed:
-      logging.info('Skipping (already processed)')
-      num_already_processed -= 1
-      continue
+  # Wait for the galaxy table, then read it whole. Player IDs and ranks are
+  # sometimes not populated yet, in which case we need to read again. Ranks of
+  # cached players are not read.
+  players = players if players is not None else player_cache.PlayerCache()
+  sln.wait_until(b, By.CSS_SELECTOR, '.playername', timeout=2,
+                 timeout_ok=True)
+  for tries in range(10):
+    if tries:
+      # Give the page time to populate them, a bit longer each time.
+      time.sleep(min(0.05 * 2 ** (tries - 1), 1))
+    rows = players.fill(read_system(b, players.known_ids()))
+    if all(r.player_id and r.rank for r in rows if is_player(r)):
+      break
+  players.update(rows)
+  logging.info('Found {} players'.format(sum(1 for r in rows if is_player(r))))
+  if index:
+    index.update(galaxy, system, rows)
 
+  # Get list of potential targets based on their class (inactive, strong, etc).
+  potential_targets = filter_targets(rows, args)
+  logging.info('Found {} potential targets'.format(len(potential_targets)))
+
+  # Skip targets that cannot be probed or with rank outside bounds.
+  targets = TargetQueue(galaxy, system, potential_targets)
+  for target in potential_targets:
+    logging.info('Potential target: {}:{}:{} [{}] - {} (rank {})'.format(
+        galaxy, system, target.position, target.planet_name,
+        target.player_name, target.rank))
+    if not target.player_id:
+      targets.skip(target.position, 'could not find player ID')
+    # Rank can be missing e.g. if player name is empty.
+    elif not target.rank:
+      targets.skip(target.position, 'could not find player rank')
+    elif not args.rank_min <= target.rank <= args.rank_max:
+      targets.skip(target.position, 'outside allowed rank bounds')
+    elif not target.espionage_selector:
+      targets.skip(target.position, 'could not find espionage button')
+  return targets
+
+
+def send_probes(b, targets, num_allowed):
+  """Send probes to the next pending targets of a `TargetQueue`.
+
+  Args:
+    b: Browser, on the system of `targets`.
+    targets: `TargetQueue`.
+    num_allowed: Num probes allowed at this point.
+
+  Returns:
+    Num probes sent.
+  """
+  num_processed = 0
+  for target in targets.pending()[:num_allowed]:
     logging.info('--> Sending probe to {}:{}:{}'.format(
-        galaxy, system, planet_position))
-    sln.click(b, sln.find(sln.find(potential_target, By.XPATH, '..'),
-                          By.CLASS_NAME, 'espionage'))
+        targets.galaxy, targets.system, target.position))
+    try:
+      sln.click(b, (By.CSS_SELECTOR, target.espionage_selector))
+    except TimeoutException:
+      targets.skip(target.position, 'espionage button is gone')
+      continue
+    targets.mark_sent(target.position)
     num_processed += 1
-    num_allowed -= 1
+  return num_processed
 
-  return num_processed, True
 
-
-def main():
+def build_arg_parser():
+  """Return the parser of command-line args."""
   arg_parser = argparse.ArgumentParser()
 
   # Register common args.
@@ -241,23 +863,81 @@ def main():
   # Scan config.
   arg_parser.add_argument('--planet_num', type=int,
                           default=0, help='Which planet to send probes from')
+  arg_parser.add_argument(
+      '--multi_origin', type=bool, default=False,
+      help='Send probes from the closest planet with probes left, and scan '
+      'systems closest to any planet first, in all galaxies with a planet')
+  arg_parser.add_argument('--fleet_speed', type=int, default=1,
+                          help='Fleet speed of the universe')
   arg_parser.add_argument('--parallelism', type=int, required=True,
                           help='Num missions to send at a time')
   arg_parser.add_argument('-n', '--max_scans', type=int, required=True,
                           help='Num of scans before exiting')
+  arg_parser.add_argument(
+      '--probe_round_trip', type=float, default=60,
+      help='Initial estimate of probe round trips in seconds, refined as '
+      'probes come back')
   arg_parser.add_argument('--systems_to_skip', type=int,
                           default=0, help='Skip the N closest systems')
   arg_parser.add_argument(
       '--galaxy', type=int,
       help='If present, scan this galaxy instead of the home galaxy')
+  arg_parser.add_argument(
+      '--backend', choices=['browser', 'http'], default='browser',
+      help='How to read systems: "http" fetches them with the browser\'s '
+      'session and only navigates to systems with targets')
+  arg_parser.add_argument('--http_concurrency', type=int, default=4,
+                          help='Num systems fetched at a time over HTTP')
+  arg_parser.add_argument(
+      '--index', type=str,
+      help='If present, SQLite file indexing the galaxy across runs')
+  arg_parser.add_argument(
+      '--index_ttl', type=float, default=24,
+      help='Hours after which systems in the index are visited again')
+  arg_parser.add_argument(
+      '--player_cache', type=str,
+      help='If present, SQLite file caching player ranks across runs')
+  arg_parser.add_argument(
+      '--player_cache_ttl', type=float, default=24,
+      help='Hours after which ranks in the player cache are read again')
 
   # Args for universe structure.
   arg_parser.add_argument('--num_galaxies', type=int, default=7)
   arg_parser.add_argument('--num_systems', type=int, default=499)
+  arg_parser.add_argument(
+      '--universe_data', type=str,
+      help='If present, directory caching the public data files of the '
+      'universe, used to skip systems without targets and for the universe '
+      'structure')
+  arg_parser.add_argument(
+      '--universe_data_max_age', type=float, default=24,
+      help='Hours after which the data files are downloaded again')
+
+  # Sharding across browsers.
+  arg_parser.add_argument('--shards', type=int, default=1,
+                          help='Num browsers scanning in parallel')
+  arg_parser.add_argument(
+      '--shard_by', choices=['galaxy', 'system'], default='galaxy',
+      help='Split all galaxies across shards, or the systems of one galaxy')
 
+  return arg_parser
+
+
+def main():
+  arg_parser = build_arg_parser()
   args = arg_parser.parse_args()
+  if args.shards > 1 and args.multi_origin:
+    arg_parser.error('--multi_origin is not supported with --shards')
+  if args.browser_daemon:
+    if args.shards > 1:
+      arg_parser.error('--shards opens its own browsers; drop --browser_daemon')
+    sys.exit(daemon_client.submit(args.browser_daemon, 'scan', sys.argv[1:]))
 
   common.setup_logging(args)
+  common.setup_metrics(args)
+  if args.shards > 1:
+    scan_sharded(args)
+    return
   b = common.open_browser_and_connect(args)
 
   scan(b, args)
@@ -0,0 +1,166 @@
+"""Tests of scan.py helpers that do not need a browser."""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import galaxy_index
+import galaxy_parser
+import scan
+import selenium_lib as sln
+import universe_data
+
+_PLAYERS_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<players timestamp="1600000000" serverId="1">
+  <player id="100005" name="Alice" status="i" alliance=""/>
+  <player id="100006" name="Bob"/>
+</players>"""
+
+_HIGHSCORE_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<highscore category="1" type="0">
+  <player position="1234" id="100005" score="50000"/>
+  <player position="17" id="100006" score="900000"/>
+</highscore>"""
+
+_UNIVERSE_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<universe timestamp="1600000000" serverId="1">
+  <planet id="33620001" player="100005" name="Colony" coords="1:101:4"/>
+</universe>"""
+
+_SERVER_DATA_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<serverData><galaxies>5</galaxies><systems>499</systems></serverData>"""
+
+# A galaxy row whose rank tooltip is not in the page, as for players whose
+# rank `scan.read_system` does not read.
+_GALAXY_HTML = """
+<table id="galaxytable"><tbody>
+<tr class="row">
+  <td class="position js_no_action">4</td>
+  <td class="planetname">Colony</td>
+  <td class="playername inactive">
+    <a href="javascript:void(0);" rel="player100005">Alice</a></td>
+  <td class="action"><a class="espionage"></a></td>
+</tr>
+</tbody></table>"""
+
+
+class PlayerCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.args = scan.build_arg_parser().parse_args([
+        '-c=test', '-u=a@b.c', '-p=pwd', '--rank_min=1000',
+        '--rank_max=2000', '--parallelism=1', '--max_scans=1'])
+    self.universe = universe_data.UniverseIndex(
+        universe_data.parse_players(_PLAYERS_XML, _HIGHSCORE_XML),
+        universe_data.parse_planets(_UNIVERSE_XML),
+        universe_data.parse_server_data(_SERVER_DATA_XML))
+
+  def test_universe_rank_fills_galaxy_row(self):
+    rows = galaxy_parser.parse_system(_GALAXY_HTML)
+    self.assertEqual([(r.player_id, r.rank) for r in rows],
+                     [('100005', None)])
+
+    players = scan.new_player_cache(self.args, self.universe)
+    self.assertIn('100005', players.known_ids())
+    rows = players.fill(rows)
+    self.assertEqual([(r.player_id, r.rank) for r in rows],
+                     [('100005', 1234)])
+
+
+class ScanBudgetTest(unittest.TestCase):
+
+  def test_counts_are_offset_by_their_own_source(self):
+    budget = scan.ScanBudget(max_scans=10, parallelism=5)
+    self.assertIsNone(budget.ongoing_from_event_list(3))
+    # 2 slots of the page are used, of which 1 is a one-way mission.
+    self.assertEqual(budget.ongoing(2, num_returns=1), 0)
+    self.assertEqual(budget.ongoing_from_event_list(4), 3)
+    self.assertIsNone(budget.ongoing_from_event_list(None))
+    # Later loads of the page keep the first offsets.
+    self.assertEqual(budget.ongoing(5, num_returns=4), 3)
+    self.assertEqual(budget.ongoing_from_event_list(1), 0)
+
+
+class FakeBrowser(object):
+
+  current_url = 'http://game.test/game/index.php?page=galaxy'
+
+  def __init__(self, pages=()):
+    self.pages = list(pages)
+
+  def execute_script(self, script, *args):
+    return self.pages.pop(0) if len(self.pages) > 1 else self.pages[0]
+
+
+def _raw_row(rank):
+  return {'position': '4', 'planet_name': 'Colony', 'player_name': 'Alice',
+          'player_id': '100005', 'classes': 'playername inactive tooltipRel',
+          'rank': rank, 'espionage_selector': '[data-bogame-espionage="4"]'}
+
+
+class InspectTest(unittest.TestCase):
+
+  def test_waits_longer_each_time_ranks_are_missing(self):
+    args = scan.build_arg_parser().parse_args([
+        '-c=test', '-u=a@b.c', '-p=pwd', '--rank_min=1000',
+        '--rank_max=2000', '--parallelism=1', '--max_scans=1'])
+    b = FakeBrowser([[_raw_row('')]] * 3 + [[_raw_row('1.234')]])
+    with mock.patch.object(sln, 'wait_until'), \
+         mock.patch('time.sleep') as sleep:
+      targets = scan.inspect(b, 1, 101, args)
+    self.assertEqual([c[0][0] for c in sleep.call_args_list],
+                     [0.05, 0.1, 0.2])
+    self.assertEqual([(t.position, t.rank) for t in targets.pending()],
+                     [(4, 1234)])
+
+
+class ScanSystemsTest(unittest.TestCase):
+
+  def test_closes_index_on_errors(self):
+    args = scan.build_arg_parser().parse_args([
+        '-c=test', '-u=a@b.c', '-p=pwd', '--rank_min=1000',
+        '--rank_max=2000', '--parallelism=1', '--max_scans=1',
+        '--index=index.db'])
+    with mock.patch.object(galaxy_index, 'GalaxyIndex') as index, \
+         mock.patch.object(scan, '_scan_systems', side_effect=IOError('disk')):
+      with self.assertRaises(IOError):
+        scan.scan_systems(FakeBrowser(), 1, [101], args, budget=None,
+                          scheduler=None)
+    index.return_value.close.assert_called_once_with()
+
+
+class LoadUniverseTest(unittest.TestCase):
+
+  def test_scans_without_files_that_could_not_be_downloaded(self):
+    cache_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(cache_dir.cleanup)
+    args = scan.build_arg_parser().parse_args([
+        '-c=test', '-u=a@b.c', '-p=pwd', '--rank_min=1000',
+        '--rank_max=2000', '--parallelism=1', '--max_scans=1',
+        '--universe_data=' + cache_dir.name])
+    with mock.patch.object(universe_data, 'refresh',
+                           side_effect=IOError('down')):
+      self.assertIsNone(scan.load_universe(FakeBrowser(), args))
+    self.assertEqual(args.num_galaxies, 7)
+    self.assertEqual(scan.prefilter_systems(None, 1, [1, 2], args), [1, 2])
+
+  def test_scans_without_corrupt_files(self):
+    cache_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(cache_dir.cleanup)
+    testdata = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'testdata')
+    for name in universe_data.FILES:
+      shutil.copy(os.path.join(testdata, name), cache_dir.name)
+    with open(os.path.join(cache_dir.name, 'universe.xml'), 'r+') as f:
+      f.truncate(100)
+    args = scan.build_arg_parser().parse_args([
+        '-c=test', '-u=a@b.c', '-p=pwd', '--rank_min=1000',
+        '--rank_max=2000', '--parallelism=1', '--max_scans=1',
+        '--universe_data=' + cache_dir.name])
+    with mock.patch.object(universe_data, 'refresh', return_value=0):
+      self.assertIsNone(scan.load_universe(FakeBrowser(), args))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,59 +1,206 @@
 """Util functions for selenium."""
+import collections
+import os
+import threading
 import time
 
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.common.exceptions import WebDriverException
 from selenium.common.exceptions import ElementNotVisibleException
+from selenium.common.exceptions import StaleElementReferenceException
 from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.support.wait import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 
+import metrics
 
+# Tracks pending XHR/fetch requests and the time of the last DOM mutation or
+# marked action, so that completion can be detected without fixed waits.
+_ACTIVITY_HOOK_JS = """
+var state = window.__bogame;
+if (!state) {
+  state = window.__bogame = {pending: 0, last: Date.now()};
+  var done = function() {
+    state.pending--;
+    state.last = Date.now();
+  };
+  var send = XMLHttpRequest.prototype.send;
+  XMLHttpRequest.prototype.send = function() {
+    state.pending++;
+    this.addEventListener('loadend', done);
+    return send.apply(this, arguments);
+  };
+  if (window.fetch) {
+    var fetch = window.fetch;
+    window.fetch = function() {
+      state.pending++;
+      var p = fetch.apply(this, arguments);
+      p.then(done, done);
+      return p;
+    };
+  }
+  new MutationObserver(function() { state.last = Date.now(); }).observe(
+      document, {childList: true, subtree: true, attributes: true,
+                 characterData: true});
+}
+state.last = Date.now();
+"""
+
+# Calls back once requests are done and the DOM has been quiet for a while.
+_WAIT_FOR_IDLE_JS = """
+var quiet = arguments[0], timeout = arguments[1];
+var callback = arguments[arguments.length - 1];
+var start = Date.now();
+(function check() {
+  var state = window.__bogame;
+  var active = window.jQuery ? window.jQuery.active : 0;
+  if (document.readyState == 'complete' && (!state || (
+      state.pending <= 0 && !active && Date.now() - state.last >= quiet))) {
+    callback(true);
+  } else if (Date.now() - start >= timeout) {
+    callback(false);
+  } else {
+    setTimeout(check, 20);
+  }
+})();
+"""
+
+
+class AdaptiveTimeouts(object):
+  """Learn how long locators take to show up, to bound optional waits.
+
+  Waits that may legitimately find nothing (`timeout_ok=True`) otherwise always
+  pay their full timeout. Once a locator has been seen enough times, they wait
+  `factor` times its slowest recent latency instead, never less than
+  `min_timeout` nor more than the timeout asked for.
+  """
+
+  def __init__(self, min_samples=5, window=20, factor=3, min_timeout=0.2):
+    self.min_samples = min_samples
+    self.factor = factor
+    self.min_timeout = min_timeout
+    self.window = window
+    self.latencies = collections.defaultdict(
+        lambda: collections.deque(maxlen=window))
+    self.lock = threading.Lock()
+
+  def record(self, by, element, seconds):
+    with self.lock:
+      self.latencies[(by, element)].append(seconds)
+
+  def timeout(self, by, element, timeout):
+    with self.lock:
+      latencies = self.latencies.get((by, element))
+      if not latencies or len(latencies) < self.min_samples:
+        return timeout
+      return min(timeout, max(self.min_timeout,
+                              self.factor * max(latencies)))
+
+
+timeouts = AdaptiveTimeouts()
+
+
+def retry(fn, exceptions=(WebDriverException,), tries=4, backoff=0.05,
+          fatal=()):
+  """Call `fn` until it does not raise, sleeping 1x, 2x, 4x... `backoff`.
+
+  Exceptions in `fatal` are raised right away, even if in `exceptions`.
+  """
+  for i in range(tries):
+    try:
+      return fn()
+    except fatal:
+      raise
+    except exceptions:
+      if i == tries - 1:
+        raise
+      time.sleep(backoff * 2 ** i)
+
+
+@metrics.instrumented
 def hover(b, element):
   """Hover over an element."""
   hover = ActionChains(b).move_to_element(element)
   hover.perform()
 
 
-def click(b, element):
-  """Click an element."""
-  try:
-    element.click()
-  except WebDriverException:
-    time.sleep(1)
-    # Try closing tooltips.
-    for close_button in b.find_elements_by_class_name('close-tooltip'):
-      try:
-        close_button.click()
-      except ElementNotVisibleException:
-        pass
-    time.sleep(1)
+@metrics.instrumented
+def click(b, element, tries=4):
+  """Click an element.
+
+  Args:
+    b: Browser.
+    element: Element, or (by, locator) to find it again if it goes stale.
+    tries: Num tries. Tooltips that may be in the way are closed in between,
+      with a growing backoff.
+
+  Raises:
+    TimeoutException: if the element of a (by, locator) does not show up, as
+      with `find`, which already waited for it.
+  """
+
+  def do_click():
+    e = find(b, *element) if isinstance(element, tuple) else element
     try:
-      element.click()
+      e.click()
+    except StaleElementReferenceException:
+      raise
     except WebDriverException:
-      pass  # give up
+      # Try closing tooltips.
+      for close_button in b.find_elements_by_class_name('close-tooltip'):
+        try:
+          close_button.click()
+        except ElementNotVisibleException:
+          pass
+      raise
+
+  try:
+    retry(do_click, tries=tries, fatal=(TimeoutException,))
+  except TimeoutException:
+    raise
+  except WebDriverException:
+    pass  # give up
 
 
+@metrics.instrumented
 def find(b, by, element, timeout=10):
   """Wait for element to be present and return it."""
-  return WebDriverWait(b, timeout).until(
+  start = time.time()
+  result = WebDriverWait(b, timeout).until(
       EC.presence_of_element_located((by, element)))
+  timeouts.record(by, element, time.time() - start)
+  return result
 
 
+@metrics.instrumented
 def finds(b, by, element, timeout=10, timeout_ok=False):
-  """Wait for elements to be present and return them."""
+  """Wait for elements to be present and return them.
+
+  With `timeout_ok`, the wait is bounded by what was learned of the locator.
+  """
+  if timeout_ok:
+    timeout = timeouts.timeout(by, element, timeout)
+  start = time.time()
   try:
-    return WebDriverWait(b, timeout).until(
+    result = WebDriverWait(b, timeout).until(
         EC.presence_of_all_elements_located((by, element)))
   except TimeoutException:
     if timeout_ok:
       return []
     else:
       raise
+  timeouts.record(by, element, time.time() - start)
+  return result
 
 
+@metrics.instrumented
 def wait_until(b, by, element, timeout=10, timeout_ok=False):
-  """Wait for element to be present."""
+  """Wait for element to be present.
+
+  With `timeout_ok`, the wait is bounded by what was learned of the locator.
+  """
+  if timeout_ok:
+    timeout = timeouts.timeout(by, element, timeout)
   try:
     find(b, by, element, timeout)
   except TimeoutException:
@@ -61,6 +208,7 @@ def wait_until(b, by, element, timeout=10, timeout_ok=False):
       raise
 
 
+@metrics.instrumented
 def wait_until_not(b, by, element, timeout=10, timeout_ok=False):
   """Wait for element to be present."""
   try:
@@ -69,3 +217,87 @@ def wait_until_not(b, by, element, timeout=10, timeout_ok=False):
   except TimeoutException:
     if not timeout_ok:
       raise
+
+
+@metrics.instrumented
+def wait_for(b, condition, timeout=10, poll=0.05):
+  """Wait until `condition(b)` is truthy and return it."""
+  return WebDriverWait(b, timeout, poll_frequency=poll).until(condition)
+
+
+def mark_activity(b):
+  """Hook into the page to detect completion of what is done next.
+
+  Call before an action (e.g. a click), then `wait_for_idle`.
+  """
+  b.execute_script(_ACTIVITY_HOOK_JS)
+
+
+@metrics.instrumented
+def wait_for_idle(b, timeout=10, quiet=0.1):
+  """Wait for requests and DOM changes since `mark_activity` to settle.
+
+  Returns:
+    Whether the page settled before `timeout` seconds.
+  """
+  return execute_async(b, _WAIT_FOR_IDLE_JS, int(quiet * 1000),
+                       int(timeout * 1000), timeout=timeout + 1)
+
+
+@metrics.instrumented
+def execute_async(b, script, *args, timeout=10):
+  """Run an async script and return what it calls back with."""
+  # The script timeout is a session setting, only set it when it grows.
+  if getattr(b, '_bogame_script_timeout', 0) < timeout:
+    b.set_script_timeout(timeout)
+    b._bogame_script_timeout = timeout
+  return b.execute_async_script(script, *args)
+
+
+def browser_memory_mb(b):
+  """Return the memory used by a browser, in MB.
+
+  Returns:
+    Dict with the resident memory of all processes of the browser (Linux
+    only, else None), and the JS heap of the current page.
+  """
+  rss = None
+  if os.path.isdir('/proc'):
+    pids = {b.service.process.pid}
+    children = _child_pids()
+    stack = list(pids)
+    while stack:
+      for child in children.get(stack.pop(), []):
+        pids.add(child)
+        stack.append(child)
+    rss = sum(_rss_mb(pid) for pid in pids)
+  heap = b.execute_script(
+      'return performance.memory ? performance.memory.usedJSHeapSize : null;')
+  return collections.OrderedDict([
+      ('rss_mb', rss),
+      ('js_heap_mb', heap / 2.**20 if heap else None),
+  ])
+
+
+def _child_pids():
+  """Return a dict of pid -> child pids of all processes."""
+  children = collections.defaultdict(list)
+  for name in os.listdir('/proc'):
+    if not name.isdigit():
+      continue
+    try:
+      with open('/proc/{}/stat'.format(name)) as f:
+        # The command in parens may contain spaces: split after it.
+        ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+    except (IOError, IndexError, ValueError):
+      continue
+    children[ppid].append(int(name))
+  return children
+
+
+def _rss_mb(pid):
+  try:
+    with open('/proc/{}/statm'.format(pid)) as f:
+      return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2.**20
+  except (IOError, IndexError, ValueError):
+    return 0
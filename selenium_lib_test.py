@@ -0,0 +1,32 @@
+"""Tests of selenium_lib.py, with stand-ins for the browser."""
+import unittest
+from unittest import mock
+
+from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.common.by import By
+
+import selenium_lib as sln
+
+
+class ClickTest(unittest.TestCase):
+
+  def test_retries_failed_clicks(self):
+    b = mock.Mock()
+    b.find_elements_by_class_name.return_value = []
+    element = mock.Mock()
+    element.click.side_effect = [WebDriverException('in the way'), None]
+    with mock.patch.object(sln, 'find', return_value=element):
+      sln.click(b, (By.ID, 'button'))
+    self.assertEqual(element.click.call_count, 2)
+
+  def test_does_not_retry_missing_elements(self):
+    with mock.patch.object(sln, 'find',
+                           side_effect=TimeoutException()) as find:
+      with self.assertRaises(TimeoutException):
+        sln.click(mock.Mock(), (By.ID, 'button'))
+    self.assertEqual(find.call_count, 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
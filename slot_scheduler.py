@@ -0,0 +1,124 @@
+"""Schedule probes according to when fleet slots free up."""
+import heapq
+import logging
+import time
+
+import html_lib
+import http_lib
+
+# Mission type of espionage.
+ESPIONAGE = '6'
+
+
+def parse_probe_returns(html):
+  """Return sorted arrival times of probes flying back, from the event list."""
+  doc = html_lib.parse(html) if isinstance(html, str) else html
+  returns = []
+  for event in doc.find_all('tr', class_='eventFleet'):
+    if (event.get('data-mission-type') == ESPIONAGE and
+        event.get('data-return-flight') == 'true'):
+      try:
+        returns.append(float(event.get('data-arrival-time')))
+      except (TypeError, ValueError):
+        pass
+  return sorted(returns)
+
+
+def count_fleets_in_flight(html):
+  """Return the num fleets of the account in flight, from the event list.
+
+  Each fleet has a return event until it is back, whatever its mission.
+  """
+  doc = html_lib.parse(html) if isinstance(html, str) else html
+  return sum(1 for event in doc.find_all('tr', class_='eventFleet')
+             if event.get('data-return-flight') == 'true')
+
+
+class SlotScheduler(object):
+  """Track probes in flight to know when the next fleet slot frees up.
+
+  Return times come from the fleet movements of the event list when an HTTP
+  session is given. Otherwise they are estimated from send times and a round
+  trip duration learned from the number of missions seen on the galaxy page.
+  """
+
+  def __init__(self, round_trip=60, session=None, url=None, min_wait=0.5):
+    self.round_trip = float(round_trip)
+    self.session = session
+    self.url = url
+    self.min_wait = min_wait
+    self.in_flight = []  # heap of (expected return time, send time)
+    self.num_recorded = 0  # num send times of `record` seen so far
+
+  def sent(self, num=1, now=None):
+    """Record `num` probes sent."""
+    now = time.time() if now is None else now
+    for _ in range(num):
+      heapq.heappush(self.in_flight, (now + self.round_trip, now))
+
+  def record(self, send_times, until=None):
+    """Record probes sent at `send_times` up to `until`, if not yet recorded.
+
+    Args:
+      send_times: Growing list of the times probes were sent, e.g. shared with
+        other schedulers, so that missions of all of them are in flight.
+      until: If present, later times are left to the next call, e.g. for
+        probes not yet counted on the page.
+    """
+    for sent_at in send_times[self.num_recorded:]:
+      if until is not None and sent_at > until:
+        break
+      heapq.heappush(self.in_flight, (sent_at + self.round_trip, sent_at))
+      self.num_recorded += 1
+
+  def observe(self, num_ongoing, now=None):
+    """Reconcile with the num ongoing missions seen on the page.
+
+    Probes that are no longer in flight are forgotten, and their round trip is
+    used to refine the estimate.
+    """
+    now = time.time() if now is None else now
+    while len(self.in_flight) > max(num_ongoing, 0):
+      _, sent_at = heapq.heappop(self.in_flight)
+      self.round_trip = 0.7 * self.round_trip + 0.3 * (now - sent_at)
+      logging.info('Probe is back; round trip is now estimated to {:.0f}s'
+                   .format(self.round_trip))
+
+  def refresh(self):
+    """Read return times from the event list, if an HTTP session is set.
+
+    Returns:
+      Whether the return times could be read.
+    """
+    if self.session is None:
+      return False
+    try:
+      returns = parse_probe_returns(
+          http_lib.get_page(self.session, self.url, 'eventList'))
+    except Exception as e:
+      logging.warn('Could not read event list: {}'.format(e))
+      return False
+    # Events also include probes sent by other programs, which use slots too.
+    self.in_flight = [(t, t - self.round_trip) for t in returns]
+    heapq.heapify(self.in_flight)
+    return True
+
+  def next_free_at(self):
+    """Return when the next slot frees up, or None if nothing is in flight."""
+    return self.in_flight[0][0] if self.in_flight else None
+
+  def wait_for_slot(self, now=None):
+    """Sleep until the next slot frees up and return the time slept."""
+    self.refresh()
+    now = time.time() if now is None else now
+    next_free_at = self.next_free_at()
+    if next_free_at is None:
+      wait = self.round_trip / 4
+    elif next_free_at <= now:
+      # Overdue: the estimate was too short, check again a bit later.
+      wait = max(self.round_trip / 10, self.min_wait)
+    else:
+      wait = min(max(next_free_at - now, self.min_wait), self.round_trip)
+    logging.info('Waiting {:.1f}s for a slot to free up...'.format(wait))
+    time.sleep(wait)
+    return wait
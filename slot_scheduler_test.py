@@ -0,0 +1,37 @@
+"""Tests of slot_scheduler.py."""
+import unittest
+
+import scan
+import slot_scheduler
+
+
+class SlotSchedulerTest(unittest.TestCase):
+
+  def test_shards_track_probes_of_all_shards(self):
+    budget = scan.ScanBudget(max_scans=10, parallelism=5)
+    with budget.lock:
+      budget.add_sent(2)
+    self.assertEqual(len(budget.send_times), 2)
+    # Probes sent at 100 and 102 by a shard, at 101 and 103 by another one.
+    send_times = [100, 101, 102, 103]
+
+    # The page counted 2 missions at 102.5: the first probe is back.
+    for _ in range(2):
+      scheduler = slot_scheduler.SlotScheduler(round_trip=60)
+      scheduler.record(send_times, until=102.5)
+      scheduler.observe(2, now=130)
+      self.assertEqual(sorted(t for _, t in scheduler.in_flight), [101, 102])
+      scheduler.record(send_times)
+      self.assertEqual(sorted(t for _, t in scheduler.in_flight),
+                       [101, 102, 103])
+
+  def test_round_trip_is_learned_from_probes_back(self):
+    scheduler = slot_scheduler.SlotScheduler(round_trip=60)
+    scheduler.record([0, 10])
+    scheduler.observe(1, now=40)
+    self.assertEqual(scheduler.round_trip, 0.7 * 60 + 0.3 * 40)
+    self.assertEqual(scheduler.next_free_at(), 70)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,197 @@
+"""Index of the universe from the game's public XML data files.
+
+The game publishes the players and their status, their ranks, the coords of all
+planets, and the settings of the universe under /api/ of the game server.
+Files are downloaded to a cache directory and read again once stale:
+
+  python3 universe_data.py \\
+    --api_url=https://s<num>-<country>.ogame.gameforge.com/api \\
+    --cache_dir=<dir>
+"""
+import argparse
+import collections
+import logging
+import os
+import time
+from urllib import parse
+from xml.etree import ElementTree
+
+import requests
+
+import common
+from report_parser import Coords
+
+# File name in the cache directory -> path under the API URL. Category 1 type 0
+# of the highscore is the total points.
+FILES = collections.OrderedDict([
+    ('players.xml', 'players.xml'),
+    ('highscore.xml', 'highscore.xml?category=1&type=0'),
+    ('universe.xml', 'universe.xml'),
+    ('serverData.xml', 'serverData.xml'),
+])
+
+# Player status letters of players.xml.
+VACATION = 'v'
+BANNED = 'b'
+INACTIVE = 'i'
+LONG_INACTIVE = 'I'
+ADMIN = 'a'
+
+Player = collections.namedtuple('Player', ['player_id', 'name', 'status',
+                                           'rank'])
+
+ServerData = collections.namedtuple(
+    'ServerData', ['num_galaxies', 'num_systems', 'fleet_speed'])
+
+
+def api_url(game_url):
+  """Return the URL of the data files of the game at `game_url`."""
+  return parse.urljoin(game_url, '/api/')
+
+
+def refresh(cache_dir, url, max_age=86400, now=None):
+  """Download the data files older than `max_age` seconds to `cache_dir`.
+
+  Returns:
+    Num files downloaded.
+  """
+  now = time.time() if now is None else now
+  if not os.path.isdir(cache_dir):
+    os.makedirs(cache_dir)
+  num_downloaded = 0
+  for name, path in FILES.items():
+    local = os.path.join(cache_dir, name)
+    if os.path.exists(local) and now - os.path.getmtime(local) < max_age:
+      continue
+    response = requests.get(parse.urljoin(url.rstrip('/') + '/', path),
+                            timeout=60)
+    response.raise_for_status()
+    tmp = '{}.{}.tmp'.format(local, os.getpid())
+    with open(tmp, 'wb') as f:
+      f.write(response.content)
+    os.replace(tmp, local)
+    logging.info('Downloaded {} ({}KB)'.format(
+        name, len(response.content) // 1024))
+    num_downloaded += 1
+  return num_downloaded
+
+
+class UniverseIndex(object):
+  """Players with their status and rank, and the planets of each system."""
+
+  def __init__(self, players, planets, server_data):
+    """Constructor.
+
+    Args:
+      players: Dict of player ID -> `Player`.
+      planets: Dict of `Coords` -> player ID.
+      server_data: `ServerData`.
+    """
+    self.players = players
+    self.server_data = server_data
+    self.planets_by_player = collections.defaultdict(list)
+    self.systems = collections.defaultdict(list)  # (g, s) -> [(pos, id)]
+    for coords, player_id in sorted(planets.items()):
+      self.planets_by_player[player_id].append(coords)
+      self.systems[coords.galaxy, coords.system].append(
+          (coords.position, player_id))
+
+  def player_at(self, coords):
+    """Return the `Player` owning the planet at `coords`, or None."""
+    for position, player_id in self.systems.get(tuple(coords[:2]), []):
+      if position == coords[2]:
+        return self.players.get(player_id)
+    return None
+
+  def is_target(self, player, args):
+    """Whether a player may pass the rank and class filters of scan args.
+
+    Noob protection and honor are not in the data files, so players that are
+    neither inactive nor in vacation pass if any of those filters is on.
+    """
+    if player.rank is None or not args.rank_min <= player.rank <= args.rank_max:
+      return False
+    if any(s in player.status for s in (VACATION, BANNED, ADMIN)):
+      return False
+    if INACTIVE in player.status or LONG_INACTIVE in player.status:
+      return args.include_inactive
+    return (args.include_normal or args.include_honorable or
+            args.include_strong)
+
+  def systems_with_targets(self, galaxy, args):
+    """Return the set of systems of `galaxy` with a planet of a target."""
+    systems = set()
+    for (g, system), planets in self.systems.items():
+      if g == galaxy and any(
+          self.is_target(self.players[player_id], args)
+          for _, player_id in planets if player_id in self.players):
+        systems.add(system)
+    return systems
+
+
+def parse_players(players_xml, highscore_xml):
+  """Return a dict of player ID -> `Player` from players and highscore."""
+  ranks = {e.get('id'): int(e.get('position'))
+           for e in ElementTree.fromstring(highscore_xml).iter('player')}
+  return {e.get('id'): Player(e.get('id'), e.get('name'),
+                              e.get('status', ''), ranks.get(e.get('id')))
+          for e in ElementTree.fromstring(players_xml).iter('player')}
+
+
+def parse_planets(universe_xml):
+  """Return a dict of `Coords` -> player ID from the universe file."""
+  planets = {}
+  for e in ElementTree.fromstring(universe_xml).iter('planet'):
+    coords = Coords(*map(int, e.get('coords').split(':')))
+    planets[coords] = e.get('player')
+  return planets
+
+
+def parse_server_data(server_data_xml):
+  """Return the `ServerData` of the server data file."""
+  root = ElementTree.fromstring(server_data_xml)
+
+  def number(tag, default):
+    e = root.find(tag)
+    return int(float(e.text)) if e is not None and e.text else default
+
+  # Newer universes have distinct fleet speeds, of which raids use the war one.
+  return ServerData(
+      num_galaxies=number('galaxies', 7), num_systems=number('systems', 499),
+      fleet_speed=number('speedFleetWar', number('speedFleet', 1)))
+
+
+def load(cache_dir):
+  """Return the `UniverseIndex` of the data files in `cache_dir`."""
+
+  def read(name):
+    with open(os.path.join(cache_dir, name), 'rb') as f:
+      return f.read()
+
+  players = parse_players(read('players.xml'), read('highscore.xml'))
+  planets = parse_planets(read('universe.xml'))
+  server_data = parse_server_data(read('serverData.xml'))
+  logging.info('Loaded {} players and {} planets from {} ({})'.format(
+      len(players), len(planets), cache_dir, server_data))
+  return UniverseIndex(players, planets, server_data)
+
+
+def main():
+  arg_parser = argparse.ArgumentParser(
+      description='Download the data files of a universe.')
+  arg_parser.add_argument('--api_url', type=str, required=True,
+                          help='URL of the data files, ending with /api')
+  arg_parser.add_argument('--cache_dir', type=str, required=True)
+  arg_parser.add_argument('--max_age', type=float, default=24,
+                          help='Hours after which files are downloaded again')
+  arg_parser.add_argument('-v', '--verbose', type=bool,
+                          default=False, help='Verbose output')
+  args = arg_parser.parse_args()
+
+  common.setup_logging(args)
+  refresh(args.cache_dir, args.api_url, args.max_age * 3600)
+  load(args.cache_dir)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,109 @@
+"""Tests of universe_data.py on saved data files."""
+import argparse
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import universe_data
+from report_parser import Coords
+
+_TESTDATA = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'testdata')
+
+
+def _args(**kwargs):
+  args = dict(rank_min=1000, rank_max=2000, include_inactive=True,
+              include_normal=False, include_honorable=False,
+              include_strong=False)
+  args.update(kwargs)
+  return argparse.Namespace(**args)
+
+
+class LoadTest(unittest.TestCase):
+
+  def setUp(self):
+    self.universe = universe_data.load(_TESTDATA)
+
+  def test_players(self):
+    players = self.universe.players
+    self.assertEqual(len(players), 7)
+    self.assertEqual(players['100005'],
+                     universe_data.Player('100005', 'Alice', 'i', 1234))
+    self.assertEqual(players['100006'],
+                     universe_data.Player('100006', 'Bob', '', 1500))
+    self.assertEqual(players['100007'].status, 'vI')
+    # Not in the highscore.
+    self.assertIsNone(players['100011'].rank)
+
+  def test_planets(self):
+    self.assertEqual(self.universe.planets_by_player['100005'],
+                     [Coords(1, 101, 4), Coords(2, 7, 8)])
+    self.assertEqual(self.universe.player_at(Coords(1, 101, 7)).name, 'Bob')
+    self.assertIsNone(self.universe.player_at(Coords(1, 101, 5)))
+
+  def test_server_data(self):
+    # Raids use the war fleet speed.
+    self.assertEqual(self.universe.server_data,
+                     universe_data.ServerData(5, 499, 3))
+
+  def test_server_data_of_older_universes(self):
+    self.assertEqual(
+        universe_data.parse_server_data(
+            '<serverData><speedFleet>2</speedFleet></serverData>'),
+        universe_data.ServerData(7, 499, 2))
+
+  def test_is_target(self):
+    players = self.universe.players
+    args = _args()
+    self.assertEqual(
+        sorted(p.name for p in players.values()
+               if self.universe.is_target(p, args)),
+        ['Alice', 'Dave'])
+    # Bob is active, Carol in vacation, Eve an admin, Frank out of rank
+    # bounds, Grace banned and without rank.
+    self.assertTrue(self.universe.is_target(
+        players['100006'], _args(include_normal=True)))
+    self.assertFalse(self.universe.is_target(
+        players['100005'], _args(include_inactive=False)))
+
+  def test_systems_with_targets(self):
+    self.assertEqual(self.universe.systems_with_targets(1, _args()),
+                     {101, 230})
+    self.assertEqual(self.universe.systems_with_targets(2, _args()), {7})
+    self.assertEqual(
+        self.universe.systems_with_targets(1, _args(rank_min=1, rank_max=20)),
+        {400})
+
+
+class RefreshTest(unittest.TestCase):
+
+  def setUp(self):
+    tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(tmp.cleanup)
+    self.cache_dir = os.path.join(tmp.name, 'univ')
+
+  def fake_get(self, url, timeout):
+    name = os.path.basename(url).split('?')[0]
+    with open(os.path.join(_TESTDATA, name), 'rb') as f:
+      return mock.Mock(content=f.read())
+
+  def test_downloads_stale_files_only(self):
+    with mock.patch.object(universe_data.requests, 'get',
+                           side_effect=self.fake_get) as get:
+      self.assertEqual(universe_data.refresh(
+          self.cache_dir, 'https://s101-en.test/api'), 4)
+      self.assertIn(mock.call('https://s101-en.test/api/highscore.xml'
+                              '?category=1&type=0', timeout=60),
+                    get.call_args_list)
+      self.assertEqual(universe_data.refresh(
+          self.cache_dir, 'https://s101-en.test/api'), 0)
+      self.assertEqual(universe_data.refresh(
+          self.cache_dir, 'https://s101-en.test/api', max_age=0), 4)
+    self.assertEqual(sorted(os.listdir(self.cache_dir)),
+                     sorted(universe_data.FILES))
+    self.assertEqual(len(universe_data.load(self.cache_dir).players), 7)
+
+
+if __name__ == '__main__':
+  unittest.main()